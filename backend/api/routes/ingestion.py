@@ -1,14 +1,32 @@
-from fastapi import APIRouter, Depends, UploadFile, File
-from typing import List
-import uuid
+import os
+import shutil
+import tempfile
+
+from fastapi import APIRouter, Depends, Form, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+from backend.config import settings
 from backend.models.database import DatabaseConnection
 from backend.services.schema_discovery import SchemaDiscovery
-from backend.services.document_processor import DocumentProcessor
+from backend.services.table_ingestion import MODES, ingest_table_files, is_table_file
 
 router = APIRouter()
 
-# Simple in-memory store for job status
-job_status_store = {}
+def load_tables(request: Request, files: List[UploadFile], mode: str, key_columns: list, table: str = None) -> dict:
+    """Spools table uploads to disk and loads them into the default database."""
+    os.makedirs(settings.INGESTION_SPOOL_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=settings.INGESTION_SPOOL_DIR) as workdir:
+        spooled = []
+        for index, file in enumerate(files):
+            path = os.path.join(workdir, f"{index}.upload")
+            with open(path, 'wb') as out:
+                shutil.copyfileobj(file.file, out)
+            spooled.append((path, file.filename, table))
+        report = ingest_table_files(settings.DATABASE_URL, spooled, mode=mode, key_columns=key_columns)
+    # New tables show up in the schema right away, and answers computed from the old rows are dropped
+    SchemaDiscovery().invalidate(settings.DATABASE_URL)
+    request.app.state.engine_registry.get(settings.DATABASE_URL).invalidate_answers()
+    return report
 
 @router.post("/api/ingest/database")
 def ingest_database(db_connection: DatabaseConnection):
@@ -17,29 +35,48 @@ def ingest_database(db_connection: DatabaseConnection):
     return schema
 
 @router.post("/api/ingest/documents")
-async def ingest_documents(files: List[UploadFile] = File(...)):
-    job_id = str(uuid.uuid4())
-    job_status_store[job_id] = {"status": "processing", "total_files": len(files), "processed_files": 0}
-
-    doc_processor = DocumentProcessor()
-    
-    file_contents = []
-    filenames = []
-    for file in files:
-        contents = await file.read()
-        file_contents.append(contents)
-        filenames.append(file.filename)
-
-    doc_processor.process_documents(file_contents, filenames)
-
-    job_status_store[job_id]["status"] = "completed"
-    job_status_store[job_id]["processed_files"] = len(files)
+async def ingest_documents(request: Request, files: List[UploadFile] = File(...)):
+    # Tables (CSV/TSV) are loaded into the SQL database instead of being embedded row by row.
+    # They only ever create new tables: an upload never overwrites a table of the live database
+    tables = [file for file in files if is_table_file(file.filename)]
+    documents = [file for file in files if not is_table_file(file.filename)]
+    if documents and request.app.state.ingestion_jobs is None:
+        return {"error": "Document ingestion is disabled on this deployment (EMBEDDINGS_ENABLED=false)"}
+    response = {"job_id": None, "message": f"{len(documents)} documents are being processed."}
+    if tables:
+        response["tables"] = await run_in_threadpool(load_tables, request, tables, "create", [])
+    if documents:
+        # Only spooling happens here; parsing and embedding run in the background job system
+        uploads = [(file.filename, file.file) for file in documents]
+        response["job_id"] = await run_in_threadpool(request.app.state.ingestion_jobs.submit, uploads)
+    return response
 
-    return {"job_id": job_id, "message": f"{len(files)} documents are being processed."}
+@router.post("/api/ingest/tables")
+async def ingest_tables(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    mode: str = Form("create"),
+    key_columns: str = Form(""),
+    table: Optional[str] = Form(None),
+):
+    """
+    Loads CSV/TSV files into tables of the default database, one table per file
+    (named after the file unless table is given). mode is create (the default:
+    a new table, an existing one is refused), replace, append or upsert; upsert
+    needs key_columns (comma-separated). Several files for one table are loaded
+    in turn, the first one creating or replacing it. Reports rows/sec per file.
+    """
+    if mode not in MODES:
+        return {"error": f"Unknown mode '{mode}', expected one of {', '.join(MODES)}"}
+    keys = [name.strip() for name in key_columns.split(",") if name.strip()]
+    if mode == "upsert" and not keys:
+        return {"error": "Upsert needs key_columns"}
+    return await run_in_threadpool(load_tables, request, files, mode, keys, table)
 
 @router.get("/api/ingest/status/{job_id}")
-def ingest_status(job_id: str):
-    status = job_status_store.get(job_id)
+def ingest_status(job_id: str, request: Request):
+    jobs = request.app.state.ingestion_jobs
+    status = jobs.status(job_id) if jobs is not None else None
     if not status:
         return {"error": "Job not found"}
     return status
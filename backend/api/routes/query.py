@@ -1,20 +1,119 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from backend.services.query_engine import QueryEngine
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from backend.config import settings
+from backend.services.metrics import collect_timings
+from backend.services.query_history import get_query_history
+
+class AnswerOptions(BaseModel):
+    # "rows" (list of dicts) or "columnar" (column names once, rows as arrays)
+    format: str = "rows"
+    # Document retrieval: number of matches, and filters on the source file and ingestion time
+    k: Optional[int] = Field(default=None, ge=1, le=50)
+    sources: Optional[List[str]] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+    def document_options(self) -> dict:
+        options = {"k": self.k, "sources": self.sources}
+        for name in ("since", "until"):
+            value = getattr(self, name)
+            options[name] = value.timestamp() if value is not None else None
+        return {key: value for key, value in options.items() if value}
 
-class Query(BaseModel):
+class Query(AnswerOptions):
     query: str
+    # Adds a per-stage breakdown in milliseconds to the response
+    timings: bool = False
+
+class BatchQuery(AnswerOptions):
+    queries: List[str] = Field(min_length=1)
+
+class ResultPage(BaseModel):
+    token: str
+    format: str = "rows"
 
 router = APIRouter()
 
 @router.post("/api/query")
-def query(query: Query):
-    query_engine = QueryEngine(settings.DATABASE_URL)
-    result = query_engine.process_query(query.query)
+async def query(query: Query, request: Request):
+    # Engines are long-lived and shared, see EngineRegistry
+    query_engine = await request.app.state.engine_registry.get_async(settings.DATABASE_URL)
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        result = await query_engine.process_query(
+            query.query, result_format=query.format, document_options=query.document_options()
+        )
+    if query.timings:
+        # Concurrent stages (hybrid answers) overlap, so they can add up to more than the total
+        result["timings"] = dict(timings, total=round((time.perf_counter() - started) * 1000, 3))
     return result
 
+@router.post("/api/query/batch")
+async def query_batch(batch: BatchQuery, request: Request):
+    """
+    Answers many questions in one request. The answers are streamed as NDJSON, one
+    line per question in the order given, with its index, a status ("ok" or "error")
+    and the fields of /api/query. Batches of more than BATCH_MAX_QUESTIONS questions
+    are refused with 413
+    """
+    if len(batch.queries) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {settings.BATCH_MAX_QUESTIONS} questions")
+    query_engine = await request.app.state.engine_registry.get_async(settings.DATABASE_URL)
+    lines = query_engine.iter_batch_lines(
+        batch.queries, result_format=batch.format, document_options=batch.document_options()
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@router.get("/api/query/suggestions")
+async def query_suggestions(query: str, request: Request):
+    """
+    Follow-up questions for a query answered by /api/query, generated in the background
+    """
+    query_engine = await request.app.state.engine_registry.get_async(settings.DATABASE_URL)
+    return {"suggestions": await query_engine.get_suggestions(query)}
+
+@router.post("/api/query/page")
+def query_page(page: ResultPage, request: Request):
+    """
+    Returns the next page of a truncated SQL result
+    """
+    query_engine = request.app.state.engine_registry.get(settings.DATABASE_URL)
+    return query_engine.fetch_result_page(page.token, result_format=page.format)
+
+@router.post("/api/query/rows")
+def query_rows(page: ResultPage, request: Request):
+    """
+    Streams the remaining rows of a truncated SQL result as NDJSON
+    """
+    query_engine = request.app.state.engine_registry.get(settings.DATABASE_URL)
+    try:
+        payload = query_engine.read_result_token(page.token)
+    except ValueError as e:
+        return {"error": str(e)}
+    return StreamingResponse(query_engine.iter_result_lines(payload), media_type="application/x-ndjson")
+
 @router.get("/api/query/history")
-def query_history():
-    # Placeholder for query history implementation
-    return {"message": "Query history endpoint"}
\ No newline at end of file
+def query_history(request: Request, limit: int = 50, before: Optional[int] = None):
+    """
+    Questions asked of the default database, newest first. The next page is requested
+    with before set to the next_before of the current one
+    """
+    limit = min(max(limit, 1), 500)
+    query_engine = request.app.state.engine_registry.get(settings.DATABASE_URL)
+    items = get_query_history().recent(query_engine.cache_scope, limit, before)
+    return {"items": items, "next_before": items[-1]["id"] if len(items) == limit else None}
+
+@router.get("/api/query/history/top")
+def query_history_top(request: Request, limit: int = 20, hours: float = 24.0):
+    """
+    The questions asked most often in the last hours, with their average latency
+    """
+    limit = min(max(limit, 1), 500)
+    query_engine = request.app.state.engine_registry.get(settings.DATABASE_URL)
+    since = time.time() - hours * 60 * 60
+    return {"items": get_query_history().top(query_engine.cache_scope, since, limit)}
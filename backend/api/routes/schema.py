@@ -1,4 +1,6 @@
+from typing import Optional
 from fastapi import APIRouter
+from backend.models.database import SchemaInvalidation
 from backend.services.schema_discovery import SchemaDiscovery
 from backend.config import settings
 
@@ -12,3 +14,14 @@ def get_schema():
     schema_discovery = SchemaDiscovery()
     schema = schema_discovery.analyze_database(settings.DATABASE_URL)
     return schema
+
+@router.post("/api/schema/invalidate")
+def invalidate_schema(invalidation: Optional[SchemaInvalidation] = None):
+    """
+    Drop the cached schema so the next request re-reflects the database. The
+    connection string is taken from the JSON body; without one every cached
+    schema is dropped.
+    """
+    schema_discovery = SchemaDiscovery()
+    invalidated = schema_discovery.invalidate(invalidation.connection_string if invalidation else None)
+    return {"invalidated": invalidated}
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from backend.services import db_engines, metrics
+from backend.services.embedding_service import get_embedding_service
+from backend.services.llm_client import get_llm_client
+from backend.services.sql_templates import get_sql_template_store
+
+router = APIRouter()
+
+@router.get("/api/ready")
+def readiness(request: Request):
+    """
+    Reports ready only once the shared models and the default query engine are warm
+    """
+    status = request.app.state.engine_registry.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@router.get("/api/stats/embedding")
+def embedding_stats():
+    """
+    Batch sizes, queue wait and query-cache hit rate of the shared embedding service
+    """
+    return get_embedding_service().stats()
+
+@router.get("/api/stats/pools")
+def pool_stats():
+    """
+    Connection pool usage per database (passwords are masked)
+    """
+    return db_engines.pool_stats()
+
+@router.get("/api/stats/llm")
+def llm_stats():
+    """
+    Call, retry, timeout and coalescing counters of the generation model client
+    """
+    return get_llm_client().stats()
+
+@router.get("/api/stats/templates")
+def template_stats():
+    """
+    Hit rate of the SQL template store and how many LLM calls it avoided
+    """
+    return get_sql_template_store().stats()
+
+@router.get("/api/stats/prewarm")
+def prewarm_stats(request: Request):
+    """
+    Rounds of cache pre-warming from the query history, and what the last one replayed
+    """
+    warmer = request.app.state.cache_warmer
+    return warmer.status() if warmer is not None else {"error": "Pre-warming is disabled (PREWARM_ENABLED=false)"}
+
+@router.get("/metrics")
+def prometheus_metrics():
+    """
+    Stage latencies, query, token, row and ingestion counters in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@router.get("/api/metrics")
+def metrics_summary():
+    """
+    JSON summary of the same metrics for the dashboard, with the model client stats
+    """
+    summary = metrics.summary()
+    llm = get_llm_client().stats()
+    embedding = get_embedding_service().stats()
+    summary["llm"] = {key: llm[key] for key in ("calls", "upstream_calls", "coalesced", "retries", "timeouts",
+                                                "latency_ms_p50", "latency_ms_p95")}
+    summary["embedding"] = {key: embedding[key] for key in ("avg_batch_size", "queue_wait_ms_p95",
+                                                            "query_cache_hit_rate")}
+    summary["templates"] = get_sql_template_store().stats()
+    return summary
@@ -0,0 +1,71 @@
+"""
+Measures parsing + chunking time and peak Python memory against document size.
+
+    python -m backend.benchmarks.bench_chunking --output chunking.json
+
+With the streaming pipeline, peak memory should stay roughly flat as files grow.
+Embedding is not included; see run_benchmarks for end-to-end ingestion numbers.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from backend.benchmarks.synthetic import write_pdf, write_txt
+from backend.services.document_processor import DocumentProcessor
+
+
+def measure(path: str, filename: str) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = 0
+    tokens = 0
+    for chunk in DocumentProcessor.iter_document_chunks(path, filename, raise_errors=True):
+        chunks += 1
+        tokens += len(chunk.split())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "file": filename,
+        "file_mb": round(os.path.getsize(path) / 1e6, 2),
+        "chunks": chunks,
+        "avg_tokens_per_chunk": round(tokens / chunks, 1) if chunks else 0,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(os.path.getsize(path) / 1e6 / elapsed, 2) if elapsed else None,
+        "peak_traced_mb": round(peak / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--txt-mb", type=float, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.txt_mb:
+            path = os.path.join(workdir, f"doc_{size}mb.txt")
+            write_txt(path, int(size * 1e6))
+            results.append(measure(path, os.path.basename(path)))
+            os.remove(path)
+        for pages in args.pdf_pages:
+            path = os.path.join(workdir, f"doc_{pages}p.pdf")
+            write_pdf(path, pages)
+            results.append(measure(path, os.path.basename(path)))
+            os.remove(path)
+
+    for row in results:
+        print(f"{row['file']:>16}  {row['file_mb']:>8} MB  {row['chunks']:>7} chunks  "
+              f"{row['seconds']:>8} s  peak {row['peak_traced_mb']:>7} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "chunking", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
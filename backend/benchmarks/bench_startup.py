@@ -0,0 +1,146 @@
+"""
+Checks the import time of the API and which heavy packages it loads.
+
+    python -m backend.benchmarks.bench_startup
+    python -m backend.benchmarks.bench_startup --budget-ms 800 --output startup.json
+    python -m backend.benchmarks.bench_startup --sql-only
+
+Imports backend.main in a fresh interpreter under `python -X importtime` and fails
+(exit status 1) if the import takes longer than --budget-ms or loads any of the
+packages that must stay behind their service boundaries (the embedding stack,
+the document parsers, pandas, the Google client). With --sql-only it also runs
+the application's startup with EMBEDDINGS_ENABLED=false until the warm-up has
+finished, and fails if the embedding stack or the document parsers were loaded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Loaded on first use only; none of them may be imported with the application
+LAZY_PACKAGES = (
+    "torch", "sentence_transformers", "chromadb", "google.generativeai", "google.api_core",
+    "pandas", "pypdf", "docx",
+)
+# Never loaded at all by a SQL-only deployment
+EMBEDDING_STACK = ("torch", "sentence_transformers", "chromadb", "pypdf", "docx")
+
+_STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+from backend.main import app
+
+async def main():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        while not app.state.engine_registry.status()["warmup_finished"] and time.perf_counter() - started < 120:
+            await asyncio.sleep(0.05)
+        status = app.state.engine_registry.status()
+    print(json.dumps({"status": status, "modules": sorted(sys.modules)}))
+
+asyncio.run(main())
+"""
+
+
+def _loaded(modules, packages) -> list:
+    return [package for package in packages
+            if any(module == package or module.startswith(package + ".") for module in modules)]
+
+
+def measure_import() -> dict:
+    """Cumulative import time of backend.main and its slowest direct and indirect imports."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing backend.main failed:\n{completed.stderr[-2000:]}")
+    timings = {}
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    slowest = sorted(
+        ((name, us) for name, us in timings.items() if "." not in name or name.startswith("backend.")),
+        key=lambda pair: -pair[1]
+    )[:15]
+    return {
+        "import_ms": round(timings["backend.main"] / 1000, 1),
+        "slowest_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "lazy_packages_loaded": _loaded(timings, LAZY_PACKAGES),
+    }
+
+
+def measure_sql_only_startup() -> dict:
+    """
+    Starts the application with EMBEDDINGS_ENABLED=false in a scratch directory,
+    against a small synthetic database unless DATABASE_URL is set.
+    """
+    from backend.benchmarks.synthetic import write_company_db
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            EMBEDDINGS_ENABLED="false",
+            PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])),
+            SEMANTIC_CACHE_PATH=os.path.join(workdir, "semantic_cache.db"),
+            SQL_TEMPLATE_PATH=os.path.join(workdir, "sql_templates.db"),
+            QUERY_HISTORY_PATH=os.path.join(workdir, "query_history.db"),
+        )
+        if "DATABASE_URL" not in os.environ:
+            write_company_db(os.path.join(workdir, "company.db"), 100)
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'company.db')}"
+        completed = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT], cwd=workdir, capture_output=True, text=True, env=env,
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"SQL-only startup failed:\n{completed.stderr[-2000:]}")
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {
+        "warmup": report["status"],
+        "embedding_stack_loaded": _loaded(report["modules"], EMBEDDING_STACK),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="allowed import time of backend.main")
+    parser.add_argument("--sql-only", action="store_true", help="also check a SQL-only startup")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = {"benchmark": "startup", "budget_ms": args.budget_ms, **measure_import()}
+    failures = []
+    if report["import_ms"] > args.budget_ms:
+        failures.append(f"import took {report['import_ms']} ms, over the {args.budget_ms:g} ms budget")
+    if report["lazy_packages_loaded"]:
+        failures.append(f"imported at startup: {', '.join(report['lazy_packages_loaded'])}")
+    if args.sql_only:
+        report["sql_only"] = measure_sql_only_startup()
+        if report["sql_only"]["embedding_stack_loaded"]:
+            failures.append(f"SQL-only startup loaded: {', '.join(report['sql_only']['embedding_stack_loaded'])}")
+    report["failures"] = failures
+
+    print(f"import backend.main: {report['import_ms']} ms (budget {args.budget_ms:g} ms)")
+    for name, ms in report["slowest_ms"].items():
+        print(f"  {ms:>9} ms  {name}")
+    if args.sql_only:
+        print(f"SQL-only startup: warm-up {'ok' if report['sql_only']['warmup']['ready'] else 'failed'}, "
+              f"embedding stack loaded: {report['sql_only']['embedding_stack_loaded'] or 'none'}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
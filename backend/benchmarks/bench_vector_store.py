@@ -0,0 +1,186 @@
+"""
+Compares the quantized vector store with Chroma on synthetic embeddings.
+
+    python -m backend.benchmarks.bench_vector_store
+    python -m backend.benchmarks.bench_vector_store --vectors 1000000 --backends int8 chroma --output vectors.json
+
+The vectors are unit-length, drawn around seeded cluster centres so that nearest
+neighbours are meaningful, and the queries are noisy copies of stored vectors.
+Every backend is loaded in one fresh process (insert rate, size on disk) and
+queried in another that only opens the store, so its peak RSS is what serving
+queries costs. Recall@k is measured against an exact float32 search.
+
+Backends: "int8" and "float16" are the quantized store with IVF partitions, the
+"-flat" variants scan every vector, "chroma" is a cosine HNSW collection.
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.benchmarks.run_benchmarks import percentiles
+
+BATCH = 5000
+CLUSTERS = 1000
+
+
+def vector_batch(seed: int, dim: int, start: int, end: int) -> np.ndarray:
+    """Vectors start..end of the seeded data set; any range can be generated on its own."""
+    centres = np.random.default_rng(seed).standard_normal((CLUSTERS, dim)).astype(np.float32)
+    rng = np.random.default_rng([seed, start])
+    vectors = centres[rng.integers(0, CLUSTERS, end - start)] + 0.6 * rng.standard_normal((end - start, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(args) -> np.ndarray:
+    # Seeded apart from every batch, whose seeds are their start offsets below args.vectors
+    rng = np.random.default_rng([args.seed, args.vectors])
+    picks = rng.integers(0, args.vectors, args.queries)
+    batches = {}
+    queries = []
+    for i in picks:
+        start = i // BATCH * BATCH
+        if start not in batches:
+            batches[start] = vector_batch(args.seed, args.dim, start, min(start + BATCH, args.vectors))
+        queries.append(batches[start][i - start])
+    queries = np.stack(queries) + 0.05 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_neighbours(args, queries: np.ndarray) -> np.ndarray:
+    """Ids of the k nearest vectors of every query, by a streaming float32 scan."""
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, args.vectors, BATCH):
+        end = min(start + BATCH, args.vectors)
+        scores = np.hstack([best_scores, queries @ vector_batch(args.seed, args.dim, start, end).T])
+        ids = np.hstack([best_ids, np.broadcast_to(np.arange(start, end), (len(queries), end - start))])
+        top = np.argsort(-scores, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+
+
+def directory_mb(path: str) -> float:
+    # Allocated blocks, so the sparse tails of the array files do not count
+    total = sum(os.stat(os.path.join(root, name)).st_blocks * 512
+                for root, _, names in os.walk(path) for name in names)
+    return round(total / 1e6, 1)
+
+
+def open_backend(backend: str, path: str, args):
+    if backend == "chroma":
+        import chromadb
+
+        client = chromadb.PersistentClient(path=path)
+        return client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+    from backend.services.vector_store import QuantizedVectorStore
+
+    dtype, _, variant = backend.partition("-")
+    return QuantizedVectorStore(
+        path, dtype=dtype, rerank_candidates=args.rerank_candidates,
+        ivf_lists=0 if variant == "flat" else args.ivf_lists, ivf_probes=args.ivf_probes,
+        # Partitions are built once, when the last batch arrives
+        ivf_min_vectors=args.vectors,
+    )
+
+
+def load(backend: str, path: str, args) -> dict:
+    collection = open_backend(backend, path, args)
+    started = time.perf_counter()
+    for start in range(0, args.vectors, BATCH):
+        end = min(start + BATCH, args.vectors)
+        collection.upsert(ids=[str(i) for i in range(start, end)],
+                          embeddings=vector_batch(args.seed, args.dim, start, end).tolist())
+    elapsed = time.perf_counter() - started
+    return {"load_seconds": round(elapsed, 1), "vectors_per_second": round(args.vectors / elapsed)}
+
+
+def search(backend: str, path: str, args, queries: np.ndarray) -> dict:
+    collection = open_backend(backend, path, args)
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["distances"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append([int(chunk) for chunk in result["ids"][0]])
+    report = {"latency_ms": percentiles(latencies[1:] or latencies), "found": found,
+              "query_peak_rss_mb": peak_rss_mb()}
+    if hasattr(collection, "stats"):
+        stats = collection.stats()
+        report["first_pass_mb"] = round(stats["first_pass_bytes"] / 1e6, 1)
+        report["float32_mb"] = round(stats["float32_bytes"] / 1e6, 1)
+        report["partitions"] = stats["partitions"]
+    return report
+
+
+def run_backend(backend: str, args, queries: np.ndarray, truth: np.ndarray, workdir: str) -> dict:
+    path = os.path.join(workdir, backend)
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        loaded = pool.submit(load, backend, path, args).result()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        searched = pool.submit(search, backend, path, args, queries).result()
+    found = searched.pop("found")
+    recall = np.mean([len(set(ids) & set(expected)) / args.k for ids, expected in zip(found, truth.tolist())])
+    return {"backend": backend, **loaded, "disk_mb": directory_mb(path),
+            f"recall_at_{args.k}": round(float(recall), 4), **searched}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384, help="embedding size (all-MiniLM-L6-v2 has 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=["int8-flat", "int8", "float16", "chroma"])
+    parser.add_argument("--rerank-candidates", type=int, default=100)
+    parser.add_argument("--ivf-lists", type=int, default=256)
+    parser.add_argument("--ivf-probes", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    queries = make_queries(args)
+    truth = exact_neighbours(args, queries)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in args.backends:
+            result = run_backend(backend, args, queries, truth, workdir)
+            results.append(result)
+            print(f"{backend:>12}: recall@{args.k} {result[f'recall_at_{args.k}']:.3f} · "
+                  f"p50 {result['latency_ms']['p50']} ms · p95 {result['latency_ms']['p95']} ms · "
+                  f"query RSS {result['query_peak_rss_mb']} MB · disk {result['disk_mb']} MB · "
+                  f"load {result['vectors_per_second']}/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "vector_store", "vectors": args.vectors, "dim": args.dim,
+                       "queries": args.queries, "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+End-to-end benchmark of the API, fully offline and reproducible.
+
+    python -m backend.benchmarks.run_benchmarks --output bench.json
+    python -m backend.benchmarks.run_benchmarks --employees 200000 --documents 300 --concurrency 1 8 32
+
+Builds a seeded employees/departments database and a corpus of TXT/PDF/DOCX
+documents, then runs the application in-process (lifespan included) against them,
+with the fake LLM provider answering canned SQL after --llm-latency-ms. It measures
+
+  * startup: time until /api/ready reports the engines warm
+  * ingestion: documents and chunks per second through /api/ingest/documents
+  * queries: p50/p95/p99 latency and throughput of /api/query at each concurrency
+    level, for new questions (cold), the same questions again (exact cache hits) and
+    rephrased ones (semantic cache), and of new questions sent as one batch request
+  * peak RSS after ingestion and at the end, including the parse workers
+
+Every store lives in a scratch directory, so a run never touches the project's
+databases. Compare the JSON of two commits to spot regressions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.benchmarks.synthetic import VOCABULARY, department_names, write_company_db, write_corpus
+
+# What the fake LLM answers for the question shapes below
+CANNED_SQL = [
+    (r"how many employees are in the (.+?) department",
+     "SELECT count(*) AS employees FROM employees e JOIN departments d ON d.dept_id = e.dept_id "
+     "WHERE d.dept_name = '\\1'"),
+    (r"average salary in the (.+?) department",
+     "SELECT avg(e.annual_salary) AS average_salary FROM employees e JOIN departments d ON d.dept_id = e.dept_id "
+     "WHERE d.dept_name = '\\1'"),
+    (r"employees who joined after (\d{4})",
+     "SELECT full_name, join_date FROM employees WHERE join_date > '\\1-12-31' ORDER BY join_date"),
+    (r"top (\d+) highest paid employees",
+     "SELECT full_name, annual_salary FROM employees ORDER BY annual_salary DESC LIMIT \\1"),
+]
+TERMINAL_JOB_STATES = ("completed", "completed_with_errors", "failed")
+MIME_TYPES = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+def make_questions(rng: random.Random, departments: list, count: int, seen: set) -> list:
+    """count questions not in seen, in a seeded mix of SQL and document shapes."""
+    shapes = (
+        lambda: f"How many employees are in the {rng.choice(departments)} department?",
+        lambda: f"What is the average salary in the {rng.choice(departments)} department?",
+        lambda: f"List the employees who joined after {rng.randint(2005, 2024)}",
+        lambda: f"Show the top {rng.randint(1, 500)} highest paid employees",
+        lambda: f"What do the documents say about {rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)}?",
+    )
+    questions = []
+    for _ in range(count * 50):
+        if len(questions) == count:
+            break
+        question = rng.choice(shapes)()
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
+
+
+def rephrase(question: str) -> str:
+    return "Please tell me: " + question.rstrip("?") + "?"
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+    return {
+        "p50": at(0.50), "p95": at(0.95), "p99": at(0.99),
+        "mean": round(sum(ordered) / len(ordered), 2), "max": round(ordered[-1], 2),
+    }
+
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size of this process and of its reaped children (the parse workers)."""
+    if resource is None:
+        return {"process": None, "children": None}
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "process": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1e6, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_until_ready(client, timeout_seconds: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout_seconds:
+        if (await client.get("/api/ready")).status_code == 200:
+            return round(time.perf_counter() - started, 3)
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"The application was not ready after {timeout_seconds:g}s")
+
+
+async def run_ingestion(client, paths: list, timeout_seconds: float) -> dict:
+    started = time.perf_counter()
+    handles = [open(path, "rb") for path in paths]
+    try:
+        files = [
+            ("files", (os.path.basename(path), handle, MIME_TYPES[path.rsplit(".", 1)[1]]))
+            for path, handle in zip(paths, handles)
+        ]
+        response = (await client.post("/api/ingest/documents", files=files)).json()
+    finally:
+        for handle in handles:
+            handle.close()
+    upload_seconds = time.perf_counter() - started
+
+    job_id = response["job_id"]
+    while True:
+        status = (await client.get(f"/api/ingest/status/{job_id}")).json()
+        if status["status"] in TERMINAL_JOB_STATES:
+            break
+        if time.perf_counter() - started > timeout_seconds:
+            raise RuntimeError(f"Ingestion job {job_id} did not finish within {timeout_seconds:g}s")
+        await asyncio.sleep(0.2)
+    seconds = time.perf_counter() - started
+    return {
+        "documents": len(paths),
+        "corpus_mb": round(sum(os.path.getsize(path) for path in paths) / 1e6, 2),
+        "status": status["status"],
+        "failed_files": status["failed_files"],
+        "chunks_indexed": status["chunks_indexed"],
+        "upload_seconds": round(upload_seconds, 3),
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(len(paths) / seconds, 2),
+        "chunks_per_second": round(status["chunks_indexed"] / seconds, 1),
+    }
+
+
+async def run_load(client, phase: str, questions: list, concurrency: int) -> dict:
+    """
+    Sends every question once, at most concurrency at a time, and reports the
+    latencies. llm_calls counts the upstream LLM calls made meanwhile, background
+    follow-up suggestions included.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcome = {"errors": 0, "cache_hits": 0, "query_types": {}}
+    llm_before = (await client.get("/api/stats/llm")).json()["upstream_calls"]
+
+    async def ask(question):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/api/query", json={"query": question})
+            latencies.append((time.perf_counter() - started) * 1000)
+        body = response.json() if response.status_code == 200 else {}
+        result = body.get("result")
+        if not body or (isinstance(result, dict) and result.get("error")):
+            outcome["errors"] += 1
+            return
+        outcome["cache_hits"] += bool(body.get("cache_hit"))
+        query_type = body.get("query_type")
+        outcome["query_types"][query_type] = outcome["query_types"].get(query_type, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ask(question) for question in questions))
+    seconds = time.perf_counter() - started
+    llm_after = (await client.get("/api/stats/llm")).json()["upstream_calls"]
+    return dict(
+        outcome,
+        phase=phase,
+        concurrency=concurrency,
+        requests=len(questions),
+        llm_calls=llm_after - llm_before,
+        cache_hit_rate=round(outcome["cache_hits"] / len(questions), 3) if questions else None,
+        throughput_rps=round(len(questions) / seconds, 1) if seconds else None,
+        latency_ms=percentiles(latencies),
+    )
+
+
+async def run_batch(client, questions: list) -> dict:
+    """
+    Sends the questions as one /api/query/batch request; its latency is that of
+    the whole request, llm_calls shows how many prompts the batch shared.
+    """
+    outcome = {"errors": 0, "cache_hits": 0, "query_types": {}}
+    llm_before = (await client.get("/api/stats/llm")).json()["upstream_calls"]
+    started = time.perf_counter()
+    response = await client.post("/api/query/batch", json={"queries": questions})
+    seconds = time.perf_counter() - started
+    for line in response.text.splitlines():
+        item = json.loads(line)
+        if item["status"] != "ok":
+            outcome["errors"] += 1
+            continue
+        outcome["cache_hits"] += bool(item["cache_hit"])
+        outcome["query_types"][item["query_type"]] = outcome["query_types"].get(item["query_type"], 0) + 1
+    llm_after = (await client.get("/api/stats/llm")).json()["upstream_calls"]
+    return dict(
+        outcome,
+        phase="batch",
+        concurrency=1,
+        requests=len(questions),
+        llm_calls=llm_after - llm_before,
+        cache_hit_rate=round(outcome["cache_hits"] / len(questions), 3),
+        throughput_rps=round(len(questions) / seconds, 1),
+        latency_ms=percentiles([seconds * 1000]),
+    )
+
+
+async def run(args, workdir: str, db_path: str, corpus: list) -> dict:
+    import httpx
+
+    from backend.main import app
+
+    rng = random.Random(args.seed)
+    departments = department_names(min(200, max(2, args.employees // 50)))
+    report = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            report["startup"] = {"ready_seconds": await wait_until_ready(client, args.timeout)}
+            report["ingestion"] = await run_ingestion(client, corpus, args.timeout) if corpus else None
+            report["peak_rss_mb_after_ingestion"] = peak_rss_mb()
+
+            report["queries"] = []
+            seen = set()
+            for concurrency in args.concurrency:
+                questions = make_questions(rng, departments, args.requests, seen)
+                for phase, batch in (
+                    ("cold", questions),
+                    ("warm", questions),
+                    ("rephrased", [rephrase(question) for question in questions]),
+                ):
+                    report["queries"].append(await run_load(client, phase, batch, concurrency))
+            # New questions again, a tenth of them twice, in one batch request
+            questions = make_questions(rng, departments, args.requests, seen)
+            report["queries"].append(await run_batch(client, questions + questions[:len(questions) // 10]))
+            report["metrics"] = (await client.get("/api/metrics")).json()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def configure_environment(args, workdir: str, db_path: str):
+    """Points every setting at the scratch directory; must run before backend.config is imported."""
+    responses_path = os.path.join(workdir, "canned_sql.json")
+    with open(responses_path, "w") as f:
+        json.dump(CANNED_SQL, f)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "benchmark"),
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_LATENCY_MS": str(args.llm_latency_ms),
+        "LLM_FAKE_RESPONSES_PATH": responses_path,
+        "CHROMA_PATH": os.path.join(workdir, "chroma_db"),
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_store"),
+        "SEMANTIC_CACHE_PATH": os.path.join(workdir, "semantic_cache.db"),
+        "SQL_TEMPLATE_PATH": os.path.join(workdir, "sql_templates.db"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.db"),
+        "INGESTION_STATE_PATH": os.path.join(workdir, "ingestion_jobs.db"),
+        "INGESTION_SPOOL_DIR": os.path.join(workdir, "ingestion_spool"),
+        "INDEX_MANIFEST_PATH": os.path.join(workdir, "index_manifest.db"),
+        "QUERY_HISTORY_PATH": os.path.join(workdir, "query_history.db"),
+        # Background replays would add LLM calls and load to the measured phases
+        "PREWARM_ENABLED": "false",
+    })
+    # A .env in the developer's working directory must not change the benchmark
+    os.chdir(workdir)
+
+
+def print_report(report: dict):
+    print(f"startup: ready after {report['startup']['ready_seconds']}s")
+    ingestion = report["ingestion"]
+    if ingestion:
+        print(f"ingestion: {ingestion['documents']} documents ({ingestion['corpus_mb']} MB), "
+              f"{ingestion['chunks_indexed']} chunks in {ingestion['seconds']}s -> "
+              f"{ingestion['documents_per_second']} docs/s, {ingestion['chunks_per_second']} chunks/s")
+    print(f"{'phase':>10} {'conc':>5} {'reqs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'hits':>6} {'llm':>5} {'errors':>6}")
+    for row in report["queries"]:
+        latency = row["latency_ms"]
+        print(f"{row['phase']:>10} {row['concurrency']:>5} {row['requests']:>5} {latency.get('p50', '-'):>9} "
+              f"{latency.get('p95', '-'):>9} {latency.get('p99', '-'):>9} {row['throughput_rps']:>8} "
+              f"{row['cache_hit_rate']:>6} {row['llm_calls']:>5} {row['errors']:>6}")
+    rss = report["peak_rss_mb"]
+    print(f"peak RSS: {rss['process']} MB (parse workers {rss['children']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=10000, help="rows of the synthetic employees table")
+    parser.add_argument("--documents", type=int, default=30, help="documents in the synthetic corpus")
+    parser.add_argument("--paragraphs", type=int, default=20, help="approximate paragraphs per document")
+    parser.add_argument("--requests", type=int, default=100, help="questions per phase and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed for warm-up and ingestion")
+    parser.add_argument("--workdir", help="keep the generated data and stores here instead of a temporary directory")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = os.path.abspath(args.workdir or scratch)
+        os.makedirs(os.path.join(workdir, "corpus"), exist_ok=True)
+        db_path = os.path.join(workdir, "company.db")
+        started = time.perf_counter()
+        write_company_db(db_path, args.employees, seed=args.seed)
+        corpus = write_corpus(os.path.join(workdir, "corpus"), args.documents, seed=args.seed,
+                              paragraphs=args.paragraphs)
+        generation_seconds = round(time.perf_counter() - started, 3)
+        configure_environment(args, workdir, db_path)
+        try:
+            report = asyncio.run(run(args, workdir, db_path, corpus))
+        finally:
+            os.chdir(PROJECT_ROOT)
+
+    report = {
+        "benchmark": "end_to_end",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "workdir")},
+        "data_generation_seconds": generation_seconds,
+        **report,
+    }
+    print_report(report)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Deterministic synthetic inputs for the benchmarks. Everything is generated from a
+seed, so two runs (or two commits) see exactly the same data.
+"""
+import datetime
+import os
+import random
+import sqlite3
+
+VOCABULARY = (
+    "policy employee department salary benefit leave manager review quarter budget "
+    "project report onboarding security compliance training travel expense approval "
+    "engineering finance marketing sales support office remote contract vendor audit "
+    "the a of to and in for with on by is are was be this that from as at or"
+).split()
+
+
+DEPARTMENTS = (
+    "Engineering", "Finance", "Marketing", "Sales", "Support", "Legal", "Operations", "Research",
+    "Security", "Facilities", "Procurement", "Design",
+)
+POSITIONS = (
+    "Software Engineer", "Data Scientist", "Analyst", "Manager", "Director", "Accountant",
+    "Designer", "Recruiter", "Consultant", "Technician",
+)
+OFFICES = ("New York", "San Francisco", "London", "Berlin", "Bangalore", "Singapore", "Toronto", "Remote")
+FIRST_NAMES = ("John", "Jane", "Peter", "Maria", "Wei", "Aisha", "Carlos", "Olga", "Kenji", "Fatima", "Liam", "Noor")
+LAST_NAMES = ("Doe", "Smith", "Jones", "Garcia", "Chen", "Khan", "Silva", "Ivanova", "Sato", "Ali", "Brown", "Haddad")
+
+
+def department_names(count: int) -> list:
+    """DEPARTMENTS, then numbered copies of them (Engineering 2, ...) when more are needed."""
+    return [
+        DEPARTMENTS[i % len(DEPARTMENTS)] + (f" {i // len(DEPARTMENTS) + 1}" if i >= len(DEPARTMENTS) else "")
+        for i in range(count)
+    ]
+
+
+def write_company_db(path: str, employees: int, departments: int = None, seed: int = 0):
+    """
+    Writes an SQLite database with the departments/employees schema of test_database.py,
+    with the given number of employees (and by default one department per 50 of them,
+    at least 2 and at most 200). An existing file is replaced.
+    """
+    rng = random.Random(seed)
+    departments = departments or min(200, max(2, employees // 50))
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("""
+            CREATE TABLE departments (
+                dept_id INTEGER PRIMARY KEY,
+                dept_name TEXT NOT NULL,
+                manager_id INTEGER
+            );
+            CREATE TABLE employees (
+                emp_id INTEGER PRIMARY KEY,
+                full_name TEXT NOT NULL,
+                dept_id INTEGER,
+                position TEXT,
+                annual_salary REAL,
+                join_date DATE,
+                office_location TEXT,
+                FOREIGN KEY (dept_id) REFERENCES departments (dept_id)
+            );
+        """)
+        conn.executemany(
+            "INSERT INTO departments (dept_id, dept_name, manager_id) VALUES (?, ?, ?)",
+            [(i + 1, name, rng.randint(1, max(1, employees))) for i, name in enumerate(department_names(departments))]
+        )
+        first_day = datetime.date(2005, 1, 1)
+        batch = []
+        for emp_id in range(1, employees + 1):
+            batch.append((
+                emp_id,
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                rng.randint(1, departments),
+                rng.choice(POSITIONS),
+                float(rng.randrange(40000, 250000, 500)),
+                (first_day + datetime.timedelta(days=rng.randint(0, 7000))).isoformat(),
+                rng.choice(OFFICES),
+            ))
+            if len(batch) == 10000 or emp_id == employees:
+                conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def write_txt(path: str, target_bytes: int, seed: int = 0):
+    """Writes paragraphs of 40-120 words until the file reaches target_bytes."""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as out:
+        while written < target_bytes:
+            paragraph = words(rng, rng.randint(40, 120)) + ".\n\n"
+            out.write(paragraph)
+            written += len(paragraph)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0):
+    """
+    Writes a plain-text PDF with the given number of pages. Objects are streamed to
+    disk one page at a time, so even very large files are cheap to generate.
+    """
+    rng = random.Random(seed)
+    offsets = {}
+    with open(path, "wb") as out:
+        def write_object(number: int, body: bytes):
+            offsets[number] = out.tell()
+            out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        out.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        kids = []
+        for page in range(pages):
+            content_number, page_number = 4 + 2 * page, 5 + 2 * page
+            lines = [_pdf_escape(words(rng, 12)) for _ in range(lines_per_page)]
+            stream = ("BT /F1 10 Tf 14 TL 50 780 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode()
+            write_object(content_number, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+            write_object(page_number, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_number} 0 R >>"
+            ).encode())
+            kids.append(f"{page_number} 0 R")
+        write_object(2, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode())
+
+        xref_offset = out.tell()
+        size = max(offsets) + 1
+        out.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for number in range(1, size):
+            out.write(f"{offsets[number]:010d} 00000 n \n".encode())
+        out.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+def write_docx(path: str, paragraphs: int, seed: int = 0):
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(words(rng, rng.randint(40, 120)) + ".")
+    document.save(path)
+
+
+def write_corpus(directory: str, count: int, seed: int = 0, paragraphs: int = 20) -> list:
+    """
+    Writes count documents (TXT, PDF and DOCX in turn) of about the given number of
+    paragraphs into directory. Returns their paths.
+    """
+    paths = []
+    for index in range(count):
+        kind = ("txt", "pdf", "docx")[index % 3]
+        path = os.path.join(directory, f"doc_{index:05d}.{kind}")
+        if kind == "txt":
+            write_txt(path, paragraphs * 500, seed=seed + index)
+        elif kind == "pdf":
+            write_pdf(path, pages=max(1, paragraphs // 6), seed=seed + index)
+        else:
+            write_docx(path, paragraphs, seed=seed + index)
+        paths.append(path)
+    return paths
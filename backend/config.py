@@ -1,9 +1,160 @@
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     # The default value points to the local sqlite DB, but can be overridden by the .env file
     DATABASE_URL: str = "sqlite:///./test.db"
-    GOOGLE_API_KEY: str
+    # Required by the gemini LLM provider
+    GOOGLE_API_KEY: str = ""
+
+    # False runs a SQL-only deployment: no document ingestion or search and no semantic
+    # cache, and the embedding stack (sentence-transformers, torch, chromadb) is never loaded
+    EMBEDDINGS_ENABLED: bool = True
+
+    # Models and local stores shared by every request
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    GENERATION_MODEL_NAME: str = "models/gemini-pro-latest"
+    CHROMA_PATH: str = "./chroma_db"
+
+    # Chunk embeddings are stored in Chroma, or with VECTOR_STORE "quantized" in local
+    # memory-mapped int8/float16 arrays (VECTOR_STORE_DTYPE) under VECTOR_STORE_PATH, whose
+    # best VECTOR_RERANK_CANDIDATES approximate matches are re-scored exactly. From
+    # VECTOR_IVF_MIN_VECTORS vectors on, they are split into VECTOR_IVF_LISTS partitions and
+    # a query scans the VECTOR_IVF_PROBES closest ones (VECTOR_IVF_LISTS=0 always scans all).
+    VECTOR_STORE: Literal["chroma", "quantized"] = "chroma"
+    VECTOR_STORE_PATH: str = "./vector_store"
+    VECTOR_STORE_DTYPE: Literal["int8", "float16"] = "int8"
+    VECTOR_RERANK_CANDIDATES: int = 100
+    VECTOR_IVF_LISTS: int = 256
+    VECTOR_IVF_PROBES: int = 16
+    VECTOR_IVF_MIN_VECTORS: int = 100000
+
+    # Generation model calls. LLM_PROVIDER "fake" answers locally after LLM_FAKE_LATENCY_MS
+    # (for benchmarks and offline runs), with the canned SQL of LLM_FAKE_RESPONSES_PATH
+    # (a JSON list of [question pattern, answer] pairs) when a pattern matches.
+    # LLM_TIMEOUT_SECONDS bounds a whole call: queueing behind LLM_MAX_CONCURRENCY, every
+    # attempt and the LLM_RETRY_BACKOFF_SECONDS backoff between the LLM_MAX_RETRIES retries.
+    LLM_PROVIDER: Literal["gemini", "fake"] = "gemini"
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_TIMEOUT_SECONDS: float = 20.0
+    LLM_SUGGESTIONS_TIMEOUT_SECONDS: float = 10.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF_SECONDS: float = 0.5
+    LLM_FAKE_LATENCY_MS: float = 50.0
+    LLM_FAKE_RESPONSES_PATH: str = ""
+
+    # Embedding inference. "onnx" or "openvino" need the sentence-transformers extra of
+    # that name; EMBEDDING_MODEL_FILE picks a variant such as "onnx/model_qint8_avx2.onnx".
+    EMBEDDING_BACKEND: Literal["torch", "onnx", "openvino"] = "torch"
+    EMBEDDING_MODEL_FILE: str = ""
+    # Concurrent query embeddings are batched until this many are queued or the oldest waited this long
+    EMBEDDING_MAX_BATCH_SIZE: int = 32
+    EMBEDDING_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_CACHE_SIZE: int = 10000
+
+    # POST /api/query/batch takes at most BATCH_MAX_QUESTIONS questions; SQL questions without
+    # a learned template share LLM prompts of up to BATCH_SQL_QUESTIONS_PER_PROMPT questions
+    BATCH_MAX_QUESTIONS: int = 500
+    BATCH_SQL_QUESTIONS_PER_PROMPT: int = 5
+
+    # Every answered question is logged (type, SQL, latency, rows, cache outcome) for
+    # /api/query/history; entries older than QUERY_HISTORY_MAX_AGE_DAYS are dropped
+    QUERY_HISTORY_PATH: str = "./query_history.db"
+    QUERY_HISTORY_MAX_AGE_DAYS: float = 90.0
+    # Once the engines are warm, and whenever the schema, the documents or the rows change,
+    # the PREWARM_MAX_QUESTIONS questions asked most often in the last PREWARM_WINDOW_HOURS are
+    # answered again in the background (PREWARM_CONCURRENCY at a time) to refill the caches,
+    # for at most PREWARM_TIME_BUDGET_SECONDS and PREWARM_LLM_CALL_BUDGET generation calls
+    # per round. One worker per host pre-warms, elected with a lease in the query history database
+    PREWARM_ENABLED: bool = True
+    PREWARM_WINDOW_HOURS: float = 72.0
+    PREWARM_MAX_QUESTIONS: int = 50
+    PREWARM_TIME_BUDGET_SECONDS: float = 60.0
+    PREWARM_LLM_CALL_BUDGET: int = 20
+    PREWARM_CONCURRENCY: int = 2
+    PREWARM_CHECK_INTERVAL_SECONDS: float = 10.0
+
+    # Cached schemas are re-validated against the catalog fingerprint at most this often
+    SCHEMA_CHECK_INTERVAL_SECONDS: float = 2.0
+
+    # SQL prompts include only the most relevant tables (plus the tables joining them)
+    SCHEMA_TOP_K_TABLES: int = 8
+
+    # Parameterized SQL learned from answered questions, reused for questions of the same shape
+    SQL_TEMPLATE_PATH: str = "./sql_templates.db"
+
+    # Connection pools of the databases queried by generated SQL (per connection string)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Generated SQL runs read-only and is cancelled after this long
+    SQL_STATEMENT_TIMEOUT_SECONDS: float = 30.0
+
+    # Guard for generated SQL: every result is bounded by SQL_HARD_ROW_LIMIT rows, and plans
+    # estimated above SQL_MAX_ESTIMATED_COST (planner cost on PostgreSQL, rows examined on
+    # MySQL and SQLite) are cut to SQL_DOWNGRADE_ROW_LIMIT rows or refused
+    SQL_HARD_ROW_LIMIT: int = 100000
+    SQL_MAX_ESTIMATED_COST: float = 5e7
+    SQL_DOWNGRADE_ROW_LIMIT: int = 1000
+
+    # SQL answers return at most this many rows per page; the rest is paged with a signed token
+    SQL_MAX_ROWS: int = 500
+    # Signs continuation tokens; derived from GOOGLE_API_KEY when empty (one of them must be set)
+    RESULT_TOKEN_SECRET: str = ""
+    RESULT_TOKEN_TTL_SECONDS: int = 3600
+
+    # Semantic answer cache shared by all workers on the host
+    SEMANTIC_CACHE_PATH: str = "./semantic_cache.db"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000
+    SEMANTIC_CACHE_MAX_AGE_SECONDS: float = 24 * 60 * 60
+
+    # Document retrieval: dense (Chroma) and BM25 (SQLite FTS5) matches are merged with
+    # reciprocal rank fusion. Keyword-like questions of at most LEXICAL_FIRST_MAX_TERMS
+    # terms (or carrying codes/ids) are answered from the lexical index alone when it
+    # has enough matches.
+    LEXICAL_INDEX_PATH: str = "./lexical_index.db"
+    DOCUMENT_SEARCH_K: int = 5
+    DOCUMENT_SEARCH_CANDIDATES: int = 20
+    RRF_K: int = 60
+    LEXICAL_FIRST_MAX_TERMS: int = 3
+
+    # Background document ingestion
+    INGESTION_STATE_PATH: str = "./ingestion_jobs.db"
+    INGESTION_SPOOL_DIR: str = "./ingestion_spool"
+    INGESTION_PARSE_WORKERS: int = 2
+    EMBEDDING_BATCH_SIZE: int = 64
+    # Chunk size in whitespace-separated tokens; MiniLM truncates at 256 word pieces
+    CHUNK_MAX_TOKENS: int = 160
+    CHUNK_OVERLAP_TOKENS: int = 32
+    # Table uploads (CSV/TSV) are loaded into the SQL database in chunks of this many rows,
+    # several files at a time
+    TABLE_INGESTION_CHUNK_ROWS: int = 50000
+    TABLE_INGESTION_WORKERS: int = 4
+    # Per-source record of indexed chunks, used to skip unchanged files and drop stale chunks
+    INDEX_MANIFEST_PATH: str = "./index_manifest.db"
+
+    @model_validator(mode="after")
+    def check_consistency(self):
+        # Fails at startup rather than on the first request that needs the setting
+        if self.LLM_PROVIDER == "gemini" and not self.GOOGLE_API_KEY:
+            raise ValueError("GOOGLE_API_KEY is required with LLM_PROVIDER=gemini")
+        if not self.RESULT_TOKEN_SECRET and not self.GOOGLE_API_KEY:
+            raise ValueError("RESULT_TOKEN_SECRET must be set when GOOGLE_API_KEY is empty")
+        if not 0 <= self.CHUNK_OVERLAP_TOKENS < self.CHUNK_MAX_TOKENS:
+            raise ValueError("CHUNK_OVERLAP_TOKENS must be smaller than CHUNK_MAX_TOKENS")
+        if self.SQL_DOWNGRADE_ROW_LIMIT > self.SQL_HARD_ROW_LIMIT:
+            raise ValueError("SQL_DOWNGRADE_ROW_LIMIT must not exceed SQL_HARD_ROW_LIMIT")
+        for name in ("LLM_MAX_CONCURRENCY", "EMBEDDING_MAX_BATCH_SIZE", "SQL_MAX_ROWS", "DB_POOL_SIZE",
+                     "INGESTION_PARSE_WORKERS", "EMBEDDING_BATCH_SIZE", "TABLE_INGESTION_WORKERS",
+                     "TABLE_INGESTION_CHUNK_ROWS", "VECTOR_RERANK_CANDIDATES", "VECTOR_IVF_PROBES",
+                     "BATCH_MAX_QUESTIONS", "BATCH_SQL_QUESTIONS_PER_PROMPT", "PREWARM_CONCURRENCY"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1")
+        return self
 
     # This tells pydantic to load variables from a .env file
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8')
@@ -1,31 +1,65 @@
-import pandas as pd
-from sqlalchemy import create_engine
+"""
+Loads CSV/TSV files into tables of a SQL database.
+
+    python -m backend.ingest_csv data/orders.csv data/customers.csv --mode append
+    python -m backend.ingest_csv orders.csv --mode upsert --key order_id
+    python -m backend.ingest_csv big.csv --table sales --database-url postgresql://...
+
+Each file goes to a table named after it unless --table is given. A table that
+already exists is only changed with an explicit --mode (replace, append or
+upsert). Without any file, test.csv from the project root replaces the
+'employees' table of the project's test.db.
+"""
+import argparse
+import json
 import os
+import sys
 
 # Adjust the path to go up one level from the script's location to the project root
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Also runnable as a script (python backend/ingest_csv.py)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from backend.services.table_ingestion import MODES, ingest_table_files
+
 csv_path = os.path.join(project_root, 'test.csv')
 db_path = os.path.join(project_root, 'test.db') # Assuming SQLite for simplicity
 
-def ingest_data():
-    """Reads data from test.csv and ingests it into an SQLite database table."""
-    if not os.path.exists(csv_path):
-        print(f"Error: {csv_path} not found.")
-        return
-
-    try:
-        df = pd.read_csv(csv_path)
-        
-        # Using a file-based SQLite database as specified in the .env.example
-        engine = create_engine(f'sqlite:///{db_path}')
-        
-        # Write the data to a table named 'employees'. If the table exists, it will be replaced.
-        df.to_sql('employees', engine, if_exists='replace', index=False)
-        
-        print(f"Successfully ingested {len(df)} rows into the 'employees' table in {db_path}")
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="CSV or TSV files")
+    parser.add_argument("--database-url", default=f"sqlite:///{db_path}")
+    parser.add_argument("--table", help="load every file into this table")
+    parser.add_argument("--mode", choices=MODES, help="default: create, or replace for test.csv")
+    parser.add_argument("--key", action="append", default=[], help="key column for --mode upsert (repeatable)")
+    parser.add_argument("--chunk-rows", type=int, help="rows read and written per batch")
+    parser.add_argument("--workers", type=int, help="files loaded in parallel")
+    args = parser.parse_args()
+
+    if args.mode == "upsert" and not args.key:
+        parser.error("--mode upsert needs at least one --key")
+    files = [(path, os.path.basename(path), args.table) for path in args.files]
+    if not files:
+        if not os.path.exists(csv_path):
+            parser.error(f"{csv_path} not found")
+        files = [(csv_path, 'test.csv', args.table or 'employees')]
+    mode = args.mode or ("create" if args.files else "replace")
+
+    report = ingest_table_files(
+        args.database_url, files, mode=mode, key_columns=args.key,
+        workers=args.workers, chunk_rows=args.chunk_rows,
+    )
+    for entry in report["files"]:
+        if "error" in entry:
+            print(f"{entry['file']} -> {entry['table']}: failed: {entry['error']}")
+        else:
+            print(f"{entry['file']} -> {entry['table']}: {entry['rows']} rows in {entry['seconds']}s "
+                  f"({entry['rows_per_second']} rows/s, {entry['method']})")
+    print(json.dumps({key: value for key, value in report.items() if key != "files"}))
+    raise SystemExit(1 if report["failed_files"] else 0)
+
 
 if __name__ == "__main__":
-    ingest_data()
+    main()
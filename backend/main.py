@@ -1,8 +1,66 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from backend.api.routes import ingestion, query, schema
+from backend.api.routes import ingestion, query, schema, system
+from backend.config import settings
+from backend.models.database import init_db
+from backend.services import db_engines, metrics
+from backend.services.cache_warmer import CacheWarmer
+from backend.services.engine_registry import EngineRegistry
+from backend.services.ingestion_jobs import IngestionJobManager
+from backend.services.query_history import get_query_history
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    # One registry of warmed query engines lives as long as the application.
+    # Warm-up runs in the background; /api/ready reports when it has finished.
+    app.state.engine_registry = EngineRegistry()
+    warmup = asyncio.create_task(asyncio.to_thread(app.state.engine_registry.warm_up, settings.DATABASE_URL))
+
+    # Document ingestion needs the embedding stack; a SQL-only deployment has none
+    app.state.ingestion_jobs = None
+    if settings.EMBEDDINGS_ENABLED:
+        app.state.ingestion_jobs = IngestionJobManager(
+            settings.INGESTION_STATE_PATH,
+            settings.INGESTION_SPOOL_DIR,
+            parse_workers=settings.INGESTION_PARSE_WORKERS,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+        )
+        app.state.ingestion_jobs.start()
 
-app = FastAPI()
+    # The most frequent recent questions are answered again in the background, so the
+    # first users after a deploy (or after new data) find them cached
+    app.state.cache_warmer = None
+    prewarm = None
+    if settings.PREWARM_ENABLED:
+        app.state.cache_warmer = CacheWarmer(
+            app.state.engine_registry,
+            settings.DATABASE_URL,
+            window_seconds=settings.PREWARM_WINDOW_HOURS * 60 * 60,
+            max_questions=settings.PREWARM_MAX_QUESTIONS,
+            time_budget=settings.PREWARM_TIME_BUDGET_SECONDS,
+            llm_budget=settings.PREWARM_LLM_CALL_BUDGET,
+            concurrency=settings.PREWARM_CONCURRENCY,
+            check_interval=settings.PREWARM_CHECK_INTERVAL_SECONDS,
+        )
+        prewarm = asyncio.create_task(app.state.cache_warmer.run())
+    yield
+    if prewarm is not None:
+        prewarm.cancel()
+        # Releases the pre-warming lease for the other workers
+        await asyncio.gather(prewarm, return_exceptions=True)
+    if app.state.ingestion_jobs is not None:
+        app.state.ingestion_jobs.shutdown()
+    if not warmup.done():
+        warmup.cancel()
+    get_query_history().flush()
+    db_engines.dispose_all()
+
+app = FastAPI(lifespan=lifespan)
 
 # This should be more restrictive in a production environment
 origins = ["*"]
@@ -15,9 +73,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the raw path, keeps the number of series bounded
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code,
+    )
+    return response
+
 app.include_router(ingestion.router)
 app.include_router(query.router)
 app.include_router(schema.router)
+app.include_router(system.router)
 
 @app.get("/")
 def read_root():
@@ -1,7 +1,8 @@
+from typing import Optional
+
 from pydantic import BaseModel
 from sqlalchemy import create_engine, Column, Integer, String, Text, LargeBinary
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker
 
 DATABASE_URL = "sqlite:///./test.db"
 
@@ -12,6 +13,10 @@ Base = declarative_base()
 class DatabaseConnection(BaseModel):
     connection_string: str
 
+class SchemaInvalidation(BaseModel):
+    # In the body, not the URL, so credentials stay out of access logs and metrics labels
+    connection_string: Optional[str] = None
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -20,4 +25,6 @@ class Document(Base):
     chunk_text = Column(Text)
     embedding = Column(LargeBinary)
 
-Base.metadata.create_all(bind=engine)
+def init_db():
+    """Creates the application's own tables; called once at startup, not at import."""
+    Base.metadata.create_all(bind=engine)
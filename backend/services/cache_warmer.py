@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from backend.services.metrics import collect_timings
+from backend.services.query_history import get_query_history
+
+logger = logging.getLogger(__name__)
+
+# Name of the lease in the query history that elects the one worker that pre-warms
+_LEASE = "cache_warmer"
+
+
+class CacheWarmer:
+    """
+    Refills the answer and embedding caches from the query history. Once the engines
+    are warm, and whenever the schema, the indexed documents or the database rows
+    change (checked every check_interval seconds), the questions asked most often
+    within window_seconds are answered again in the background, most frequent
+    first. A round stops at time_budget seconds, cancelling the replays still
+    running, or at llm_budget generation calls; questions still answered by the
+    shared semantic cache need no generation call. Every worker runs a warmer, but
+    only the one holding the lease in the shared query history replays questions;
+    another takes over when it stops renewing the lease.
+    """
+
+    def __init__(self, registry, connection_string: str, window_seconds: float, max_questions: int,
+                 time_budget: float, llm_budget: int, concurrency: int, check_interval: float):
+        self.registry = registry
+        self.connection_string = connection_string
+        self.window_seconds = window_seconds
+        self.max_questions = max_questions
+        self.time_budget = time_budget
+        self.llm_budget = llm_budget
+        self.concurrency = concurrency
+        self.check_interval = check_interval
+        self.rounds = 0
+        self.last_round = None
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        # Renewed every check; a round between two checks lasts at most time_budget
+        self.lease_seconds = time_budget + 3 * check_interval
+        self.is_leader = False
+
+    async def run(self):
+        while not self.registry.status()["warmup_finished"]:
+            await asyncio.sleep(0.5)
+        if not self.registry.is_ready:
+            logger.warning("Engine warm-up failed; answers are not pre-warmed")
+            return
+        history = get_query_history()
+        warmed_state = None
+        try:
+            while True:
+                try:
+                    is_leader = await asyncio.to_thread(history.claim_lease, _LEASE, self.owner, self.lease_seconds)
+                    if is_leader != self.is_leader:
+                        self.is_leader = is_leader
+                        # Another worker may have warmed meanwhile; a new leader starts with a round
+                        warmed_state = None
+                        logger.info("This worker %s pre-warming", "took over" if is_leader else "stopped")
+                    if is_leader:
+                        engine = await self.registry.get_async(self.connection_string)
+                        await asyncio.to_thread(engine.refresh_schema)
+                        # A new schema or new rows bump the engine's generation, new documents the corpus version
+                        state = (engine.answers_generation,
+                                 await asyncio.to_thread(engine.semantic_cache.get_corpus_version))
+                        if state != warmed_state:
+                            warmed_state = state
+                            self.last_round = await self.warm(engine)
+                            self.rounds += 1
+                            logger.info("Pre-warmed %d of %d frequent questions in %.1fs (%d LLM calls)",
+                                        self.last_round["replayed"], self.last_round["candidates"],
+                                        self.last_round["seconds"], self.last_round["llm_calls"])
+                except Exception:
+                    logger.exception("Pre-warming failed")
+                await asyncio.sleep(self.check_interval)
+        finally:
+            if self.is_leader:
+                # Lets another worker take over without waiting for the lease to expire
+                history.release_lease(_LEASE, self.owner)
+                self.is_leader = False
+
+    async def warm(self, engine) -> dict:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.time_budget
+        questions = await asyncio.to_thread(
+            get_query_history().top, engine.cache_scope, time.time() - self.window_seconds, self.max_questions
+        )
+        report = {"started_at": time.time(), "candidates": len(questions), "replayed": 0, "llm_calls": 0,
+                  "errors": 0, "cancelled": 0, "stopped_by": None}
+
+        async def replay(question):
+            try:
+                with collect_timings() as timings:
+                    response = await engine.warm(question)
+                report["errors"] += bool(response["result"].get("error"))
+            except Exception:
+                report["errors"] += 1
+                timings = {}
+            report["replayed"] += 1
+            # A replayed question makes at most one generation call
+            report["llm_calls"] += "llm" in timings
+
+        running = set()
+        for entry in questions:
+            while len(running) >= self.concurrency and loop.time() < deadline:
+                _, running = await asyncio.wait(
+                    running, timeout=max(0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+            if loop.time() >= deadline:
+                report["stopped_by"] = "time_budget"
+                break
+            # Questions in flight may still call the model, so they count against the budget
+            if report["llm_calls"] + len(running) >= self.llm_budget:
+                report["stopped_by"] = "llm_budget"
+                break
+            running.add(asyncio.create_task(replay(entry["query"])))
+        if running:
+            _, running = await asyncio.wait(running, timeout=max(0, deadline - loop.time()))
+        if running:
+            # Replays past the time budget are dropped; their model calls finish for whoever shares them
+            report["stopped_by"] = "time_budget"
+            report["cancelled"] = len(running)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        report["seconds"] = round(loop.time() - started, 3)
+        return report
+
+    def status(self) -> dict:
+        return {"leader": self.is_leader, "rounds": self.rounds, "last_round": self.last_round}
+
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One pooled engine per connection string, shared by schema discovery and query
+# execution for the lifetime of the process.
+_engines = {}
+_pool_events = {}
+_lock = threading.Lock()
+
+
+def _engine_options(connection_string: str) -> dict:
+    url = make_url(connection_string)
+    if url.get_backend_name() == "sqlite":
+        # SQLite has nothing to pre-ping or recycle; an in-memory database keeps its
+        # single-connection pool so every session sees the same data.
+        options = {"connect_args": {"check_same_thread": False}}
+        if url.database and url.database != ":memory:":
+            options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW,
+                           pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS)
+        return options
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+
+
+def _track_pool(engine, counters: dict):
+    def count(name):
+        def listener(*args):
+            counters[name] += 1
+        return listener
+
+    for name in ("connect", "checkout", "checkin", "invalidate"):
+        event.listen(engine.pool, name, count(name))
+
+
+def get_engine(connection_string: str):
+    engine = _engines.get(connection_string)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(connection_string)
+            if engine is None:
+                engine = create_engine(connection_string, **_engine_options(connection_string))
+                counters = {"connect": 0, "checkout": 0, "checkin": 0, "invalidate": 0}
+                _track_pool(engine, counters)
+                _engines[connection_string] = engine
+                _pool_events[connection_string] = counters
+    return engine
+
+
+def _apply_read_only(conn, timeout_seconds: float):
+    """
+    Puts the connection into a read-only transaction with a statement timeout.
+    Returns a callable that undoes the connection-level settings before the
+    connection goes back to the pool.
+    """
+    dialect = conn.dialect.name
+    timeout_ms = int(timeout_seconds * 1000)
+    if dialect == "postgresql":
+        # Both settings are transaction-local, the rollback at the end resets them
+        conn.execute(text("SET TRANSACTION READ ONLY"))
+        conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        return lambda: None
+    if dialect in ("mysql", "mariadb"):
+        conn.execute(text("SET TRANSACTION READ ONLY"))
+        variable = "max_statement_time" if dialect == "mariadb" else "max_execution_time"
+        value = timeout_seconds if dialect == "mariadb" else timeout_ms
+        conn.execute(text(f"SET SESSION {variable} = {value}"))
+        return lambda: conn.execute(text(f"SET SESSION {variable} = DEFAULT"))
+    if dialect == "sqlite":
+        conn.execute(text("PRAGMA query_only = ON"))
+        raw = conn.connection.driver_connection
+        deadline = time.monotonic() + timeout_seconds
+        # A non-zero return value makes SQLite abort the running statement
+        raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+
+        def reset():
+            raw.set_progress_handler(None, 0)
+            conn.execute(text("PRAGMA query_only = OFF"))
+        return reset
+    logger.warning("No read-only or timeout support for dialect %s", dialect)
+    return lambda: None
+
+
+@contextmanager
+def read_only_connection(connection_string: str, timeout_seconds: float = None):
+    """
+    A pooled connection for running generated SQL: writes are rejected by the
+    database and statements are cancelled after the timeout. Nothing is ever
+    committed; the transaction is rolled back on exit.
+    """
+    timeout_seconds = timeout_seconds or settings.SQL_STATEMENT_TIMEOUT_SECONDS
+    with get_engine(connection_string).connect() as conn:
+        reset = _apply_read_only(conn, timeout_seconds)
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            try:
+                reset()
+                conn.commit()
+            except Exception:
+                # A connection that can't be reset must not be reused
+                conn.invalidate()
+
+
+def pool_stats() -> dict:
+    stats = {}
+    for connection_string, engine in list(_engines.items()):
+        pool = engine.pool
+        entry = {"pool": type(pool).__name__, "events": dict(_pool_events[connection_string])}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                entry[name] = method()
+        stats[engine.url.render_as_string(hide_password=True)] = entry
+    return stats
+
+
+def dispose_all():
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _pool_events.clear()
@@ -1,76 +1,284 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
-import uuid
-import pypdf
-import docx
 import csv
 import io
+import time
+from collections import defaultdict
+from itertools import islice
+
+from backend.config import settings
+from backend.services import shared_resources
+from backend.services.embedding_service import get_embedding_service
+from backend.services.index_manifest import chunk_id, file_hash, get_index_manifest
+from backend.services.lexical_index import get_lexical_index
+from backend.services import metrics
+from backend.services.metrics import span
+from backend.services.semantic_cache import get_semantic_cache
+
+# Marks a paragraph boundary inside a chunk window; it is not counted as a token
+PARAGRAPH_BREAK = "\n\n"
+# Text files without blank lines are still cut into blocks of at most this many characters
+MAX_BLOCK_CHARS = 64 * 1024
+
+
+def batched(iterable, size: int):
+    """Yields lists of up to size items without materializing the iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def chunk_blocks(blocks, max_tokens: int, overlap_tokens: int):
+    """
+    Packs a stream of text blocks (pages, paragraphs) into chunks of at most
+    max_tokens tokens, repeating the last overlap_tokens tokens of each chunk at the
+    start of the next one. Tokens are whitespace-separated words, a close and cheap
+    proxy for the embedding model's word pieces. Only one chunk window is held in
+    memory at a time.
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    window = []
+    size = 0
+    fresh = 0
+
+    def emit():
+        return " ".join(window).replace(f" {PARAGRAPH_BREAK} ", PARAGRAPH_BREAK).strip()
+
+    def overlap():
+        tail = []
+        count = 0
+        for word in reversed(window):
+            if count >= overlap_tokens:
+                break
+            tail.append(word)
+            if word != PARAGRAPH_BREAK:
+                count += 1
+        tail.reverse()
+        while tail and tail[0] == PARAGRAPH_BREAK:
+            tail.pop(0)
+        return tail, count
+
+    for block in blocks:
+        words = block.split()
+        if not words:
+            continue
+        # Prefer to cut at a paragraph boundary when the window is already reasonably full
+        if fresh and size + len(words) > max_tokens and size >= max_tokens // 2:
+            yield emit()
+            window, size = overlap()
+            fresh = 0
+        if window:
+            window.append(PARAGRAPH_BREAK)
+        for word in words:
+            window.append(word)
+            size += 1
+            fresh += 1
+            if size >= max_tokens:
+                yield emit()
+                window, size = overlap()
+                fresh = 0
+    if fresh:
+        yield emit()
+
+
+def _open_binary(source):
+    """Sources are either raw bytes or a path to a (spooled) file."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, 'rb')
+
 
 class DocumentProcessor:
     def __init__(self):
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        # Initialize ChromaDB client. It can be in-memory or persistent.
-        # Using a persistent client is better for production.
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.chroma_client.get_or_create_collection(name="documents")
+        # The embedding model and the persistent ChromaDB collection are shared
+        # with the query path, so they are only loaded once per process.
+        self.collection = shared_resources.get_document_collection()
+        # Keyword index over the same chunks, kept in step with the collection
+        self.lexical = get_lexical_index()
+        self.manifest = get_index_manifest()
+        # source -> (generation, first time the manifest sees this source)
+        self._open_sources = {}
 
     def process_documents(self, files: list, filenames: list):
         """
-        Process and store documents in ChromaDB.
+        Process and store documents in ChromaDB. Each file is streamed through the
+        chunker and embedded in fixed-size batches, so memory stays flat. Files whose
+        content did not change since they were last indexed are skipped.
         """
+        changed = False
         for file, filename in zip(files, filenames):
-            file_extension = filename.split('.')[-1].lower()
-            content = self.read_file(file, file_extension)
-            chunks = self.dynamic_chunking(content, file_extension)
-            
-            if not chunks:
+            content_hash = file_hash(file)
+            if self.manifest.is_unchanged(filename, content_hash):
                 continue
+            self.begin_source(filename)
+            chunks = self.iter_document_chunks(file, filename)
+            for batch in batched(chunks, settings.EMBEDDING_BATCH_SIZE):
+                self.index_chunks(batch, filename)
+            self.finish_source(filename, content_hash)
+            changed = True
+        if changed:
+            # Answers computed from the old document set are no longer valid
+            get_semantic_cache().bump_corpus_version()
+        print(f"Successfully processed and indexed {len(filenames)} documents into ChromaDB.")
 
-            embeddings = self.embedding_model.encode(chunks, batch_size=32).tolist()
-            ids = [str(uuid.uuid4()) for _ in chunks]
-            metadata = [{'source': filename} for _ in chunks]
+    def begin_source(self, source: str):
+        """Starts re-indexing one source; every chunk not seen again before finish_source is deleted."""
+        first_time = not self.manifest.is_known(source)
+        self._open_sources[source] = (self.manifest.begin(source), first_time)
 
-            self.collection.add(
-                embeddings=embeddings,
+    def plan_chunks(self, chunks: list, source: str):
+        """
+        Returns the content-addressed ids of the chunks and the positions of the ones
+        that actually need embedding: chunks already stored for this source and
+        repeats within the file are skipped. The store itself is asked, so chunks of
+        an interrupted earlier run are not mistaken for stored ones.
+        """
+        generation, _ = self._open_sources[source]
+        ids = [chunk_id(source, chunk) for chunk in chunks]
+        states = self.manifest.claim(source, ids, generation)
+        candidates = [i for i, state in enumerate(states) if state != 'duplicate']
+        if not candidates:
+            return ids, []
+        existing = set(self.collection.get(ids=[ids[i] for i in candidates], include=[])['ids'])
+        # Stored chunks the lexical index doesn't have yet (indexed before it existed)
+        unindexed = set(self.lexical.missing([ids[i] for i in candidates if ids[i] in existing]))
+        if unindexed:
+            positions = [i for i in candidates if ids[i] in unindexed]
+            self.lexical.add([ids[i] for i in positions], [chunks[i] for i in positions], source, time.time())
+        return ids, [i for i in candidates if ids[i] not in existing]
+
+    def store_chunks(self, ids: list, chunks: list, source: str, embeddings):
+        if not ids:
+            return
+        ingested_at = time.time()
+        with span("store_chunks"):
+            self.collection.upsert(
+                embeddings=embeddings.tolist(),
                 documents=chunks,
-                metadatas=metadata,
+                metadatas=[{'source': source, 'ingested_at': ingested_at} for _ in chunks],
                 ids=ids
             )
-        print(f"Successfully processed and indexed {len(filenames)} documents into ChromaDB.")
+            self.lexical.add(ids, chunks, source, ingested_at)
+        metrics.CHUNKS_EMBEDDED.inc(len(ids))
 
-    def read_file(self, file, file_extension):
-        content = ""
-        try:
-            if file_extension == 'pdf':
-                pdf_reader = pypdf.PdfReader(io.BytesIO(file))
-                for page in pdf_reader.pages:
-                    content += page.extract_text() or ''
-            elif file_extension == 'docx':
-                doc = docx.Document(io.BytesIO(file))
-                for para in doc.paragraphs:
-                    content += para.text + '\n'
-            elif file_extension == 'txt':
-                content = file.decode('utf-8')
-            elif file_extension == 'csv':
-                content = file.decode('utf-8')
-        except Exception as e:
-            print(f"Error reading file: {e}")
-        return content
+    def index_chunks(self, chunks: list, source: str) -> int:
+        """
+        Embed and store the new chunks of a source opened with begin_source.
+        Returns how many chunks were embedded.
+        """
+        with span("plan_chunks"):
+            ids, todo = self.plan_chunks(chunks, source)
+        metrics.CHUNKS_INDEXED.inc(len(chunks))
+        if not todo:
+            return 0
+        texts = [chunks[i] for i in todo]
+        with span("embed_chunks"):
+            embeddings = get_embedding_service().encode(texts, batch_size=len(texts))
+        self.store_chunks([ids[i] for i in todo], texts, source, embeddings)
+        return len(todo)
+
+    def abandon_source(self, source: str):
+        """Forgets a source whose ingestion failed; the next ingestion starts a new generation."""
+        self._open_sources.pop(source, None)
+
+    def finish_source(self, source: str, content_hash: str) -> int:
+        """Deletes the chunks of the source that the new version no longer contains."""
+        generation, first_time = self._open_sources.pop(source)
+        stale = self.manifest.finish(source, generation, content_hash)
+        if first_time:
+            # Chunks indexed before the manifest existed (random ids) are unknown to it
+            current = set(self.manifest.chunk_ids(source))
+            stored = self.collection.get(where={'source': source}, include=[])['ids']
+            stale.extend(i for i in stored if i not in current)
+        for batch in batched(stale, 1000):
+            self.collection.delete(ids=batch)
+            self.lexical.delete(batch)
+        return len(stale)
+
+    def backfill_lexical_index(self, batch_size: int = 1000) -> int:
+        """
+        Copies chunks that are in the collection but not in the lexical index, e.g.
+        everything indexed before the lexical index existed. Returns how many were added.
+        """
+        if self.lexical.count() >= self.collection.count():
+            return 0
+        added = 0
+        offset = 0
+        while True:
+            page = self.collection.get(include=['documents', 'metadatas'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return added
+            missing = set(self.lexical.missing(page['ids']))
+            groups = defaultdict(lambda: ([], []))
+            for chunk, text, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                if chunk in missing:
+                    ids, texts = groups[(metadata['source'], metadata.get('ingested_at'))]
+                    ids.append(chunk)
+                    texts.append(text)
+            for (source, ingested_at), (ids, texts) in groups.items():
+                self.lexical.add(ids, texts, source, ingested_at)
+                added += len(ids)
+            offset += len(page['ids'])
 
-    def dynamic_chunking(self, content: str, doc_type: str) -> list:
+    @staticmethod
+    def iter_document_chunks(source, filename: str, raise_errors: bool = False):
         """
-        Intelligent chunking based on document structure.
+        Streams the chunks of one file, given as bytes or a path. Needs no model,
+        so it can run in a worker process.
         """
-        if doc_type == 'csv':
+        file_extension = filename.split('.')[-1].lower()
+        blocks = DocumentProcessor.iter_text_blocks(source, file_extension, raise_errors=raise_errors)
+        if file_extension == 'csv':
             # For CSVs, treat each row as a document
-            lines = content.splitlines()
-            reader = csv.reader(lines)
-            # Skip header if it exists
-            try:
-                header = next(reader)
-                return [", ".join(row) for row in reader if row]
-            except StopIteration:
-                return []
+            yield from blocks
         else:
-            # Simple paragraph-based chunking, ignoring very short paragraphs
-            return [para.strip() for para in content.split('\n\n') if len(para.strip()) > 50]
\ No newline at end of file
+            yield from chunk_blocks(blocks, settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+
+    @staticmethod
+    def iter_text_blocks(source, file_extension, raise_errors: bool = False):
+        """
+        Yields the text of a file piece by piece: PDF pages, DOCX paragraphs,
+        paragraphs of text files and rows of CSV files.
+        """
+        try:
+            with _open_binary(source) as binary:
+                # The parsers are imported on first use, off the application's startup path
+                if file_extension == 'pdf':
+                    import pypdf
+
+                    pdf_reader = pypdf.PdfReader(binary)
+                    for page in pdf_reader.pages:
+                        yield page.extract_text() or ''
+                elif file_extension == 'docx':
+                    import docx
+
+                    doc = docx.Document(binary)
+                    for para in doc.paragraphs:
+                        yield para.text
+                elif file_extension == 'txt':
+                    paragraph = []
+                    length = 0
+                    text = io.TextIOWrapper(binary, encoding='utf-8', errors='replace')
+                    # readline is bounded too, so a file without any newline can't blow up memory
+                    for line in iter(lambda: text.readline(MAX_BLOCK_CHARS), ''):
+                        if line.strip():
+                            paragraph.append(line)
+                            length += len(line)
+                        if paragraph and (not line.strip() or length >= MAX_BLOCK_CHARS):
+                            yield ''.join(paragraph)
+                            paragraph = []
+                            length = 0
+                    if paragraph:
+                        yield ''.join(paragraph)
+                elif file_extension == 'csv':
+                    reader = csv.reader(io.TextIOWrapper(binary, encoding='utf-8', errors='replace', newline=''))
+                    # Skip header if it exists
+                    next(reader, None)
+                    for row in reader:
+                        if row:
+                            yield ", ".join(row)
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error reading file: {e}")
@@ -0,0 +1,192 @@
+import collections
+import hashlib
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+import numpy as np
+from cachetools import LRUCache
+
+from backend.config import settings
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingService:
+    """
+    The one embedding model of the process, shared by the query and ingestion paths.
+
+    Single query embeddings go through a micro-batcher: concurrent encode_query calls
+    are queued and a worker thread runs them as one forward pass once the batch is
+    full or the oldest request has waited max_wait_ms. Query embeddings are also kept
+    in an LRU cache keyed by a hash of the text. Bulk encode calls (ingestion) run
+    directly. All embeddings are unit-normalized, so dot product equals cosine.
+    """
+
+    def __init__(self, model_name: str, backend: str, model_file: str,
+                 max_batch_size: int, max_wait_ms: float, cache_size: int):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_file = model_file
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._model = None
+        self._load_lock = threading.Lock()
+        # One forward pass at a time; torch already parallelizes inside a pass
+        self._model_lock = threading.Lock()
+        self._cache = LRUCache(maxsize=cache_size)
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._batched_items = 0
+        self._batch_sizes = collections.Counter()
+        self._queue_waits = collections.deque(maxlen=1000)
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    @property
+    def model(self) -> "SentenceTransformer":
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self) -> "SentenceTransformer":
+        # Imported here: sentence-transformers pulls in torch, which takes seconds to load
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            return SentenceTransformer(self.model_name)
+        # "onnx" / "openvino" need sentence-transformers>=3.2 with the matching extra
+        # installed; model_file selects e.g. a quantized "onnx/model_qint8_avx2.onnx".
+        model_kwargs = {"file_name": self.model_file} if self.model_file else None
+        logger.info("Loading %s with the %s backend (%s)", self.model_name, self.backend, self.model_file or "default")
+        return SentenceTransformer(self.model_name, backend=self.backend, model_kwargs=model_kwargs)
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        """Bulk encoding for ingestion; bypasses the micro-batcher and the cache."""
+        model = self.model
+        with self._model_lock:
+            return model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+    def encode_query(self, text: str) -> np.ndarray:
+        """Encodes one query, sharing a forward pass with concurrent callers."""
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            with self._stats_lock:
+                self._cache_hits += 1
+            return cached
+        with self._stats_lock:
+            self._cache_misses += 1
+
+        self._ensure_worker()
+        future = Future()
+        self._requests.put((text, time.monotonic(), future))
+        embedding = future.result()
+        with self._cache_lock:
+            self._cache[key] = embedding
+        return embedding
+
+    def encode_queries(self, texts: list) -> np.ndarray:
+        """Encodes many queries in one pass, using and filling the query cache."""
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        with self._cache_lock:
+            found = [self._cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(found) if embedding is None]
+        if missing:
+            embeddings = self.encode([texts[i] for i in missing], batch_size=max(len(missing), 1))
+            with self._cache_lock:
+                for i, embedding in zip(missing, embeddings):
+                    self._cache[keys[i]] = embedding
+                    found[i] = embedding
+        with self._stats_lock:
+            self._cache_hits += len(texts) - len(missing)
+            self._cache_misses += len(missing)
+        return np.vstack(found) if found else np.zeros((0, 0), dtype=np.float32)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._load_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = batch[0][1] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._requests.get(timeout=max(remaining, 0)) if remaining > 0
+                                 else self._requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.monotonic()
+            try:
+                embeddings = self.encode([text for text, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._batched_items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._queue_waits.extend(started - submitted for _, submitted, _ in batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            waits = sorted(self._queue_waits)
+            lookups = self._cache_hits + self._cache_misses
+            return {
+                "model": self.model_name,
+                "backend": self.backend,
+                "loaded": self._model is not None,
+                "batches": self._batches,
+                "batched_queries": self._batched_items,
+                "avg_batch_size": round(self._batched_items / self._batches, 2) if self._batches else None,
+                "max_batch_size_seen": max(self._batch_sizes) if self._batch_sizes else None,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_wait_ms_p50": round(waits[len(waits) // 2] * 1000, 3) if waits else None,
+                "queue_wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else None,
+                "query_cache_hits": self._cache_hits,
+                "query_cache_misses": self._cache_misses,
+                "query_cache_hit_rate": round(self._cache_hits / lookups, 4) if lookups else None,
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService(
+                    settings.EMBEDDING_MODEL_NAME,
+                    backend=settings.EMBEDDING_BACKEND,
+                    model_file=settings.EMBEDDING_MODEL_FILE,
+                    max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                    max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+                    cache_size=settings.EMBEDDING_CACHE_SIZE,
+                )
+    return _service
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import threading
+
+from backend.config import settings
+from backend.services import shared_resources
+from backend.services.document_processor import DocumentProcessor
+from backend.services.embedding_service import get_embedding_service
+from backend.services.query_engine import QueryEngine
+
+logger = logging.getLogger(__name__)
+
+
+class EngineRegistry:
+    """
+    Holds one long-lived QueryEngine per connection string for the lifetime of the app,
+    so the schema, the cache and the model handles survive across requests.
+    """
+
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.warmup_error = None
+
+    def get(self, connection_string: str) -> QueryEngine:
+        engine = self._engines.get(connection_string)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(connection_string)
+                if engine is None:
+                    engine = QueryEngine(connection_string)
+                    self._engines[connection_string] = engine
+        return engine
+
+    async def get_async(self, connection_string: str) -> QueryEngine:
+        """
+        get() for the async routes: an engine that still has to be built (schema
+        reflection, index loading) is built in a worker thread, so the event loop and
+        the other requests, /api/ready and /metrics among them, keep being served.
+        """
+        engine = self._engines.get(connection_string)
+        if engine is None:
+            engine = await asyncio.to_thread(self.get, connection_string)
+        return engine
+
+    def warm_up(self, connection_string: str):
+        """
+        Loads the shared model and collection, brings the lexical index up to date with
+        the collection, and builds the engine (and its schema index) for the default
+        database, so the first user request doesn't pay for it. A SQL-only deployment
+        only builds the engine.
+        """
+        try:
+            if settings.EMBEDDINGS_ENABLED:
+                get_embedding_service().encode(["warm-up"])
+                shared_resources.get_document_collection().count()
+                added = DocumentProcessor().backfill_lexical_index()
+                if added:
+                    logger.info("Added %d stored chunks to the lexical index", added)
+            engine = self.get(connection_string)
+            if not engine.schema.get("error"):
+                engine.schema_index()
+            logger.info("Query engine for %s is warm", connection_string)
+        except Exception as e:
+            self.warmup_error = str(e)
+            logger.exception("Warm-up failed")
+        finally:
+            self._ready.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set() and self.warmup_error is None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "warmup_finished": self._ready.is_set(),
+            "warmup_error": self.warmup_error,
+            "engines": len(self._engines),
+        }
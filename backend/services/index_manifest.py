@@ -0,0 +1,151 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from backend.config import settings
+
+
+def chunk_id(source: str, chunk: str) -> str:
+    """Deterministic id of a chunk: the same text in the same source always maps to the same id."""
+    return hashlib.sha256(f"{source}\x00{chunk}".encode("utf-8")).hexdigest()[:32]
+
+
+def file_hash(source) -> str:
+    """Content hash of raw bytes or of a file on disk, read in blocks."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def chunking_key() -> str:
+    """Chunks depend on the chunker settings and the model; changing either re-indexes everything."""
+    return f"{settings.EMBEDDING_MODEL_NAME}:{settings.CHUNK_MAX_TOKENS}:{settings.CHUNK_OVERLAP_TOKENS}"
+
+
+class IndexManifest:
+    """
+    Per-source record of what is in the vector store: the content hash of the last
+    indexed version and the ids of its chunks. Every ingestion of a source gets a new
+    generation; chunks not touched by the new generation are stale and get deleted.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                content_hash TEXT,
+                chunking_key TEXT,
+                generation INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS source_chunks (
+                source TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (source, chunk_id)
+            );
+        """)
+        self._conn.commit()
+
+    def is_unchanged(self, source: str, content_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, chunking_key FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+        return row is not None and row == (content_hash, chunking_key())
+
+    def is_known(self, source: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sources WHERE source = ?", (source,)).fetchone() is not None
+
+    def begin(self, source: str) -> int:
+        """Starts a new generation for the source and returns it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sources (source) VALUES (?) ON CONFLICT(source) DO NOTHING", (source,)
+            )
+            self._conn.execute("UPDATE sources SET generation = generation + 1 WHERE source = ?", (source,))
+            self._conn.commit()
+            return self._conn.execute("SELECT generation FROM sources WHERE source = ?", (source,)).fetchone()[0]
+
+    def claim(self, source: str, ids: list, generation: int) -> list:
+        """
+        Moves the ids into the given generation. Returns one flag per id:
+        'new' (never indexed), 'kept' (already indexed by an earlier generation) or
+        'duplicate' (already seen in this generation).
+        """
+        states = []
+        with self._lock:
+            for chunk in ids:
+                row = self._conn.execute(
+                    "SELECT generation FROM source_chunks WHERE source = ? AND chunk_id = ?", (source, chunk)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO source_chunks (source, chunk_id, generation) VALUES (?, ?, ?)",
+                        (source, chunk, generation)
+                    )
+                    states.append('new')
+                elif row[0] == generation:
+                    states.append('duplicate')
+                else:
+                    self._conn.execute(
+                        "UPDATE source_chunks SET generation = ? WHERE source = ? AND chunk_id = ?",
+                        (generation, source, chunk)
+                    )
+                    states.append('kept')
+            self._conn.commit()
+        return states
+
+    def finish(self, source: str, generation: int, content_hash: str) -> list:
+        """Records the finished generation and returns the ids of stale chunks to delete."""
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT chunk_id FROM source_chunks WHERE source = ? AND generation != ?", (source, generation)
+            )]
+            self._conn.execute(
+                "DELETE FROM source_chunks WHERE source = ? AND generation != ?", (source, generation)
+            )
+            count = self._conn.execute(
+                "SELECT count(*) FROM source_chunks WHERE source = ?", (source,)
+            ).fetchone()[0]
+            self._conn.execute("""
+                UPDATE sources SET content_hash = ?, chunking_key = ?, chunk_count = ?, updated_at = ?
+                WHERE source = ?
+            """, (content_hash, chunking_key(), count, time.time(), source))
+            self._conn.commit()
+        return stale
+
+    def chunk_ids(self, source: str) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT chunk_id FROM source_chunks WHERE source = ?", (source,)
+            )]
+
+    def chunk_count(self, source: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT chunk_count FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_index_manifest() -> IndexManifest:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = IndexManifest(settings.INDEX_MANIFEST_PATH)
+    return _manifest
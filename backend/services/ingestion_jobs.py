@@ -0,0 +1,429 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.services.embedding_service import get_embedding_service
+from backend.services.document_processor import DocumentProcessor
+from backend.services.index_manifest import file_hash, get_index_manifest
+from backend.services.semantic_cache import get_semantic_cache
+from backend.services import metrics
+from backend.services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_FILE_STATES = ('completed', 'failed', 'unchanged')
+
+
+def _parse_to_spool(path: str, filename: str, chunks_path: str) -> int:
+    """
+    Runs in a worker process: streams one spooled upload through the chunker and
+    writes its chunks as JSON lines, never holding the whole document in memory.
+    """
+    count = 0
+    with open(chunks_path, 'w', encoding='utf-8') as out:
+        for chunk in DocumentProcessor.iter_document_chunks(path, filename, raise_errors=True):
+            out.write(json.dumps(chunk) + '\n')
+            count += 1
+    return count
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestionJobManager:
+    """
+    Background document ingestion.
+
+    Uploads are spooled to disk and the request returns immediately. A process pool
+    parses and chunks files in parallel; a single embedding thread batches chunks
+    across files so the model always sees full batches. Job and per-file progress is
+    kept in a local SQLite file, so status survives restarts and is visible to every
+    worker, and unfinished jobs of a dead process are resumed on startup.
+    """
+
+    def __init__(self, state_path: str, spool_dir: str, parse_workers: int, batch_size: int):
+        self.spool_dir = spool_dir
+        self.parse_workers = parse_workers
+        self.batch_size = batch_size
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(state_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                owner_pid INTEGER,
+                total_files INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT NOT NULL,
+                file_index INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                spool_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunks_total INTEGER,
+                chunks_indexed INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT,
+                error TEXT,
+                started_at REAL,
+                finished_at REAL,
+                PRIMARY KEY (job_id, file_index)
+            );
+        """)
+        self._conn.commit()
+
+        self._manifest = get_index_manifest()
+        self._chunk_queue = queue.Queue()
+        self._pool = None
+        self._embed_thread = None
+
+    def start(self):
+        self._pool = self._new_pool()
+        self._embed_thread = threading.Thread(target=self._embedding_loop, name="ingestion-embedder", daemon=True)
+        self._embed_thread.start()
+        self._resume()
+
+    def _new_pool(self):
+        # spawn, not fork: the parent holds model threads that must not be forked
+        return ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        self._chunk_queue.put(None)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._embed_thread is not None:
+            self._embed_thread.join(timeout=5)
+
+    def submit(self, uploads: list) -> str:
+        """
+        uploads is a list of (filename, file object). Files are spooled to disk and
+        processed in the background; the returned job id can be polled with status().
+        """
+        job_id = str(uuid.uuid4())
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+
+        files = []
+        for index, (filename, fileobj) in enumerate(uploads):
+            path = os.path.join(job_dir, f"{index}.upload")
+            with open(path, 'wb') as out:
+                shutil.copyfileobj(fileobj, out)
+            files.append((job_id, index, filename, path, 'queued'))
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, owner_pid, total_files, created_at) VALUES (?, 'processing', ?, ?, ?)",
+                (job_id, os.getpid(), len(files), time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files (job_id, file_index, filename, spool_path, status) VALUES (?, ?, ?, ?, ?)",
+                files
+            )
+            self._conn.commit()
+
+        if not files:
+            self._finish_job_if_done(job_id)
+        for job_id, index, filename, path, _ in files:
+            self._schedule_parse(job_id, index, filename, path)
+        return job_id
+
+    def status(self, job_id: str):
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT status, total_files, created_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._conn.execute("""
+                SELECT filename, status, chunks_total, chunks_indexed, chunks_embedded, error, started_at, finished_at
+                FROM job_files WHERE job_id = ? ORDER BY file_index
+            """, (job_id,)).fetchall()
+
+        status, total_files, created_at, finished_at = job
+        elapsed = (finished_at or time.time()) - created_at
+        files = []
+        for filename, file_status, chunks_total, chunks_indexed, chunks_embedded, error, started_at, file_finished_at in rows:
+            files.append({
+                "filename": filename,
+                "status": file_status,
+                "chunks_total": chunks_total,
+                "chunks_indexed": chunks_indexed,
+                "chunks_embedded": chunks_embedded,
+                "error": error,
+                "seconds": round((file_finished_at or time.time()) - started_at, 3) if started_at else None,
+            })
+        chunks_indexed = sum(f["chunks_indexed"] for f in files)
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total_files": total_files,
+            "processed_files": sum(1 for f in files if f["status"] in ('completed', 'unchanged')),
+            "unchanged_files": sum(1 for f in files if f["status"] == 'unchanged'),
+            "failed_files": sum(1 for f in files if f["status"] == 'failed'),
+            "chunks_total": sum(f["chunks_total"] or 0 for f in files),
+            "chunks_indexed": chunks_indexed,
+            "chunks_embedded": sum(f["chunks_embedded"] for f in files),
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(chunks_indexed / elapsed, 2) if elapsed > 0 else None,
+            "files": files,
+        }
+
+    def _resume(self):
+        """Picks up jobs whose owning process died before they finished."""
+        with self._lock:
+            jobs = self._conn.execute(
+                "SELECT job_id, owner_pid FROM jobs WHERE status = 'processing'"
+            ).fetchall()
+        for job_id, owner_pid in jobs:
+            # A live owner is still working on it; our own pid can only be a stale
+            # record from before a restart that reused it.
+            if owner_pid and owner_pid != os.getpid() and _process_alive(owner_pid):
+                continue
+            with self._lock:
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET owner_pid = ? WHERE job_id = ? AND owner_pid IS ?",
+                    (os.getpid(), job_id, owner_pid)
+                ).rowcount
+                self._conn.commit()
+                if not claimed:
+                    continue
+                files = self._conn.execute("""
+                    SELECT file_index, filename, spool_path FROM job_files
+                    WHERE job_id = ? AND status NOT IN ('completed', 'failed', 'unchanged')
+                """, (job_id,)).fetchall()
+            logger.info("Resuming ingestion job %s (%d files left)", job_id, len(files))
+            for index, filename, path in files:
+                if os.path.exists(path):
+                    self._update_file(job_id, index, chunks_indexed=0, chunks_embedded=0)
+                    self._schedule_parse(job_id, index, filename, path)
+                else:
+                    self._finish_file(job_id, index, error="Upload was lost before it could be processed")
+            if not files:
+                self._finish_job_if_done(job_id)
+
+    def _schedule_parse(self, job_id, index, filename, path):
+        content_hash = file_hash(path)
+        if self._manifest.is_unchanged(filename, content_hash):
+            # Same bytes as the indexed version: nothing to parse or embed
+            chunk_count = self._manifest.chunk_count(filename)
+            self._update_file(job_id, index, started_at=time.time(), content_hash=content_hash,
+                              chunks_total=chunk_count, chunks_indexed=chunk_count)
+            self._finish_file(job_id, index, status='unchanged')
+            return
+
+        chunks_path = path + ".chunks.jsonl"
+        self._update_file(job_id, index, status='parsing', started_at=time.time(), content_hash=content_hash)
+        try:
+            future = self._pool.submit(_parse_to_spool, path, filename, chunks_path)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge file); start a fresh pool for the next files
+            self._pool = self._new_pool()
+            future = self._pool.submit(_parse_to_spool, path, filename, chunks_path)
+        started = time.perf_counter()
+        future.add_done_callback(
+            lambda f: self._on_parsed(f, job_id, index, filename, chunks_path, content_hash, started)
+        )
+
+    def _on_parsed(self, future, job_id, index, filename, chunks_path, content_hash, started):
+        # Parsing runs in a worker process; its time (including the queue wait) is recorded here
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="parse")
+        try:
+            count = future.result()
+        except Exception as e:
+            self._finish_file(job_id, index, error=f"Parsing failed: {e}")
+            return
+        self._update_file(job_id, index, status='embedding', chunks_total=count)
+        self._chunk_queue.put((job_id, index, filename, chunks_path, count, content_hash))
+
+    def _embedding_loop(self):
+        processor = DocumentProcessor()
+        buffer = []
+        while True:
+            try:
+                # Wait briefly for more files before flushing a partial batch
+                item = self._chunk_queue.get(timeout=0.2 if buffer else None)
+            except queue.Empty:
+                self._flush_or_fail(processor, buffer)
+                buffer = []
+                continue
+            if item is None:
+                self._flush_or_fail(processor, buffer)
+                return
+
+            job_id, index, filename, chunks_path, count, content_hash = item
+            if any(entry[2] == filename for entry in buffer):
+                # A source has one open generation at a time: an earlier upload of the same
+                # name (still buffered) is finished before this one begins
+                self._flush_or_fail(processor, buffer)
+                buffer = []
+            try:
+                processor.begin_source(filename)
+                if count == 0:
+                    processor.finish_source(filename, content_hash)
+                    self._finish_file(job_id, index)
+                    continue
+                with open(chunks_path, encoding='utf-8') as f:
+                    for line in f:
+                        buffer.append((job_id, index, filename, content_hash, json.loads(line)))
+                        if len(buffer) >= self.batch_size:
+                            self._flush_or_fail(processor, buffer)
+                            buffer = []
+            except Exception as e:
+                # Unreadable or malformed chunks fail this file; the thread serves every other job
+                buffer = [b for b in buffer if b[:2] != (job_id, index)]
+                self._fail_file(processor, job_id, index, filename, f"Reading chunks failed: {e}")
+
+    def _flush_or_fail(self, processor, buffer):
+        """Flushes a batch; an error _flush does not handle fails the batch's files, not the thread."""
+        try:
+            self._flush(processor, buffer)
+        except Exception as e:
+            logger.exception("Embedding batch of %d chunks failed", len(buffer))
+            for job_id, index, filename in dict.fromkeys(entry[:3] for entry in buffer):
+                self._fail_file(processor, job_id, index, filename, f"Indexing failed: {e}")
+
+    def _fail_file(self, processor, job_id, index, filename, error: str):
+        try:
+            processor.abandon_source(filename)
+            self._finish_file(job_id, index, error=error)
+        except Exception:
+            logger.exception("Could not mark file %d of ingestion job %s as failed", index, job_id)
+
+    def _flush(self, processor, buffer):
+        """
+        Embeds one batch (possibly spanning several files) and stores it file by file.
+        Chunks already in the store are not embedded again.
+        """
+        if not buffer:
+            return
+        # Consecutive entries of the same file form one group
+        groups = []
+        start = 0
+        while start < len(buffer):
+            end = start
+            while end < len(buffer) and buffer[end][:2] == buffer[start][:2]:
+                end += 1
+            groups.append((start, end))
+            start = end
+
+        planned = []
+        texts_to_embed = []
+        for start, end in groups:
+            job_id, index, filename, _, _ = buffer[start]
+            chunks = [entry[4] for entry in buffer[start:end]]
+            try:
+                with span("plan_chunks"):
+                    ids, todo = processor.plan_chunks(chunks, filename)
+            except Exception as e:
+                processor.abandon_source(filename)
+                self._finish_file(job_id, index, error=f"Indexing failed: {e}")
+                continue
+            planned.append((start, end, [ids[i] for i in todo], [chunks[i] for i in todo], len(texts_to_embed)))
+            texts_to_embed.extend(chunks[i] for i in todo)
+
+        embeddings = None
+        if texts_to_embed:
+            try:
+                with span("embed_chunks"):
+                    embeddings = get_embedding_service().encode(texts_to_embed, batch_size=len(texts_to_embed))
+            except Exception as e:
+                for start, end, _, _, _ in planned:
+                    processor.abandon_source(buffer[start][2])
+                    self._finish_file(buffer[start][0], buffer[start][1], error=f"Embedding failed: {e}")
+                return
+
+        for start, end, ids, texts, offset in planned:
+            job_id, index, filename, content_hash, _ = buffer[start]
+            try:
+                if ids:
+                    processor.store_chunks(ids, texts, filename, embeddings[offset:offset + len(ids)])
+                self._record_indexed(processor, job_id, index, filename, content_hash, end - start, len(ids))
+            except Exception as e:
+                processor.abandon_source(filename)
+                self._finish_file(job_id, index, error=f"Indexing failed: {e}")
+
+    def _record_indexed(self, processor, job_id, index, filename, content_hash, count, embedded):
+        metrics.CHUNKS_INDEXED.inc(count)
+        with self._lock:
+            self._conn.execute("""
+                UPDATE job_files SET chunks_indexed = chunks_indexed + ?, chunks_embedded = chunks_embedded + ?
+                WHERE job_id = ? AND file_index = ?
+            """, (count, embedded, job_id, index))
+            self._conn.commit()
+            done = self._conn.execute(
+                "SELECT chunks_indexed >= chunks_total FROM job_files WHERE job_id = ? AND file_index = ?",
+                (job_id, index)
+            ).fetchone()[0]
+        if done:
+            processor.finish_source(filename, content_hash)
+            self._finish_file(job_id, index)
+
+    def _update_file(self, job_id, index, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE job_files SET {assignments} WHERE job_id = ? AND file_index = ?",
+                (*fields.values(), job_id, index)
+            )
+            self._conn.commit()
+
+    def _finish_file(self, job_id, index, error: str = None, status: str = None):
+        # A file finishes once; later batches of a failed file are dropped silently
+        status = 'failed' if error else (status or 'completed')
+        with self._lock:
+            finished = self._conn.execute("""
+                UPDATE job_files SET status = ?, error = ?, finished_at = ?
+                WHERE job_id = ? AND file_index = ? AND status NOT IN ('completed', 'failed', 'unchanged')
+            """, (status, error, time.time(), job_id, index)).rowcount
+            self._conn.commit()
+        if not finished:
+            return
+        if error:
+            logger.warning("Ingestion job %s, file %d: %s", job_id, index, error)
+        self._finish_job_if_done(job_id)
+
+    def _finish_job_if_done(self, job_id):
+        with self._lock:
+            states = [row[0] for row in self._conn.execute(
+                "SELECT status FROM job_files WHERE job_id = ?", (job_id,)
+            )]
+            if any(state not in TERMINAL_FILE_STATES for state in states):
+                return
+            if states and all(state == 'failed' for state in states):
+                status = 'failed'
+            elif 'failed' in states:
+                status = 'completed_with_errors'
+            else:
+                status = 'completed'
+            finished = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ? AND finished_at IS NULL",
+                (status, time.time(), job_id)
+            ).rowcount
+            self._conn.commit()
+        if not finished:
+            return
+        if 'completed' in states:
+            # Answers computed from the old document set are no longer valid
+            get_semantic_cache().bump_corpus_version()
+        shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
@@ -0,0 +1,165 @@
+import re
+import sqlite3
+import threading
+
+from backend.config import settings
+from backend.services.query_router import DOCUMENT_TERMS, STOPWORDS
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+# A word mixing letters and digits, like an invoice number or a product code
+_CODE = re.compile(r"(?=.*\d)(?=.*[^\W\d])")
+
+
+# Question wording that says nothing about the content being looked for
+LEXICAL_STOPWORDS = STOPWORDS | DOCUMENT_TERMS | frozenset({
+    "about", "how", "much", "many", "can", "could", "should", "would", "i", "we", "you",
+    "there", "any", "tell", "find", "get", "has", "have", "if", "not", "no",
+})
+
+
+def _terms(query: str) -> list:
+    """
+    The searchable terms of a question, one per whitespace-separated word. A word
+    the tokenizer splits ("INV-2041") stays together as a phrase.
+    """
+    terms = []
+    for word in query.lower().split():
+        parts = _TERM.findall(word)
+        if not parts or (len(parts) == 1 and parts[0] in LEXICAL_STOPWORDS):
+            continue
+        term = " ".join(parts)
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def match_expression(query: str):
+    """
+    FTS5 query for a free-text question: every term quoted, so that punctuation
+    and FTS operators in the question are taken literally, OR-ed together and left
+    to BM25 to rank. None if the question has no usable term.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def is_keyword_query(query: str, max_terms: int) -> bool:
+    """Short questions and questions carrying a code or id ("INV-2041") are keyword lookups."""
+    terms = _terms(query)
+    return 0 < len(terms) <= max_terms or any(_CODE.search(term) for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: list, k: int, rrf_k: int) -> list:
+    """
+    Merges ranked lists of ids: each id scores sum(1 / (rrf_k + rank)) over the
+    lists it appears in. Returns the k best (id, score) pairs.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda pair: -pair[1])[:k]
+
+
+class LexicalIndex:
+    """
+    BM25 keyword index over the same chunks as the vector store, in a local SQLite
+    FTS5 file. It finds exact terms (ids, names, codes) that dense similarity
+    misses, and supports the same source and ingestion-date filters.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                source TEXT NOT NULL,
+                ingested_at REAL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source, ingested_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='rowid', tokenize='unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+        """)
+        self._conn.commit()
+
+    def add(self, ids: list, texts: list, source: str, ingested_at: float):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (chunk_id, source, ingested_at, text) VALUES (?, ?, ?, ?)",
+                [(chunk, source, ingested_at, text) for chunk, text in zip(ids, texts)]
+            )
+            self._conn.commit()
+
+    def delete(self, ids: list):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk,) for chunk in ids])
+            self._conn.commit()
+
+    def missing(self, ids: list) -> list:
+        """The ids that are not in the index."""
+        if not ids:
+            return []
+        with self._lock:
+            present = set()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                present.update(row[0] for row in self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({', '.join('?' * len(batch))})", batch
+                ))
+        return [chunk for chunk in ids if chunk not in present]
+
+    def search(self, query: str, k: int, sources: list = None, since: float = None, until: float = None) -> list:
+        """The k best BM25 matches as dicts of chunk_id, source, text and score (higher is better)."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        sql = """
+            SELECT c.chunk_id, c.source, c.text, -bm25(chunks_fts) AS score
+            FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+            WHERE chunks_fts MATCH ?
+        """
+        params = [expression]
+        if sources:
+            sql += f" AND c.source IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        if since is not None:
+            sql += " AND c.ingested_at >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND c.ingested_at <= ?"
+            params.append(until)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"chunk_id": row[0], "source": row[1], "text": row[2], "score": row[3]} for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LexicalIndex(settings.LEXICAL_INDEX_PATH)
+    return _index
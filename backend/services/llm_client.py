@@ -0,0 +1,250 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from backend.config import settings
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMTimeoutError(Exception):
+    pass
+
+
+class LLMTransientError(Exception):
+    """A provider failure worth a retry (raised by FakeProvider's injected failures)."""
+
+
+@functools.lru_cache(maxsize=None)
+def _transient_errors() -> tuple:
+    """Provider errors worth a retry; looked up on the first failure, google.api_core is slow to import."""
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return (LLMTransientError,)
+    return (
+        LLMTransientError,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+
+
+class LLMResponse(NamedTuple):
+    text: str
+    prompt_tokens: int
+    output_tokens: int
+    latency_ms: float
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) when the provider reports none."""
+    return max(1, len(text) // 4)
+
+
+class GeminiProvider:
+    def __init__(self, model_name: str):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str):
+        response = await self.model.generate_content_async(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and usage.prompt_token_count:
+            return response.text, usage.prompt_token_count, usage.candidates_token_count
+        return response.text, estimate_tokens(prompt), estimate_tokens(response.text)
+
+
+class FakeProvider:
+    """
+    Offline stand-in for benchmarks, tests and local runs: answers after a fixed
+    latency. responses is a list of (pattern, answer) pairs; the first pattern
+    found in the question of a prompt answers with its answer, expanded with the
+    pattern's groups (\\1), and prompts of several numbered questions get a JSON
+    list of answers. Other questions get a query over the first table of the
+    schema, and other prompts canned follow-up questions. The first failures calls
+    raise LLMTransientError after their latency. calls, in_flight and
+    max_in_flight count the calls that reached the provider.
+    """
+
+    def __init__(self, latency_seconds: float, responses: list = (), failures: int = 0):
+        self.latency_seconds = latency_seconds
+        self.responses = [(re.compile(pattern, re.IGNORECASE), answer) for pattern, answer in responses]
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @classmethod
+    def from_file(cls, latency_seconds: float, path: str):
+        """responses from a JSON list of [pattern, answer] pairs."""
+        if not path:
+            return cls(latency_seconds)
+        with open(path, encoding="utf-8") as f:
+            return cls(latency_seconds, json.load(f))
+
+    def _canned(self, question: str):
+        for pattern, answer in self.responses:
+            match = pattern.search(question)
+            if match:
+                return match.expand(answer)
+        return None
+
+    async def generate(self, prompt: str):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency_seconds)
+        finally:
+            self.in_flight -= 1
+        if self.calls <= self.failures:
+            raise LLMTransientError(f"Injected failure {self.calls} of {self.failures}")
+        table = re.search(r"CREATE TABLE (\w+)", prompt)
+        fallback = f"SELECT * FROM {table.group(1)} LIMIT 10" if table else "SELECT 1"
+        question = re.search(r'Question: "(.*)"', prompt)
+        # Batched SQL prompts number their questions and expect a JSON list back
+        batched = re.findall(r'Question \d+: "(.*)"', prompt)
+        if question:
+            text = self._canned(question.group(1)) or fallback
+        elif batched:
+            text = json.dumps([self._canned(question) or fallback for question in batched])
+        elif "follow-up" in prompt:
+            text = json.dumps(["What is the total?", "How does it compare to last year?", "Which one is the largest?"])
+        else:
+            text = fallback
+        return text, estimate_tokens(prompt), estimate_tokens(text)
+
+
+class LLMClient:
+    """
+    Async access to the generation model. Every call has one deadline, covering the
+    wait for a slot, every attempt and the backoff between them; within it,
+    transient provider errors are retried with exponential backoff. At most
+    max_concurrency calls are in flight, and concurrent calls with the same prompt
+    share one upstream request.
+    """
+
+    def __init__(self, provider, max_concurrency: int, timeout_seconds: float,
+                 max_retries: int, backoff_seconds: float):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # Semaphore and in-flight map belong to the event loop that created them
+        self._loop = None
+        self._semaphore = None
+        self._inflight = {}
+        self._stats = {"calls": 0, "upstream_calls": 0, "coalesced": 0, "retries": 0, "timeouts": 0, "errors": 0,
+                       "prompt_tokens": 0, "output_tokens": 0}
+        self._latencies = []
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+
+    async def generate(self, prompt: str, timeout_seconds: float = None) -> LLMResponse:
+        self._bind_loop()
+        self._stats["calls"] += 1
+        key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._generate_with_retries(prompt, timeout_seconds or self.timeout_seconds))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _generate_with_retries(self, prompt: str, timeout_seconds: float) -> LLMResponse:
+        loop = asyncio.get_running_loop()
+        # One deadline for the whole call: the wait for a slot, every attempt and the backoff between them
+        deadline = loop.time() + timeout_seconds
+        attempt = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(0, deadline - loop.time()))
+                try:
+                    self._stats["upstream_calls"] += 1
+                    started = time.perf_counter()
+                    text, prompt_tokens, output_tokens = await asyncio.wait_for(
+                        self.provider.generate(prompt), max(0, deadline - loop.time())
+                    )
+                finally:
+                    self._semaphore.release()
+                latency = time.perf_counter() - started
+                self._latencies = self._latencies[-999:] + [latency]
+                self._stats["prompt_tokens"] += prompt_tokens
+                self._stats["output_tokens"] += output_tokens
+                metrics.LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+                metrics.LLM_TOKENS.inc(output_tokens, kind="output")
+                return LLMResponse(text, prompt_tokens, output_tokens, round(latency * 1000, 1))
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                error = LLMTimeoutError(f"The language model did not answer within {timeout_seconds:g}s")
+            except _transient_errors() as e:
+                error = e
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            attempt += 1
+            delay = self.backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            # A retry that could not finish before the deadline is not started
+            if attempt > self.max_retries or loop.time() + delay >= deadline:
+                self._stats["errors"] += 1
+                raise error
+            self._stats["retries"] += 1
+            logger.warning("LLM call failed (%s), retry %d in %.2fs", error, attempt, delay)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return dict(
+            self._stats,
+            provider=type(self.provider).__name__,
+            max_concurrency=self.max_concurrency,
+            in_flight=len(self._inflight),
+            latency_ms_p50=round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            latency_ms_p95=round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if settings.LLM_PROVIDER == "gemini":
+                    provider = GeminiProvider(settings.GENERATION_MODEL_NAME)
+                elif settings.LLM_PROVIDER == "fake":
+                    provider = FakeProvider.from_file(settings.LLM_FAKE_LATENCY_MS / 1000, settings.LLM_FAKE_RESPONSES_PATH)
+                else:
+                    raise ValueError(f"Unknown LLM_PROVIDER: {settings.LLM_PROVIDER}")
+                _client = LLMClient(
+                    provider,
+                    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    backoff_seconds=settings.LLM_RETRY_BACKOFF_SECONDS,
+                )
+    return _client
@@ -0,0 +1,213 @@
+"""
+Process-wide metrics: counters and histograms rendered in the Prometheus text
+format at /metrics and summarized as JSON for the dashboard, plus timing spans
+around the stages of a request.
+
+A span observes the stage_seconds histogram and, while a request collects its
+timings (collect_timings), adds its duration to that request's breakdown. The
+breakdown lives in a context variable, so it follows the request into
+asyncio.to_thread and gathered tasks. Every worker process has its own metrics.
+"""
+import bisect
+import collections
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-millisecond) up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 10000, 100000)
+# Recent observations kept per label set for the percentiles of the JSON summary
+_RESERVOIR_SIZE = 1024
+
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def total(self, **labels) -> float:
+        return sum(value for key, value in self.values().items()
+                   if all(key[self.labelnames.index(name)] == wanted for name, wanted in labels.items()))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value!r}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._series = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+                self._recent[key] = collections.deque(maxlen=_RESERVOIR_SIZE)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+            self._recent[key].append(value)
+
+    def summary(self, scale: float = 1.0, digits: int = 3) -> dict:
+        """Per label set: count, mean and recent p50/p95/p99, multiplied by scale (1000 for ms)."""
+        with self._lock:
+            snapshot = {key: (series[-2], series[-1], list(self._recent[key])) for key, series in self._series.items()}
+        result = {}
+        for key, (total, count, recent) in snapshot.items():
+            label = "/".join(str(value) for value in key) or "all"
+            result[label] = {
+                "count": count,
+                "mean": round(total / count * scale, digits) if count else None,
+                "p50": round(_percentile(recent, 0.50) * scale, digits) if recent else None,
+                "p95": round(_percentile(recent, 0.95) * scale, digits) if recent else None,
+                "p99": round(_percentile(recent, 0.99) * scale, digits) if recent else None,
+            }
+        return result
+
+    def totals(self, **labels) -> tuple:
+        """(sum, count) over the label sets matching labels."""
+        with self._lock:
+            matching = [series for key, series in self._series.items()
+                        if all(key[self.labelnames.index(name)] == wanted for name, wanted in labels.items())]
+            return sum(series[-2] for series in matching), sum(series[-1] for series in matching)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, {'le': f'{bound:g}'})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, {'le': '+Inf'})} {values[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {values[-2]!r}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {values[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("nlq_stage_seconds", "Time spent in each stage of query answering and ingestion", ("stage",))
+QUERIES = Counter("nlq_queries_total", "Answered questions by route and cache outcome", ("query_type", "cache"))
+QUERY_SECONDS = Histogram("nlq_query_seconds", "End-to-end time of process_query", ("query_type", "cache"))
+HTTP_SECONDS = Histogram("nlq_http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+LLM_TOKENS = Counter("nlq_llm_tokens_total", "Tokens sent to and received from the generation model", ("kind",))
+SQL_ROWS = Histogram("nlq_sql_rows_returned", "Rows in the first page of SQL answers", buckets=ROW_BUCKETS)
+CHUNKS_INDEXED = Counter("nlq_chunks_indexed_total", "Document chunks stored in the indexes")
+CHUNKS_EMBEDDED = Counter("nlq_chunks_embedded_total", "Document chunks embedded (new content only)")
+TABLE_ROWS = Counter("nlq_table_rows_loaded_total", "Rows loaded into SQL tables from uploads")
+
+REGISTRY = (STAGE_SECONDS, QUERIES, QUERY_SECONDS, HTTP_SECONDS, LLM_TOKENS, SQL_ROWS,
+            CHUNKS_INDEXED, CHUNKS_EMBEDDED, TABLE_ROWS)
+
+
+@contextmanager
+def span(stage: str):
+    """Times a stage; the duration goes to STAGE_SECONDS and the current request's breakdown."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
+
+
+@contextmanager
+def collect_timings():
+    """Collects the spans of the enclosed work as {stage: milliseconds}."""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def detach_timings():
+    """Stops the current context from reporting into a request's breakdown (for background tasks)."""
+    _timings.set(None)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    """The numbers the dashboard charts."""
+    queries = QUERIES.values()
+    total = sum(queries.values())
+    hits = sum(value for (_, cache), value in queries.items() if cache != "miss")
+    by_type = collections.defaultdict(float)
+    for (query_type, _), value in queries.items():
+        by_type[query_type] += value
+    indexing_seconds = sum(STAGE_SECONDS.totals(stage=stage)[0] for stage in ("embed_chunks", "store_chunks"))
+    chunks_indexed = CHUNKS_INDEXED.total()
+    return {
+        "queries": {
+            "total": int(total),
+            "by_type": {key: int(value) for key, value in by_type.items()},
+            "cache_hit_rate": round(hits / total, 4) if total else None,
+            "latency_ms": QUERY_SECONDS.summary(scale=1000),
+        },
+        "stages_ms": STAGE_SECONDS.summary(scale=1000),
+        "llm_tokens": {kind: int(value) for (kind,), value in LLM_TOKENS.values().items()},
+        "sql_rows_returned": SQL_ROWS.summary().get("all"),
+        "ingestion": {
+            "chunks_indexed": int(chunks_indexed),
+            "chunks_embedded": int(CHUNKS_EMBEDDED.total()),
+            "chunks_per_second": round(chunks_indexed / indexing_seconds, 1) if indexing_seconds else None,
+            "table_rows_loaded": int(TABLE_ROWS.total()),
+        },
+    }
@@ -1,60 +1,539 @@
-import re
+import asyncio
+import hashlib
+import json
+import threading
+import time
 from cachetools import TTLCache
-from sqlalchemy import text
+from sqlalchemy import String
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
-import google.generativeai as genai
 
 from backend.config import settings
-from backend.models.database import SessionLocal, Document
+from backend.services.db_engines import get_engine, read_only_connection
+from backend.services.sql_guard import SQLGuardError, guard_sql
 from backend.services.schema_discovery import SchemaDiscovery
-
-import chromadb
-
-# Configure the generative AI model with the key from settings
-genai.configure(api_key=settings.GOOGLE_API_KEY)
+from backend.services.schema_index import SchemaIndex, get_schema_index, schema_to_ddl
+from backend.services.query_router import route_query
+from backend.services.sql_templates import extract_literals, get_sql_template_store
+from backend.services import shared_resources
+from backend.services.embedding_service import get_embedding_service
+from backend.services.lexical_index import get_lexical_index, is_keyword_query, reciprocal_rank_fusion
+from backend.services.llm_client import get_llm_client
+from backend.services.query_history import get_query_history
+from backend.services import metrics
+from backend.services.metrics import span
+from backend.services.semantic_cache import get_semantic_cache, normalize_query
+from backend.services.result_pages import (
+    fetch_first_page, fetch_page, iter_rows, json_default, keyset_after, read_token, sign_token, to_row_dicts
+)
 
 class QueryEngine:
     def __init__(self, connection_string: str):
+        self.connection_string = connection_string
         self.schema_discovery = SchemaDiscovery()
         self.schema = self.schema_discovery.analyze_database(connection_string)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.schema_fingerprint = self.schema_discovery.get_fingerprint(connection_string)
         self.cache = TTLCache(maxsize=100, ttl=300)
-        self.gen_model = genai.GenerativeModel('models/gemini-pro-latest')
-        
-        # Initialize ChromaDB client and get the collection
-        self.chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.chroma_client.get_collection(name="documents")
+        # The engine is shared between request threads and TTLCache is not thread-safe
+        self.cache_lock = threading.Lock()
+        self.llm = get_llm_client()
+        # Follow-up suggestions are generated after the answer is returned; the tasks
+        # are kept here until the client fetches them. Only touched from the event loop.
+        self.suggestions = TTLCache(maxsize=200, ttl=300)
+
+        # The embedding model and the ChromaDB collection are process-wide and shared.
+        # A SQL-only deployment (EMBEDDINGS_ENABLED=false) has neither, and no document search.
+        if settings.EMBEDDINGS_ENABLED:
+            self.embeddings = get_embedding_service()
+            self.collection = shared_resources.get_document_collection()
+            self.lexical = get_lexical_index()
+        else:
+            self.embeddings = self.collection = self.lexical = None
+
+        # Near-duplicate questions are answered from the on-disk semantic cache, which is
+        # shared by all workers. The scope keeps answers of different databases apart.
+        self.semantic_cache = get_semantic_cache()
+        self.cache_scope = hashlib.sha1(connection_string.encode("utf-8")).hexdigest()
+        # Question shapes seen before are answered from learned SQL templates
+        self.sql_templates = get_sql_template_store()
+        # Every answer is logged; the most frequent questions are replayed by the CacheWarmer
+        self.history = get_query_history()
+        # Bumped whenever cached answers are dropped (new schema or new rows)
+        self.answers_generation = 0
+
+    def refresh_schema(self) -> bool:
+        """
+        Re-validates the cached schema (cheap when nothing changed). Returns True and
+        drops cached answers if the schema fingerprint moved.
+        """
+        self.schema = self.schema_discovery.analyze_database(self.connection_string)
+        fingerprint = self.schema_discovery.get_fingerprint(self.connection_string)
+        if fingerprint == self.schema_fingerprint:
+            return False
+        self.schema_fingerprint = fingerprint
+        with self.cache_lock:
+            self.cache.clear()
+        self.answers_generation += 1
+        if fingerprint is not None:
+            self.sql_templates.purge(self.cache_scope, fingerprint)
+        return True
+
+    def invalidate_answers(self):
+        """Called after rows of the database were written; cached answers may be out of date."""
+        with self.cache_lock:
+            self.cache.clear()
+        self.semantic_cache.clear(self.cache_scope)
+        self.answers_generation += 1
+
+    async def process_query(self, user_query: str, result_format: str = "rows", document_options: dict = None) -> dict:
+        """
+        Answers a question. SQL results are capped at SQL_MAX_ROWS rows; a truncated
+        result carries a next_token for fetch_result_page. result_format is "rows"
+        (a list of dicts) or "columnar" (column names once, rows as arrays).
+        document_options (k and filters, see search_documents) narrow document
+        retrieval; such answers bypass the semantic cache.
+        Blocking work runs in threads so the event loop only waits on the LLM.
+        """
+        started = time.perf_counter()
+        response = await self._answer(user_query, result_format, document_options)
+        cache = "miss"
+        if response["cache_hit"]:
+            cache = "semantic" if "cache_similarity" in response else "exact"
+        latency = time.perf_counter() - started
+        metrics.QUERIES.inc(query_type=response["query_type"], cache=cache)
+        metrics.QUERY_SECONDS.observe(latency, query_type=response["query_type"], cache=cache)
+        self.history.record(self.cache_scope, user_query, response["query_type"], response["result"], latency, cache)
+        return response
+
+    async def warm(self, user_query: str) -> dict:
+        """
+        Answers a question only to fill the caches (answers, embeddings, SQL
+        templates): it is neither logged nor counted, and gets no follow-up suggestions.
+        """
+        return await self._answer(user_query, "rows", None, suggest=False)
 
-    def process_query(self, user_query: str) -> dict:
-        if user_query in self.cache:
-            return {"result": self.cache[user_query], "cache_hit": True}
+    async def _answer(self, user_query: str, result_format: str, document_options: dict, suggest: bool = True) -> dict:
+        with span("schema_refresh"):
+            await asyncio.to_thread(self.refresh_schema)
 
-        query_type = self.classify_query(user_query)
+        cache_key = self._cache_key(user_query, document_options)
+        with self.cache_lock:
+            cached = self.cache.get(cache_key)
+        if cached is not None:
+            result, query_type = cached
+            return {"result": self.format_result(result, result_format), "cache_hit": True, "query_type": query_type}
+
+        normalized_query = normalize_query(user_query)
+        query_embedding = None
+        semantic_hit = None
+        if self.embeddings is not None and not document_options:
+            with span("embed_query"):
+                query_embedding = await asyncio.to_thread(self.embeddings.encode_query, normalized_query)
+            with span("semantic_cache"):
+                semantic_hit = await asyncio.to_thread(
+                    self.semantic_cache.lookup, self.cache_scope, normalized_query, query_embedding,
+                    self.schema_fingerprint, self._literal_terms(user_query)
+                )
+        if semantic_hit:
+            with self.cache_lock:
+                self.cache[cache_key] = (semantic_hit["result"], semantic_hit["query_type"])
+            return {
+                "result": self.format_result(semantic_hit["result"], result_format),
+                "cache_hit": True,
+                "query_type": semantic_hit["query_type"],
+                "cache_similarity": semantic_hit["similarity"],
+            }
+
+        with span("classify"):
+            query_type = await asyncio.to_thread(self.classify_query, user_query)
         
+        # The cache lookup embedding doubles as the search embedding; without a lookup
+        # it is only computed if a dense search or the schema pruning needs it
         if query_type == 'sql':
-            result = self.generate_and_run_sql(user_query)
+            result = await self.generate_and_run_sql(user_query, query_embedding)
+        elif query_type == 'hybrid':
+            result = await self.hybrid_search(user_query, query_embedding, document_options)
         else:
-            result = self.search_documents(user_query)
+            result = await self.search_documents(user_query, query_embedding, document_options)
         
-        self.cache[user_query] = result
+        with self.cache_lock:
+            self.cache[cache_key] = (result, query_type)
+        if not result.get("error") and query_embedding is not None:
+            with span("cache_store"):
+                await asyncio.to_thread(
+                    self.semantic_cache.store, self.cache_scope, normalized_query, query_embedding, result, query_type,
+                    self.schema_fingerprint, depends_on_documents=query_type != 'sql'
+                )
+
+        # Follow-up suggestions are off the critical path, see get_suggestions
+        if suggest:
+            self._start_suggestions(user_query, result)
+
+        return {
+            "result": self.format_result(result, result_format),
+            "cache_hit": False,
+            "query_type": query_type,
+        }
+
+    async def iter_batch_lines(self, questions: list, result_format: str = "rows", document_options: dict = None):
+        """
+        Answers a batch of questions as NDJSON: one line per question, in their order,
+        each sent as soon as it and the ones before it are answered. A line carries the
+        question's index, a status ("ok" or "error") and the fields of process_query;
+        a repeated question is answered once and its copies point to the first
+        ("duplicate_of"). No follow-up suggestions are generated for batches.
+        """
+        loop = asyncio.get_running_loop()
+        answers = {}
+        first_index = {}
+        for index, question in enumerate(questions):
+            if question not in answers:
+                answers[question] = loop.create_future()
+                first_index[question] = index
+        pipeline = asyncio.create_task(self._answer_batch(answers, document_options))
+        try:
+            for index, question in enumerate(questions):
+                try:
+                    response = await asyncio.shield(answers[question])
+                except Exception as e:
+                    response = {"result": {"error": f"An error occurred: {str(e)}"}, "cache_hit": False, "query_type": None}
+                item = {
+                    "index": index,
+                    "query": question,
+                    "status": "error" if response["result"].get("error") else "ok",
+                    **response,
+                    "result": self.format_result(response["result"], result_format),
+                }
+                if first_index[question] != index:
+                    item["duplicate_of"] = first_index[question]
+                yield json.dumps(item, default=json_default) + "\n"
+        finally:
+            # The client may leave before the end
+            pipeline.cancel()
+
+    async def _answer_batch(self, answers: dict, document_options: dict):
+        """
+        Resolves the future of every question in answers with its response. Cached
+        answers come first; the other questions are embedded in one pass, document
+        questions share one dense search, and SQL questions without a learned template
+        share LLM prompts (see _plan_sql_batch). Each result is set as soon as it exists.
+        """
+        started = time.perf_counter()
+
+        def resolve(question, result, query_type, cache="miss", similarity=None):
+            response = {"result": result, "cache_hit": cache != "miss", "query_type": query_type}
+            if similarity is not None:
+                response["cache_similarity"] = similarity
+            latency = time.perf_counter() - started
+            metrics.QUERIES.inc(query_type=query_type, cache=cache)
+            metrics.QUERY_SECONDS.observe(latency, query_type=query_type, cache=cache)
+            self.history.record(self.cache_scope, question, query_type, result, latency, cache)
+            answers[question].set_result(response)
+
+        try:
+            with span("schema_refresh"):
+                await asyncio.to_thread(self.refresh_schema)
+            pending = []
+            for question in answers:
+                with self.cache_lock:
+                    cached = self.cache.get(self._cache_key(question, document_options))
+                if cached is not None:
+                    resolve(question, cached[0], cached[1], cache="exact")
+                else:
+                    pending.append(question)
+
+            embeddings = {}
+            if self.embeddings is not None and pending:
+                normalized = [normalize_query(question) for question in pending]
+                with span("embed_query"):
+                    vectors = await asyncio.to_thread(self.embeddings.encode_queries, normalized)
+                embeddings = dict(zip(pending, vectors))
+                if not document_options:
+                    with span("semantic_cache"):
+                        hits = await asyncio.to_thread(self._semantic_lookups, pending, normalized, vectors)
+                    for question, hit in hits.items():
+                        with self.cache_lock:
+                            self.cache[question] = (hit["result"], hit["query_type"])
+                        resolve(question, hit["result"], hit["query_type"], cache="semantic", similarity=hit["similarity"])
+                    pending = [question for question in pending if question not in hits]
+
+            with span("classify"):
+                routes = await asyncio.to_thread(lambda: {question: self.classify_query(question) for question in pending})
+            document_questions = {
+                question: position
+                for position, question in enumerate(question for question in pending if routes[question] != 'sql')
+            }
+            dense_search = None
+            if document_questions:
+                _, candidates, filters = self._search_options(document_options)
+                dense_search = asyncio.create_task(asyncio.to_thread(
+                    self._dense_search_many, [embeddings[question] for question in document_questions], candidates, filters
+                ))
+            sql_plan = asyncio.create_task(
+                self._plan_sql_batch([question for question in pending if routes[question] != 'document'], embeddings)
+            )
+
+            async def search(question):
+                try:
+                    dense = (await dense_search)[document_questions[question]]
+                except Exception as e:
+                    return {"error": f"An error occurred during document search: {str(e)}"}
+                return await self.search_documents(question, embeddings[question], document_options, dense_matches=dense)
+
+            async def finish(question):
+                query_type = routes[question]
+                try:
+                    if query_type == 'sql':
+                        result = await self._batched_sql(question, sql_plan)
+                    elif query_type == 'document':
+                        result = await search(question)
+                    else:
+                        result = self._merge_hybrid(*await asyncio.gather(self._batched_sql(question, sql_plan), search(question)))
+                    with self.cache_lock:
+                        self.cache[self._cache_key(question, document_options)] = (result, query_type)
+                    if not result.get("error") and not document_options and question in embeddings:
+                        with span("cache_store"):
+                            await asyncio.to_thread(
+                                self.semantic_cache.store, self.cache_scope, normalize_query(question),
+                                embeddings[question], result, query_type, self.schema_fingerprint,
+                                depends_on_documents=query_type != 'sql'
+                            )
+                except Exception as e:
+                    answers[question].set_exception(e)
+                    return
+                resolve(question, result, query_type)
+
+            await asyncio.gather(*(finish(question) for question in pending))
+        except Exception as e:
+            for future in answers.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    def _semantic_lookups(self, questions: list, normalized: list, embeddings) -> dict:
+        hits = {}
+        for question, normalized_query, query_embedding in zip(questions, normalized, embeddings):
+            hit = self.semantic_cache.lookup(
+                self.cache_scope, normalized_query, query_embedding, self.schema_fingerprint, self._literal_terms(question)
+            )
+            if hit:
+                hits[question] = hit
+        return hits
+
+    async def _plan_sql_batch(self, questions: list, embeddings: dict) -> dict:
+        """
+        Answers what it can from learned templates and starts one LLM call per group
+        of the other questions, grouped by the tables they need. Maps every question
+        to its answer or to the task generating its SQL.
+        """
+        if not questions:
+            return {}
+        if self.schema.get("error"):
+            return dict.fromkeys(questions, {"error": f"Invalid database schema: {self.schema.get('error')}"})
+        with span("template"):
+            templated = await asyncio.gather(
+                *(asyncio.to_thread(self._answer_from_template, question) for question in questions)
+            )
+        plan = {question: result for question, result in zip(questions, templated) if result is not None}
+        remaining = [question for question in questions if question not in plan]
+        with span("schema_context"):
+            tables = await asyncio.to_thread(
+                lambda: {question: self.schema_context(question, embeddings.get(question))[1] for question in remaining}
+            )
+        remaining.sort(key=lambda question: sorted(tables[question]))
+        size = settings.BATCH_SQL_QUESTIONS_PER_PROMPT
+        for start in range(0, len(remaining), size):
+            group = remaining[start:start + size]
+            plan.update(dict.fromkeys(group, asyncio.create_task(self._generate_sql_group(group, tables))))
+        return plan
+
+    async def _generate_sql_group(self, questions: list, tables: dict) -> dict:
+        """
+        Generates the SQL of several questions with one prompt over the union of their
+        tables. Maps each question to (sql, generation), or to an error. If the answer
+        is not one statement per question, every question gets its own prompt.
+        """
+        group_tables = list(dict.fromkeys(table for question in questions for table in tables[question]))
+        schema_ddl = schema_to_ddl(self.schema, group_tables)
+        if len(questions) == 1:
+            prompt = self._sql_prompt(schema_ddl, questions[0])
+        else:
+            listed = "\n        ".join(f'Question {i}: "{question}"' for i, question in enumerate(questions, 1))
+            prompt = f"""
+        Given the following database schema:
+        {schema_ddl}
+
+        Generate a single, executable SQL query to answer each of the following questions. Return them as a JSON list of strings, one query per question and in the same order. Do not include any other text or markdown.
+
+        {listed}
+
+        JSON List:
+        """
+        try:
+            with span("llm"):
+                response = await self.llm.generate(prompt)
+        except Exception as e:
+            return dict.fromkeys(questions, {"error": f"An error occurred: {str(e)}"})
+        generation = self._generation(response, group_tables, len(questions))
+        if len(questions) == 1:
+            return {questions[0]: (response.text.strip().replace('```sql', '').replace('```', ''), generation)}
+
+        try:
+            statements = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
+        except json.JSONDecodeError:
+            statements = None
+        if (not isinstance(statements, list) or len(statements) != len(questions)
+                or not all(isinstance(statement, str) for statement in statements)):
+            generated = await asyncio.gather(*(self._generate_sql_group([question], tables) for question in questions))
+            return {question: result[question] for question, result in zip(questions, generated)}
+        return {question: (statement.strip(), generation) for question, statement in zip(questions, statements)}
+
+    async def _batched_sql(self, question: str, sql_plan) -> dict:
+        """The SQL answer of a batched question; its statement runs as soon as its prompt returned."""
+        planned = (await sql_plan)[question]
+        if isinstance(planned, dict):
+            return planned
+        generated = (await planned)[question]
+        if isinstance(generated, dict):
+            return generated
+        sql_query, generation = generated
+        return await self._run_generated_sql(question, sql_query, generation)
+
+    @staticmethod
+    def _cache_key(user_query: str, document_options: dict):
+        if document_options:
+            return user_query, json.dumps(document_options, sort_keys=True)
+        return user_query
+
+    @staticmethod
+    def _literal_terms(user_query: str) -> tuple:
+        """The question's literals in normalized form; near-duplicate cache hits must share them."""
+        literals, _ = extract_literals(user_query)
+        return tuple(normalize_query(literal["value"]) for literal in literals)
 
-        # Generate follow-up suggestions
+    def _start_suggestions(self, user_query: str, result: dict):
+        async def suggest():
+            # Runs after the answer was returned; its time is not part of the request's breakdown
+            metrics.detach_timings()
+            try:
+                return await self._get_followup_suggestions(user_query, result)
+            except Exception:
+                return [] # Don't fail anything if suggestions fail
+
+        task = asyncio.create_task(suggest())
+        self.suggestions[user_query] = task
+        return task
+
+    async def get_suggestions(self, user_query: str) -> list:
+        """
+        Follow-up questions for an answered query. Waits for the generation started
+        when the answer was computed, or starts one from the cached answer (which
+        may come from another worker through the semantic cache).
+        """
+        task = self.suggestions.get(user_query)
+        if task is None:
+            with self.cache_lock:
+                cached = self.cache.get(user_query)
+            if cached is None:
+                # Without embeddings there is no semantic cache to find it in
+                if self.embeddings is None:
+                    return []
+                normalized_query = normalize_query(user_query)
+                query_embedding = await asyncio.to_thread(self.embeddings.encode_query, normalized_query)
+                semantic_hit = await asyncio.to_thread(
+                    self.semantic_cache.lookup, self.cache_scope, normalized_query, query_embedding,
+                    self.schema_fingerprint, self._literal_terms(user_query)
+                )
+                if not semantic_hit:
+                    return []
+                cached = (semantic_hit["result"], semantic_hit["query_type"])
+            task = self._start_suggestions(user_query, cached[0])
         try:
-            suggestions = self._get_followup_suggestions(user_query, result)
+            return await asyncio.shield(task)
         except Exception:
-            suggestions = [] # Don't fail the whole query if suggestions fail
+            return []
+
+    def format_result(self, result: dict, result_format: str, order: dict = None) -> dict:
+        """
+        SQL results are cached in columnar form without a continuation token; the
+        token is signed per response so it never outlives its TTL inside a cache.
+        The token carries the result's row order (from the guard report, or order
+        for a page of an earlier token); a result without one gets no token.
+        """
+        if "columns" not in result:
+            return result
+        formatted = {key: value for key, value in result.items() if key not in ("columns", "rows")}
+        offset = result.get("offset", 0)
+        order = order or result.get("guard", {}).get("order")
+        formatted["row_count"] = len(result["rows"])
+        formatted["next_token"] = None
+        if result.get("truncated") and order is not None:
+            formatted["next_token"] = sign_token({
+                "sql": result["generated_sql"],
+                "columns": result["columns"],
+                "offset": offset + len(result["rows"]),
+                "order": order,
+                "after": keyset_after(order, result["columns"], result["rows"][-1]),
+                "scope": self.cache_scope,
+                "fingerprint": self.schema_fingerprint,
+            })
+        if result_format == "columnar":
+            formatted["columns"] = result["columns"]
+            formatted["rows"] = result["rows"]
+        else:
+            formatted["results"] = to_row_dicts(result["columns"], result["rows"])
+        return formatted
+
+    def read_result_token(self, token: str) -> dict:
+        """Verifies that a continuation token belongs to this database and its current schema."""
+        payload = read_token(token)
+        self.refresh_schema()
+        if payload["scope"] != self.cache_scope:
+            raise ValueError("Result token belongs to a different database")
+        if payload["fingerprint"] != self.schema_fingerprint:
+            raise ValueError("The schema changed since this result was produced, please run the query again")
+        if not payload.get("order"):
+            raise ValueError("Result token has no row order, please run the query again")
+        return payload
+
+    def fetch_result_page(self, token: str, result_format: str = "rows") -> dict:
+        """Returns the next SQL_MAX_ROWS rows of a truncated result."""
+        try:
+            payload = self.read_result_token(token)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        try:
+            with read_only_connection(self.connection_string) as conn:
+                page = fetch_page(conn, payload, settings.SQL_MAX_ROWS)
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}"}
+        page = dict(page, generated_sql=payload["sql"], offset=payload["offset"])
+        return self.format_result(page, result_format, order=payload["order"])
 
-        return {"result": result, "cache_hit": False, "query_type": query_type, "suggestions": suggestions}
+    def iter_result_lines(self, payload: dict):
+        """
+        Streams the rest of a result as NDJSON: a header line with the column names,
+        then one JSON array per row. Rows are read through a server-side cursor.
+        """
+        yield json.dumps({"columns": payload["columns"], "offset": payload["offset"]}) + "\n"
+        try:
+            with read_only_connection(self.connection_string) as conn:
+                for row in iter_rows(conn, payload):
+                    yield json.dumps(row, default=json_default) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"An error occurred: {str(e)}"}) + "\n"
 
-    def _get_followup_suggestions(self, user_query: str, result: dict) -> list:
+    async def _get_followup_suggestions(self, user_query: str, result: dict) -> list:
         """Generates follow-up questions based on the original query and its result."""
         # We don't need suggestions for errors or empty results
-        if result.get("error") or not result.get("results"):
+        if result.get("error") or not (result.get("results") or result.get("rows")):
             return []
 
         # Create a concise summary of the result to include in the prompt
-        result_summary = str(result["results"][:2]) # Summary of top 2 results
+        if "rows" in result:
+            top_results = to_row_dicts(result["columns"], result["rows"][:2])
+        else:
+            top_results = result["results"][:2]
+        result_summary = str(top_results) # Summary of top 2 results
 
         prompt = f"""
         Given the original question: "{user_query}"
@@ -67,11 +546,10 @@ class QueryEngine:
         JSON List:
         """
 
-        response = self.gen_model.generate_content(prompt)
+        response = await self.llm.generate(prompt, timeout_seconds=settings.LLM_SUGGESTIONS_TIMEOUT_SECONDS)
         # Clean up the response to get a valid JSON list
         clean_response = response.text.strip().replace('```json', '').replace('```', '')
         
-        import json
         try:
             suggestions = json.loads(clean_response)
             return suggestions
@@ -80,42 +558,56 @@ class QueryEngine:
 
     def classify_query(self, user_query: str) -> str:
         """
-        Classifies the user query as 'sql' or 'document'.
-        A query is considered 'sql' if it contains keywords matching table or column names.
+        Classifies the user query as 'sql', 'document' or 'hybrid' by scoring it
+        against the schema terms of the current schema version, see query_router.
         """
+        if self.embeddings is None:
+            return 'sql'
         if not self.schema or self.schema.get("error"):
             return 'document'
+        route, _ = route_query(normalize_query(user_query), self.schema_index().terms)
+        return route
 
-        # Clean the query by removing punctuation and making it lowercase
-        clean_query = re.sub(r'[^\w\s]', '', user_query.lower())
-        query_tokens = set(clean_query.split())
-
-        schema_words = set()
-        for table_name, table_info in self.schema.items():
-            schema_words.add(table_name.lower())
-            for column_info in table_info.get('columns', []):
-                col_name = column_info['name'].lower()
-                schema_words.add(col_name)
-                schema_words.update(col_name.split('_'))
-
-        # Expanded list of keywords
-        sql_keywords = {
-            'average', 'total', 'sum', 'count', 'max', 'min', 'top', 'bottom', 
-            'hired', 'joined', 'many', 'list', 'show', 'who', 'what', 'when', 'where'
-        }
-        
-        if query_tokens.intersection(schema_words) or query_tokens.intersection(sql_keywords):
-            return 'sql'
+    def schema_index(self) -> SchemaIndex:
+        return get_schema_index(self.schema_fingerprint, self.schema)
 
-        return 'document'
+    def schema_context(self, user_query: str, query_embedding) -> tuple:
+        """The DDL of the tables relevant to the question, and their names."""
+        tables = self.schema_index().select_tables(
+            normalize_query(user_query), query_embedding, settings.SCHEMA_TOP_K_TABLES
+        )
+        return schema_to_ddl(self.schema, tables), tables
 
-    def generate_and_run_sql(self, user_query: str) -> dict:
+    async def generate_and_run_sql(self, user_query: str, query_embedding=None) -> dict:
         if self.schema.get("error"):
             return {"error": f"Invalid database schema: {self.schema.get('error')}"}
 
-        prompt = f"""
+        # Questions of a known shape skip the LLM entirely
+        with span("template"):
+            template_result = await asyncio.to_thread(self._answer_from_template, user_query)
+        if template_result is not None:
+            return template_result
+
+        # Only the tables relevant to the question go into the prompt
+        if query_embedding is None and self.embeddings is not None:
+            with span("embed_query"):
+                query_embedding = await asyncio.to_thread(self.embeddings.encode_query, normalize_query(user_query))
+        with span("schema_context"):
+            schema_ddl, tables = await asyncio.to_thread(self.schema_context, user_query, query_embedding)
+
+        try:
+            with span("llm"):
+                response = await self.llm.generate(self._sql_prompt(schema_ddl, user_query))
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}"}
+        sql_query = response.text.strip().replace('```sql', '').replace('```', '')
+        return await self._run_generated_sql(user_query, sql_query, self._generation(response, tables))
+
+    @staticmethod
+    def _sql_prompt(schema_ddl: str, user_query: str) -> str:
+        return f"""
         Given the following database schema:
-        {self.schema}
+        {schema_ddl}
 
         Generate a single, executable SQL query to answer the following question. Do not use any markdown or other formatting; just return the raw SQL.
         
@@ -124,56 +616,207 @@ class QueryEngine:
         SQL Query:
         """
 
-        try:
-            # Generate the SQL query
-            response = self.gen_model.generate_content(prompt)
-            sql_query = response.text.strip().replace('```sql', '').replace('```', '')
+    def _generation(self, response, tables: list, questions: int = 1) -> dict:
+        generation = {
+            "prompt_tokens": response.prompt_tokens,
+            "output_tokens": response.output_tokens,
+            "latency_ms": response.latency_ms,
+            "schema_tables": len(tables),
+            "schema_tables_total": len(self.schema),
+        }
+        if questions > 1:
+            # Tokens and latency are those of the one prompt shared by the questions
+            generation["batched_questions"] = questions
+        return generation
 
-            # Execute the query
-            db = SessionLocal()
-            try:
-                result = db.execute(text(sql_query))
-                
-                # Fetch column names and rows
-                columns = result.keys()
-                rows = result.fetchall()
-                
-                # Convert rows to a list of dictionaries
-                results_as_dict = [dict(zip(columns, row)) for row in rows]
-                
-                return {"generated_sql": sql_query, "results": results_as_dict}
-            finally:
-                db.close()
+    async def _run_generated_sql(self, user_query: str, sql_query: str, generation: dict) -> dict:
+        try:
+            # Execute the query against the engine's own database, read-only and with
+            # a statement timeout; only the first page is read from the cursor
+            page = await asyncio.to_thread(self._run_sql, sql_query)
+            await asyncio.to_thread(
+                self.sql_templates.learn, self.cache_scope, self.schema_fingerprint, user_query, page["generated_sql"]
+            )
+            return dict(page, offset=0, generation=generation)
 
+        except SQLGuardError as e:
+            return {"error": str(e), "generated_sql": sql_query}
         except Exception as e:
             return {"error": f"An error occurred: {str(e)}"}
 
-    def search_documents(self, user_query: str) -> dict:
-        """Searches for relevant documents in the ChromaDB collection."""
+    async def hybrid_search(self, user_query: str, query_embedding, document_options: dict = None) -> dict:
+        """
+        Runs SQL generation and document retrieval concurrently and merges them: the
+        SQL part keeps its usual keys, the document matches go under "documents".
+        """
+        sql_result, document_result = await asyncio.gather(
+            self.generate_and_run_sql(user_query, query_embedding),
+            self.search_documents(user_query, query_embedding, document_options),
+        )
+        return self._merge_hybrid(sql_result, document_result)
+
+    @staticmethod
+    def _merge_hybrid(sql_result: dict, document_result: dict) -> dict:
+        if sql_result.get("error") and document_result.get("error"):
+            return {"error": f"{sql_result['error']}; {document_result['error']}"}
+        result = {} if sql_result.get("error") else dict(sql_result)
+        if sql_result.get("error"):
+            result["sql_error"] = sql_result["error"]
+        result["documents"] = document_result.get("results", [])
+        if document_result.get("error"):
+            result["document_error"] = document_result["error"]
+        return result
+
+    def _answer_from_template(self, user_query: str):
+        """
+        Runs the learned template matching the question, if any. A template that no
+        longer passes the guard's EXPLAIN is dropped and the question goes to the LLM.
+        """
+        quote = String().literal_processor(dialect=get_engine(self.connection_string).dialect)
+        found = self.sql_templates.find(self.cache_scope, self.schema_fingerprint, user_query, quote)
+        if found is None:
+            return None
+        sql_query, skeleton = found
         try:
-            # Generate embedding for the user query
-            query_embedding = self.embedding_model.encode(user_query).tolist()
+            page = self._run_sql(sql_query)
+        except Exception:
+            self.sql_templates.reject(self.cache_scope, self.schema_fingerprint, skeleton)
+            return None
+        self.sql_templates.record_hit(self.cache_scope, self.schema_fingerprint, skeleton)
+        generation = {
+            "template": True,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "latency_ms": 0,
+            "schema_tables": 0,
+            "schema_tables_total": len(self.schema),
+        }
+        return dict(page, offset=0, generation=generation)
 
-            # Query the collection to find the 5 most similar documents
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=5
-            )
+    def _run_sql(self, sql_query: str) -> dict:
+        with read_only_connection(self.connection_string) as conn:
+            with span("sql_guard"):
+                sql_query, report = self.optimize_sql_query(sql_query, conn)
+            with span("sql_execute"):
+                page = fetch_first_page(conn, sql_query, settings.SQL_MAX_ROWS)
+        metrics.SQL_ROWS.observe(len(page["rows"]))
+        return dict(page, generated_sql=sql_query, guard=report)
 
-            # Format the results
-            formatted_results = []
-            if results and results['documents'][0]:
-                for i, doc_text in enumerate(results['documents'][0]):
-                    formatted_results.append({
-                        "document_name": results['metadatas'][0][i]['source'],
-                        "chunk_text": doc_text,
-                        "similarity": 1 - results['distances'][0][i] # Chroma returns distance, convert to similarity
-                    })
-            
-            return {"results": formatted_results}
+    async def search_documents(self, user_query: str, query_embedding=None, document_options: dict = None,
+                               dense_matches: list = None) -> dict:
+        """
+        Finds the chunks most relevant to the question. Dense (Chroma) and BM25 (FTS5)
+        retrieval run concurrently and are merged with reciprocal rank fusion; a
+        keyword-like question is answered from the lexical index alone when it has
+        enough matches, which skips the dense search. document_options may set "k"
+        and filter by "sources" and ingestion time ("since"/"until", epoch seconds);
+        the filters are applied inside both indexes. dense_matches are the dense
+        results when they were already searched (batches search them together).
+        """
+        if self.embeddings is None:
+            return {"error": "Document search is disabled on this deployment (EMBEDDINGS_ENABLED=false)"}
+        k, candidates, filters = self._search_options(document_options)
+        try:
+            if is_keyword_query(user_query, settings.LEXICAL_FIRST_MAX_TERMS):
+                lexical = await asyncio.to_thread(self._lexical_search, user_query, k, filters)
+                if len(lexical) >= k:
+                    return {"results": [self._document_match(match, None, ["lexical"]) for match in lexical]}
+
+            if dense_matches is not None:
+                dense = dense_matches
+                lexical = await asyncio.to_thread(self._lexical_search, user_query, candidates, filters)
+            else:
+                dense, lexical = await asyncio.gather(
+                    asyncio.to_thread(self._dense_search, user_query, query_embedding, candidates, filters),
+                    asyncio.to_thread(self._lexical_search, user_query, candidates, filters),
+                )
+            matches = {}
+            for name, ranking in (("dense", dense), ("lexical", lexical)):
+                for match in ranking:
+                    entry = matches.setdefault(match["chunk_id"], (match, []))
+                    entry[1].append(name)
+            fused = reciprocal_rank_fusion(
+                [[match["chunk_id"] for match in dense], [match["chunk_id"] for match in lexical]],
+                k, settings.RRF_K
+            )
+            results = []
+            for chunk, score in fused:
+                # Dense matches are recorded first, so a chunk found by both keeps its similarity
+                match, found_by = matches[chunk]
+                results.append(self._document_match(match, match.get("similarity"), found_by, score))
+            return {"results": results}
         except Exception as e:
             return {"error": f"An error occurred during document search: {str(e)}"}
 
-    def optimize_sql_query(self, sql: str) -> str:
-        # Placeholder for SQL optimization logic
-        return sql
+    @staticmethod
+    def _search_options(document_options: dict) -> tuple:
+        """Number of matches, number of candidates per index, and filters of a document search."""
+        options = document_options or {}
+        k = options.get("k") or settings.DOCUMENT_SEARCH_K
+        candidates = max(k, settings.DOCUMENT_SEARCH_CANDIDATES)
+        return k, candidates, {key: options.get(key) for key in ("sources", "since", "until")}
+
+    def _lexical_search(self, user_query: str, k: int, filters: dict) -> list:
+        with span("lexical_search"):
+            return self.lexical.search(user_query, k, **filters)
+
+    def _dense_search(self, user_query: str, query_embedding, n_results: int, filters: dict) -> list:
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = self.embeddings.encode_query(normalize_query(user_query))
+        return self._dense_search_many([query_embedding], n_results, filters)[0]
+
+    def _dense_search_many(self, query_embeddings: list, n_results: int, filters: dict) -> list:
+        """Dense matches of each of the query embeddings, from one collection query."""
+        conditions = []
+        if filters.get("sources"):
+            conditions.append({"source": {"$in": list(filters["sources"])}})
+        if filters.get("since") is not None:
+            conditions.append({"ingested_at": {"$gte": filters["since"]}})
+        if filters.get("until") is not None:
+            conditions.append({"ingested_at": {"$lte": filters["until"]}})
+        where = None
+        if len(conditions) == 1:
+            where = conditions[0]
+        elif conditions:
+            where = {"$and": conditions}
+
+        with span("dense_search"):
+            results = self.collection.query(
+                query_embeddings=[embedding.tolist() for embedding in query_embeddings],
+                n_results=n_results,
+                where=where
+            )
+        if not results:
+            return [[] for _ in query_embeddings]
+        return [
+            [
+                {
+                    "chunk_id": results['ids'][q][i],
+                    "source": results['metadatas'][q][i]['source'],
+                    "text": doc_text,
+                    "similarity": 1 - results['distances'][q][i] # Chroma returns distance, convert to similarity
+                }
+                for i, doc_text in enumerate(results['documents'][q])
+            ]
+            for q in range(len(query_embeddings))
+        ]
+
+    @staticmethod
+    def _document_match(match: dict, similarity, found_by: list, score: float = None) -> dict:
+        return {
+            "document_name": match["source"],
+            "chunk_text": match["text"],
+            "similarity": similarity,
+            "score": score if score is not None else match.get("score"),
+            "found_by": found_by,
+        }
+
+    def optimize_sql_query(self, sql: str, conn) -> tuple:
+        """
+        Pre-execution stage for generated SQL: only single read-only queries pass,
+        results are bounded with a LIMIT, and plans estimated too expensive are
+        downgraded or refused, and rows are put in a stable order for paging.
+        Returns (sql to run, guard report).
+        """
+        return guard_sql(conn, sql, self.schema)
@@ -0,0 +1,182 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from backend.config import settings
+from backend.services.semantic_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Old entries are dropped once every this many writes
+_PRUNE_EVERY = 1000
+
+
+def _row_count(result: dict):
+    if "row_count" in result:
+        return result["row_count"]
+    if "rows" in result:
+        return len(result["rows"])
+    if "results" in result:
+        return len(result["results"])
+    return None
+
+
+class QueryHistory:
+    """
+    Append-only log of answered questions: query type, generated SQL, latency, row
+    count and cache outcome. It lives in a local SQLite file (WAL mode) shared by
+    every worker on the host, indexed for the most recent entries and for the most
+    frequent questions of a time window. Entries are written by a background thread
+    so a request never waits on the disk; entries older than max_age_seconds are
+    dropped as new ones arrive.
+    """
+
+    def __init__(self, path: str, max_age_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scope TEXT NOT NULL,
+                query TEXT NOT NULL,
+                normalized_query TEXT NOT NULL,
+                query_type TEXT,
+                generated_sql TEXT,
+                latency_ms REAL NOT NULL,
+                row_count INTEGER,
+                cache TEXT NOT NULL,
+                error TEXT,
+                asked_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS queries_recent ON queries (scope, id);
+            CREATE INDEX IF NOT EXISTS queries_window ON queries (scope, asked_at, normalized_query);
+            CREATE INDEX IF NOT EXISTS queries_age ON queries (asked_at);
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+        self._pending = queue.Queue()
+        self._writer = None
+        self._writes = 0
+
+    def record(self, scope: str, query: str, query_type: str, result: dict, latency_seconds: float, cache: str):
+        """Queues one answered question; cache is "miss", "exact" or "semantic"."""
+        self._pending.put((
+            scope, query, normalize_query(query), query_type, result.get("generated_sql"),
+            round(latency_seconds * 1000, 3), _row_count(result), cache, result.get("error"), time.time(),
+        ))
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="query-history", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            entries = [self._pending.get()]
+            while True:
+                try:
+                    entries.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    self._conn.executemany("""
+                        INSERT INTO queries (scope, query, normalized_query, query_type, generated_sql,
+                                             latency_ms, row_count, cache, error, asked_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, entries)
+                    self._writes += len(entries)
+                    if self._writes >= _PRUNE_EVERY:
+                        self._writes = 0
+                        self._conn.execute("DELETE FROM queries WHERE asked_at < ?", (time.time() - self.max_age_seconds,))
+                    self._conn.commit()
+            except Exception:
+                logger.exception("Could not record %d queries", len(entries))
+            finally:
+                for _ in entries:
+                    self._pending.task_done()
+
+    def flush(self):
+        """Waits until every queued entry is written."""
+        self._pending.join()
+
+    def claim_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Takes or renews the lease called name for ttl_seconds; False while another
+        owner holds it. Workers sharing this file use it to elect one of them for a
+        background task.
+        """
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute("""
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """, (name, owner, now + ttl_seconds, now)).rowcount
+            self._conn.commit()
+        return claimed == 1
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+            self._conn.commit()
+
+    def recent(self, scope: str, limit: int, before: int = None) -> list:
+        """The newest entries, or the newest ones older than the entry with id before."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT id, query, query_type, generated_sql, latency_ms, row_count, cache, error, asked_at
+                FROM queries WHERE scope = ? AND id < ? ORDER BY id DESC LIMIT ?
+            """, (scope, before if before is not None else 2 ** 63 - 1, limit)).fetchall()
+        keys = ("id", "query", "query_type", "generated_sql", "latency_ms", "row_count", "cache", "error", "asked_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def top(self, scope: str, since: float, limit: int) -> list:
+        """
+        The questions asked most often since the given time, counted by normalized
+        text; query is the latest wording. Questions that only failed are left out.
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT normalized_query, max(asked_at) AS last_asked_at, query, query_type, count(*) AS asked,
+                       avg(latency_ms), sum(cache = 'miss')
+                FROM queries WHERE scope = ? AND asked_at >= ?
+                GROUP BY normalized_query HAVING count(error) < count(*)
+                ORDER BY asked DESC, last_asked_at DESC LIMIT ?
+            """, (scope, since, limit)).fetchall()
+        return [
+            {
+                "query": query,
+                "normalized_query": normalized,
+                "query_type": query_type,
+                "asked": asked,
+                "misses": misses,
+                "avg_latency_ms": round(latency, 3),
+                "last_asked_at": last_asked_at,
+            }
+            for normalized, last_asked_at, query, query_type, asked, latency, misses in rows
+        ]
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_query_history() -> QueryHistory:
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = QueryHistory(
+                    settings.QUERY_HISTORY_PATH,
+                    max_age_seconds=settings.QUERY_HISTORY_MAX_AGE_DAYS * 24 * 60 * 60,
+                )
+    return _history
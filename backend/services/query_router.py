@@ -0,0 +1,84 @@
+"""
+Decides whether a question is answered from the database, from the documents,
+or from both. The schema side of the decision uses the term weights of the
+SchemaIndex, which are built once per schema version.
+"""
+
+# Words that ask for a computation over rows
+AGGREGATE_TERMS = frozenset({
+    "average", "mean", "total", "sum", "count", "number", "max", "maximum", "min", "minimum",
+    "top", "bottom", "highest", "lowest", "most", "least", "many", "list", "rank", "per",
+    "hired", "joined",
+})
+
+# Words that ask about the content of documents
+DOCUMENT_TERMS = frozenset({
+    "policy", "policies", "document", "documents", "doc", "docs", "handbook", "guideline",
+    "guidelines", "procedure", "procedures", "process", "explain", "describe", "why",
+    "according", "mention", "mentions", "mentioned", "say", "says", "rule", "rules",
+    "resume", "resumes", "contract", "contracts", "report", "reports",
+})
+
+# Never counted as schema terms even when a column is named like them
+STOPWORDS = frozenset({
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "by", "with", "and", "or", "is",
+    "are", "was", "were", "be", "do", "does", "what", "which", "who", "when", "where",
+    "show", "me", "all", "my", "our", "their", "it", "its", "this", "that", "from", "as",
+    "id", "type", "name", "value", "data", "info",
+})
+
+# A whole table name is a strong hint, a column name a good one, part of a column name a weak one
+TABLE_WEIGHT = 2.0
+COLUMN_WEIGHT = 1.0
+COLUMN_PART_WEIGHT = 0.5
+
+
+def _forms(word: str):
+    yield word
+    if word.endswith("s") and len(word) > 3:
+        yield word[:-1]
+    else:
+        yield word + "s"
+
+
+def schema_terms(schema: dict) -> dict:
+    """Maps every word that refers to the schema to its weight."""
+    terms = {}
+
+    def add(word: str, weight: float):
+        word = word.lower()
+        if not word or word in STOPWORDS:
+            return
+        for form in _forms(word):
+            terms[form] = max(terms.get(form, 0.0), weight)
+
+    for table_name, table_info in schema.items():
+        add(table_name, TABLE_WEIGHT)
+        for part in table_name.split("_"):
+            add(part, COLUMN_WEIGHT)
+        for column in table_info.get("columns", []):
+            add(column["name"], COLUMN_WEIGHT)
+            for part in column["name"].split("_"):
+                add(part, COLUMN_PART_WEIGHT)
+    return terms
+
+
+def route_query(normalized_query: str, terms: dict) -> tuple:
+    """
+    Returns ('sql' | 'document' | 'hybrid', scores). A question about the schema
+    without document wording goes to SQL, one with neither schema nor aggregate
+    wording goes to the documents, and everything in between gets both.
+    """
+    tokens = normalized_query.split()
+    scores = {
+        "schema": sum(terms.get(token, 0.0) for token in set(tokens)),
+        "aggregate": sum(1 for token in tokens if token in AGGREGATE_TERMS),
+        "document": sum(1 for token in tokens if token in DOCUMENT_TERMS),
+    }
+    if scores["schema"] >= COLUMN_WEIGHT and not scores["document"]:
+        route = "sql"
+    elif not scores["schema"] and not scores["aggregate"]:
+        route = "document"
+    else:
+        route = "hybrid"
+    return route, scores
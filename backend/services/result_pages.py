@@ -0,0 +1,121 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import hmac
+import json
+import time
+
+from sqlalchemy import text
+
+from backend.config import settings
+from backend.services.sql_guard import page_sql
+
+
+def json_default(value):
+    """JSON fallback for the values SQL drivers return."""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    return str(value)
+
+
+def _secret() -> bytes:
+    # Without an explicit secret, every worker sharing the same .env derives the same key
+    secret = settings.RESULT_TOKEN_SECRET or f"result-token:{settings.GOOGLE_API_KEY}"
+    return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_token(payload: dict) -> str:
+    """Encodes a continuation token. The HMAC keeps clients from running arbitrary SQL through it."""
+    body = json.dumps(dict(payload, iat=int(time.time())), separators=(",", ":")).encode("utf-8")
+    signature = hmac.new(_secret(), body, hashlib.sha256).digest()
+    return f"{_b64(body)}.{_b64(signature)}"
+
+
+def read_token(token: str) -> dict:
+    """Decodes and verifies a continuation token; raises ValueError if it is forged or expired."""
+    try:
+        body, signature = (_unb64(part) for part in token.split(".", 1))
+    except Exception:
+        raise ValueError("Malformed result token")
+    if not hmac.compare_digest(signature, hmac.new(_secret(), body, hashlib.sha256).digest()):
+        raise ValueError("Invalid result token")
+    payload = json.loads(body)
+    if time.time() - payload["iat"] > settings.RESULT_TOKEN_TTL_SECONDS:
+        raise ValueError("Result token expired, please run the query again")
+    return payload
+
+
+def _page_statement(connection, payload: dict, rows: int = None):
+    """
+    The query of a continuation token, reading from its offset on. The token's SQL
+    is in a stable order (see sql_guard.stable_order); when the rows are in key
+    order the query seeks past the key of the last row sent instead of reading and
+    skipping every row before it, so a page costs the same wherever it starts.
+    """
+    return text(page_sql(payload["sql"], connection.dialect.name, payload["order"], payload["offset"], rows,
+                         payload.get("after")))
+
+
+def fetch_first_page(connection, sql: str, max_rows: int) -> dict:
+    """
+    Runs the query on a server-side cursor and reads at most max_rows + 1 rows, so
+    the size of the full result never matters. Returns a columnar page.
+    """
+    result = connection.execute(text(sql), execution_options={"stream_results": True})
+    try:
+        columns = list(result.keys())
+        rows = [list(row) for row in result.fetchmany(max_rows + 1)] if result.returns_rows else []
+    finally:
+        result.close()
+    return {"columns": columns, "rows": rows[:max_rows], "truncated": len(rows) > max_rows}
+
+
+def fetch_page(connection, payload: dict, max_rows: int) -> dict:
+    """The next max_rows rows of the result a continuation token points into."""
+    result = connection.execute(_page_statement(connection, payload, max_rows + 1))
+    rows = [list(row) for row in result.fetchall()]
+    return {"columns": payload["columns"], "rows": rows[:max_rows], "truncated": len(rows) > max_rows}
+
+
+def iter_rows(connection, payload: dict, batch_size: int = 1000):
+    """Streams every row from the token's offset on through a server-side cursor, batch_size rows at a time."""
+    result = connection.execute(_page_statement(connection, payload), execution_options={"stream_results": True})
+    try:
+        for rows in iter(lambda: result.fetchmany(batch_size), []):
+            for row in rows:
+                yield list(row)
+    finally:
+        result.close()
+
+
+def keyset_after(order: dict, columns: list, row: list):
+    """
+    The key values of a page's last row, for the next page to continue after. None
+    when the result is not in key order, or a value would not survive the token's
+    JSON unchanged (dates, decimals, bytes), in which case the next page skips by
+    offset instead.
+    """
+    if not order or not order.get("keyset"):
+        return None
+    values = [row[columns.index(output)] for output, _ in order["keyset"]]
+    if not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in values):
+        return None
+    return values
+
+
+def to_row_dicts(columns: list, rows: list) -> list:
+    """The original response shape: one dict per row, repeating the column names."""
+    return [dict(zip(columns, row)) for row in rows]
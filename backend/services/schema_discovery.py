@@ -1,4 +1,22 @@
-from sqlalchemy import create_engine, inspect
+import hashlib
+import threading
+import time
+
+from sqlalchemy import inspect, text
+
+from backend.config import settings
+from backend.services.db_engines import get_engine
+
+# Discovered schemas are cached per connection string together with a cheap
+# fingerprint of the catalog. A refresh only re-reflects the tables whose
+# signature changed since the last discovery.
+_schema_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
 
 class SchemaDiscovery:
     def analyze_database(self, connection_string: str) -> dict:
@@ -8,38 +26,163 @@ class SchemaDiscovery:
         - Column names and data types
         - Relationships between tables
         - Sample data for context understanding
+
+        The result is cached; it is only rebuilt when the catalog fingerprint changes.
         """
         try:
-            engine = create_engine(connection_string)
-            inspector = inspect(engine)
-            
-            schema = {}
-            table_names = inspector.get_table_names()
-            
-            for table_name in table_names:
-                schema[table_name] = {
-                    "columns": [],
-                    "foreign_keys": []
-                }
-                columns = inspector.get_columns(table_name)
-                for column in columns:
-                    schema[table_name]["columns"].append({
-                        "name": column["name"],
-                        "type": str(column["type"])
-                    })
-                
-                foreign_keys = inspector.get_foreign_keys(table_name)
-                for fk in foreign_keys:
-                    schema[table_name]["foreign_keys"].append({
-                        "constrained_columns": fk["constrained_columns"],
-                        "referred_table": fk["referred_table"],
-                        "referred_columns": fk["referred_columns"]
-                    })
-            
-            return schema
+            entry = self._refresh(connection_string)
+            return entry["schema"]
         except Exception as e:
             return {"error": str(e)}
 
+    def get_fingerprint(self, connection_string: str):
+        """Returns the fingerprint of the cached schema, or None if it was never discovered."""
+        entry = _schema_cache.get(connection_string)
+        return entry["fingerprint"] if entry else None
+
+    def invalidate(self, connection_string: str = None) -> int:
+        """Drops the cached schema for one connection string, or for all of them."""
+        with _cache_lock:
+            if connection_string is None:
+                count = len(_schema_cache)
+                _schema_cache.clear()
+                return count
+            return 1 if _schema_cache.pop(connection_string, None) else 0
+
+    def _refresh(self, connection_string: str) -> dict:
+        entry = _schema_cache.get(connection_string)
+        now = time.monotonic()
+        if entry and now - entry["checked_at"] < settings.SCHEMA_CHECK_INTERVAL_SECONDS:
+            return entry
+
+        engine = get_engine(connection_string)
+        with engine.connect() as conn:
+            # SQLite bumps schema_version on every DDL statement, so an unchanged
+            # value means nothing needs to be looked at.
+            version = None
+            if engine.dialect.name == "sqlite":
+                version = conn.execute(text("PRAGMA schema_version")).scalar()
+                if entry and entry["version"] == version:
+                    entry["checked_at"] = now
+                    return entry
+            signatures = self._table_signatures(conn)
+
+        fingerprint = _hash(*sorted(signatures.items())) if signatures is not None else None
+        if entry and fingerprint is not None and entry["fingerprint"] == fingerprint:
+            entry["checked_at"] = now
+            entry["version"] = version
+            return entry
+
+        inspector = inspect(engine)
+        if signatures is None:
+            # Unknown dialect: no catalog signatures, reflect everything
+            table_names = inspector.get_table_names()
+            changed = table_names
+        else:
+            table_names = sorted(signatures)
+            old_signatures = entry["signatures"] if entry else {}
+            changed = [t for t in table_names if old_signatures.get(t) != signatures[t]]
+
+        reflected = self._reflect_tables(inspector, changed)
+        previous = entry["schema"] if entry else {}
+        schema = {}
+        for table_name in table_names:
+            schema[table_name] = reflected.get(table_name) or previous.get(table_name) or {"columns": [], "foreign_keys": []}
+        if fingerprint is None:
+            fingerprint = _hash(sorted(schema.items()))
+
+        entry = {
+            "schema": schema,
+            "fingerprint": fingerprint,
+            "signatures": signatures or {},
+            "version": version,
+            "checked_at": now,
+        }
+        with _cache_lock:
+            _schema_cache[connection_string] = entry
+        return entry
+
+    def _table_signatures(self, conn):
+        """
+        Returns {table_name: signature} from a single catalog query, or None if the
+        dialect is not supported. A signature changes whenever the table's columns,
+        primary key or foreign keys change.
+        """
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            rows = conn.execute(text(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ))
+            return {name: _hash(sql) for name, sql in rows}
+        if dialect == "postgresql":
+            rows = conn.execute(text("""
+                SELECT c.relname,
+                       md5(coalesce((SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ',' ORDER BY a.attnum)
+                                     FROM pg_attribute a
+                                     WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), '')
+                           || '|' ||
+                           coalesce((SELECT string_agg(pg_get_constraintdef(k.oid), ',' ORDER BY k.conname)
+                                     FROM pg_constraint k
+                                     WHERE k.conrelid = c.oid AND k.contype IN ('f', 'p')), ''))
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+            """))
+            return {name: signature for name, signature in rows}
+        if dialect in ("mysql", "mariadb"):
+            parts = {}
+            rows = conn.execute(text("""
+                SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION
+            """))
+            for table_name, column_name, column_type in rows:
+                parts.setdefault(table_name, []).append(f"{column_name} {column_type}")
+            rows = conn.execute(text("""
+                SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+                FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE() AND (REFERENCED_TABLE_NAME IS NOT NULL OR CONSTRAINT_NAME = 'PRIMARY')
+                ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+            """))
+            for table_name, column_name, referred_table, referred_column in rows:
+                if referred_table is None:
+                    parts.setdefault(table_name, []).append(f"pk {column_name}")
+                else:
+                    parts.setdefault(table_name, []).append(f"fk {column_name} {referred_table}.{referred_column}")
+            return {name: _hash(*columns) for name, columns in parts.items()}
+        return None
+
+    def _reflect_tables(self, inspector, table_names: list) -> dict:
+        """Reflects columns and foreign keys of many tables in two bulk round trips."""
+        if not table_names:
+            return {}
+        all_columns = inspector.get_multi_columns(filter_names=table_names)
+        all_foreign_keys = inspector.get_multi_foreign_keys(filter_names=table_names)
+        all_primary_keys = inspector.get_multi_pk_constraint(filter_names=table_names)
+
+        schema = {}
+        for key, columns in all_columns.items():
+            table_name = key[1]
+            primary_key = all_primary_keys.get(key) or {}
+            schema[table_name] = {
+                "columns": [],
+                "foreign_keys": [],
+                "primary_key": list(primary_key.get("constrained_columns") or []),
+            }
+            for column in columns:
+                schema[table_name]["columns"].append({
+                    "name": column["name"],
+                    "type": str(column["type"])
+                })
+        for (_, table_name), foreign_keys in all_foreign_keys.items():
+            if table_name not in schema:
+                continue
+            for fk in foreign_keys:
+                schema[table_name]["foreign_keys"].append({
+                    "constrained_columns": fk["constrained_columns"],
+                    "referred_table": fk["referred_table"],
+                    "referred_columns": fk["referred_columns"]
+                })
+        return schema
+
     def map_natural_language_to_schema(self, query: str, schema: dict) -> dict:
         """
         Map user's natural language to actual database structure.
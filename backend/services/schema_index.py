@@ -0,0 +1,145 @@
+import collections
+import threading
+
+import numpy as np
+
+from backend.config import settings
+from backend.services.embedding_service import get_embedding_service
+from backend.services.query_router import schema_terms
+
+# Longest foreign-key path (in hops) used to connect two relevant tables
+MAX_JOIN_HOPS = 3
+
+
+def table_description(table_name: str, table_info: dict, neighbours: list) -> str:
+    """The text embedded for a table: its name, its columns and the tables it joins with."""
+    columns = ", ".join(column["name"].replace("_", " ") for column in table_info.get("columns", []))
+    text = f"{table_name.replace('_', ' ')}: {columns}"
+    if neighbours:
+        text += f"; related to {', '.join(sorted(neighbours))}"
+    return text
+
+
+def _foreign_key_graph(schema: dict) -> dict:
+    graph = collections.defaultdict(set)
+    for table_name, table_info in schema.items():
+        for fk in table_info.get("foreign_keys", []):
+            referred = fk["referred_table"]
+            if referred in schema and referred != table_name:
+                graph[table_name].add(referred)
+                graph[referred].add(table_name)
+    return graph
+
+
+def schema_to_ddl(schema: dict, table_names: list) -> str:
+    """Serializes tables as compact CREATE TABLE statements, the format models know best."""
+    statements = []
+    for table_name in table_names:
+        table_info = schema[table_name]
+        references = {}
+        composite = []
+        for fk in table_info.get("foreign_keys", []):
+            if len(fk["constrained_columns"]) == 1:
+                references[fk["constrained_columns"][0]] = f"{fk['referred_table']}({fk['referred_columns'][0]})"
+            else:
+                composite.append(
+                    f"FOREIGN KEY ({', '.join(fk['constrained_columns'])}) "
+                    f"REFERENCES {fk['referred_table']}({', '.join(fk['referred_columns'])})"
+                )
+        parts = []
+        for column in table_info.get("columns", []):
+            part = f"{column['name']} {column['type']}"
+            if column["name"] in references:
+                part += f" REFERENCES {references[column['name']]}"
+            parts.append(part)
+        statements.append(f"CREATE TABLE {table_name} ({', '.join(parts + composite)});")
+    return "\n".join(statements)
+
+
+class SchemaIndex:
+    """
+    Everything derived from one schema version: the term weights used for routing,
+    and embeddings of every table, used to put only the tables relevant to a
+    question (plus the tables joining them) into the SQL prompt. Without
+    embeddings (EMBEDDINGS_ENABLED=false) tables are ranked by the schema terms
+    of the question instead.
+    """
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self.table_names = sorted(schema)
+        self.terms = schema_terms(schema)
+        self.graph = _foreign_key_graph(schema)
+        descriptions = [
+            table_description(name, schema[name], self.graph.get(name, ())) for name in self.table_names
+        ]
+        self.table_terms = [schema_terms({name: schema[name]}) for name in self.table_names]
+        if not settings.EMBEDDINGS_ENABLED:
+            self.embeddings = None
+        elif descriptions:
+            self.embeddings = get_embedding_service().encode(descriptions, batch_size=64)
+        else:
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    def select_tables(self, normalized_query: str, query_embedding, top_k: int) -> list:
+        """The top_k most relevant tables, plus the tables on the join paths between them."""
+        if len(self.table_names) <= top_k:
+            return list(self.table_names)
+        if self.embeddings is not None and query_embedding is not None:
+            scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        else:
+            tokens = set(normalized_query.split())
+            scores = np.array([sum(terms.get(token, 0.0) for token in tokens) for terms in self.table_terms])
+        # Stable, so tables that score the same keep their alphabetical order
+        ranked = [self.table_names[i] for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+        selected = list(ranked)
+        for i, start in enumerate(ranked):
+            for goal in ranked[i + 1:]:
+                for table in self._join_path(start, goal):
+                    if table not in selected:
+                        selected.append(table)
+        return selected
+
+    def _join_path(self, start: str, goal: str) -> list:
+        """Tables strictly between start and goal on the shortest foreign-key path, if one is short enough."""
+        previous = {start: None}
+        frontier = [start]
+        for _ in range(MAX_JOIN_HOPS):
+            next_frontier = []
+            for table in frontier:
+                for neighbour in self.graph.get(table, ()):
+                    if neighbour in previous:
+                        continue
+                    previous[neighbour] = table
+                    if neighbour == goal:
+                        path = []
+                        step = previous[goal]
+                        while step != start:
+                            path.append(step)
+                            step = previous[step]
+                        return path
+                    next_frontier.append(neighbour)
+            frontier = next_frontier
+        return []
+
+
+_indexes = collections.OrderedDict()
+_indexes_lock = threading.Lock()
+# Schema versions of a few databases are kept; older ones are rebuilt on demand
+_MAX_INDEXES = 8
+
+
+def get_schema_index(fingerprint: str, schema: dict) -> SchemaIndex:
+    """Returns the index of a schema version, building it once per fingerprint."""
+    with _indexes_lock:
+        index = _indexes.get(fingerprint)
+        if index is not None:
+            _indexes.move_to_end(fingerprint)
+            return index
+    index = SchemaIndex(schema)
+    with _indexes_lock:
+        _indexes[fingerprint] = index
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
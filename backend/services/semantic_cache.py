@@ -0,0 +1,210 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from backend.config import settings
+from backend.services.result_pages import json_default
+
+# Common shorthand users type, expanded so trivially different phrasings normalize
+# to the same text before they are embedded.
+_ABBREVIATIONS = {
+    "avg": "average",
+    "dept": "department",
+    "depts": "departments",
+    "emp": "employee",
+    "emps": "employees",
+    "num": "number",
+    "qty": "quantity",
+    "amt": "amount",
+    "yr": "year",
+    "yrs": "years",
+    "mgr": "manager",
+}
+
+
+def normalize_query(user_query: str) -> str:
+    """Lowercases, strips punctuation and expands abbreviations."""
+    tokens = re.sub(r"[^\w\s]", " ", user_query.lower()).split()
+    return " ".join(_ABBREVIATIONS.get(token, token) for token in tokens)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query meaning rather than exact text.
+
+    Entries live in a local SQLite file (WAL mode) so every uvicorn worker on the host
+    shares them and they survive restarts. A lookup first tries the normalized query
+    text, then the nearest stored embedding above the similarity threshold. Entries
+    are only valid for the schema fingerprint they were computed against, and
+    document-backed answers only for the corpus version they were computed against.
+    """
+
+    def __init__(self, path: str, threshold: float, max_entries: int, max_age_seconds: float):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                normalized_query TEXT NOT NULL,
+                schema_fingerprint TEXT,
+                corpus_version INTEGER,
+                query_type TEXT,
+                embedding BLOB,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS answers_query ON answers (scope, normalized_query);
+            CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used_at);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+        # In-memory copy of the candidate vectors, rebuilt whenever the file changes
+        self._matrix_key = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def get_corpus_version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_corpus_version(self) -> int:
+        """Called after the indexed document set changed; retires every document-backed answer."""
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO meta (key, value) VALUES ('corpus_version', '1')
+                ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """)
+            self._conn.execute("DELETE FROM answers WHERE corpus_version IS NOT NULL")
+            self._conn.commit()
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return int(row[0])
+
+    def lookup(self, scope: str, normalized_query: str, embedding, schema_fingerprint: str,
+               required_terms: tuple = ()):
+        """
+        Returns {"result", "query_type", "similarity"} for the best valid entry, or None.
+        The scope separates databases, so two connections never share answers. A
+        near match must also contain every one of required_terms (the question's
+        literals), so "... in Sales" is never answered with "... in Engineering".
+        """
+        corpus_version = self.get_corpus_version()
+        min_created = time.time() - self.max_age_seconds
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT id, result, query_type FROM answers
+                WHERE scope = ? AND normalized_query = ? AND schema_fingerprint IS ?
+                  AND (corpus_version IS NULL OR corpus_version = ?) AND created_at >= ?
+                ORDER BY created_at DESC LIMIT 1
+            """, (scope, normalized_query, schema_fingerprint, corpus_version, min_created)).fetchone()
+            similarity = 1.0
+
+            if row is None and embedding is not None:
+                self._load_matrix(scope, schema_fingerprint, corpus_version, min_created)
+                if len(self._ids):
+                    scores = self._matrix @ np.asarray(embedding, dtype=np.float32)
+                    for best in np.argsort(-scores)[:5]:
+                        if scores[best] < self.threshold:
+                            break
+                        candidate = self._conn.execute(
+                            "SELECT id, result, query_type, normalized_query FROM answers WHERE id = ? AND created_at >= ?",
+                            (int(self._ids[best]), min_created)
+                        ).fetchone()
+                        if candidate and all(f" {term} " in f" {candidate[3]} " for term in required_terms):
+                            row = candidate[:3]
+                            similarity = float(scores[best])
+                            break
+
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE answers SET hits = hits + 1, last_used_at = ? WHERE id = ?", (time.time(), row[0])
+            )
+            self._conn.commit()
+        return {"result": json.loads(row[1]), "query_type": row[2], "similarity": similarity}
+
+    def store(self, scope: str, normalized_query: str, embedding, result: dict, query_type: str,
+              schema_fingerprint: str, depends_on_documents: bool):
+        corpus_version = self.get_corpus_version() if depends_on_documents else None
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM answers WHERE scope = ? AND normalized_query = ?",
+                (scope, normalized_query)
+            )
+            self._conn.execute("""
+                INSERT INTO answers (scope, normalized_query, schema_fingerprint, corpus_version, query_type,
+                                     embedding, result, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (scope, normalized_query, schema_fingerprint, corpus_version, query_type, blob,
+                  json.dumps(result, default=json_default), now, now))
+            self._evict(scope, schema_fingerprint, now)
+            self._conn.commit()
+
+    def clear(self, scope: str = None):
+        """Drops every answer, or only the answers of one database."""
+        with self._lock:
+            if scope is None:
+                self._conn.execute("DELETE FROM answers")
+            else:
+                self._conn.execute("DELETE FROM answers WHERE scope = ?", (scope,))
+            self._conn.commit()
+
+    def _evict(self, scope: str, schema_fingerprint: str, now: float):
+        # Answers from an older schema, expired answers, then the least recently used overflow
+        self._conn.execute(
+            "DELETE FROM answers WHERE (scope = ? AND schema_fingerprint IS NOT ?) OR created_at < ?",
+            (scope, schema_fingerprint, now - self.max_age_seconds)
+        )
+        self._conn.execute("""
+            DELETE FROM answers WHERE id IN (
+                SELECT id FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def _load_matrix(self, scope: str, schema_fingerprint: str, corpus_version: int, min_created: float):
+        # Inserts and deletes by any worker move the row count or the highest id;
+        # hit-counter updates don't, so they don't force a reload.
+        generation = self._conn.execute("SELECT count(*), max(id) FROM answers").fetchone()
+        key = (scope, schema_fingerprint, corpus_version, generation)
+        if key == self._matrix_key:
+            return
+        rows = self._conn.execute("""
+            SELECT id, embedding FROM answers
+            WHERE scope = ? AND schema_fingerprint IS ? AND (corpus_version IS NULL OR corpus_version = ?)
+              AND created_at >= ? AND embedding IS NOT NULL
+        """, (scope, schema_fingerprint, corpus_version, min_created)).fetchall()
+        self._ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self._matrix = (np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                        if rows else np.zeros((0, 0), dtype=np.float32))
+        self._matrix_key = key
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache(
+                    settings.SEMANTIC_CACHE_PATH,
+                    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                    max_age_seconds=settings.SEMANTIC_CACHE_MAX_AGE_SECONDS,
+                )
+    return _cache
@@ -0,0 +1,34 @@
+import threading
+
+from backend.config import settings
+
+# Heavy handles are created once per process and shared by every QueryEngine and
+# DocumentProcessor. Creation is guarded by a lock so concurrent first requests
+# don't open the store twice. The embedding model lives in embedding_service.
+_lock = threading.Lock()
+_chroma_client = None
+_collection = None
+
+
+def get_document_collection():
+    global _chroma_client, _collection
+    if _collection is None:
+        with _lock:
+            if _collection is None:
+                if settings.VECTOR_STORE == "quantized":
+                    from backend.services.vector_store import QuantizedVectorStore
+
+                    _collection = QuantizedVectorStore(
+                        settings.VECTOR_STORE_PATH,
+                        dtype=settings.VECTOR_STORE_DTYPE,
+                        rerank_candidates=settings.VECTOR_RERANK_CANDIDATES,
+                        ivf_lists=settings.VECTOR_IVF_LISTS,
+                        ivf_probes=settings.VECTOR_IVF_PROBES,
+                        ivf_min_vectors=settings.VECTOR_IVF_MIN_VECTORS,
+                    )
+                    return _collection
+                import chromadb
+
+                _chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
+                _collection = _chroma_client.get_or_create_collection(name="documents")
+    return _collection
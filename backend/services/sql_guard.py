@@ -0,0 +1,396 @@
+import collections
+import json
+import logging
+import re
+
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# SQLAlchemy dialect name -> sqlglot dialect name
+_SQLGLOT_DIALECTS = {
+    "sqlite": "sqlite",
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "mariadb": "mysql",
+    "mssql": "tsql",
+}
+
+# Any of these anywhere in the tree means the statement is not a plain read
+_WRITE_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.Command, exp.Into, exp.TruncateTable,
+)
+
+# Size assumed for scanned relations whose row count can't be looked up (CTEs, subqueries)
+_UNKNOWN_ROWS = 1000
+
+
+class SQLGuardError(ValueError):
+    """The generated SQL is refused; the message is meant for the user."""
+
+
+def _parse(sql: str, dialect: str) -> exp.Expression:
+    read = _SQLGLOT_DIALECTS.get(dialect)
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=read) if s is not None]
+    except sqlglot.errors.ParseError as e:
+        raise SQLGuardError(f"The generated SQL could not be parsed: {e}")
+    if len(statements) != 1:
+        raise SQLGuardError("Only a single SQL statement can be run")
+    statement = statements[0]
+    if not isinstance(statement, exp.Query) or any(statement.find_all(*_WRITE_NODES)):
+        raise SQLGuardError("Only read-only SELECT queries can be run")
+    return statement
+
+
+def _is_aggregate(statement: exp.Expression) -> bool:
+    """A query without GROUP BY whose projections are all aggregates returns one row."""
+    return (
+        isinstance(statement, exp.Select)
+        and not statement.args.get("group")
+        and bool(statement.expressions)
+        and all(isinstance(projection.unalias(), exp.AggFunc) for projection in statement.expressions)
+    )
+
+
+def _limit_value(statement: exp.Expression):
+    limit = statement.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.args.get("expression") or limit.this
+    return int(value.this) if isinstance(value, exp.Literal) and value.is_int else -1
+
+
+def _with_limit(statement: exp.Expression, rows: int) -> exp.Expression:
+    return statement.copy().limit(rows)
+
+
+def _offset_value(statement: exp.Expression) -> int:
+    offset = statement.args.get("offset")
+    if offset is None:
+        return 0
+    value = offset.args.get("expression") or offset.this
+    return int(value.this) if isinstance(value, exp.Literal) and value.is_int else -1
+
+
+def _source_tables(select: exp.Select) -> list:
+    """The relations in the FROM and JOIN clauses of one SELECT."""
+    sources = [select.args["from_"].this] if select.args.get("from_") else []
+    return sources + [join.this for join in select.args.get("joins") or []]
+
+
+def _output_width(statement: exp.Expression, schema: dict):
+    """Number of columns the statement returns, with * expanded from the schema; None if unknown."""
+    while isinstance(statement, exp.SetOperation):
+        statement = statement.this
+    if not isinstance(statement, exp.Select):
+        return None
+    sources = {table.alias_or_name: table.name if isinstance(table, exp.Table) else None
+               for table in _source_tables(statement)}
+    width = 0
+    for projection in statement.expressions:
+        if isinstance(projection, exp.Star):
+            tables = list(sources.values())
+        elif isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star):
+            tables = [sources.get(projection.table)]
+        else:
+            width += 1
+            continue
+        if not all(table in schema for table in tables):
+            return None
+        width += sum(len(schema[table]["columns"]) for table in tables)
+    return width
+
+
+def _plain_table(statement: exp.Expression, schema: dict):
+    """(table name, name it is referred to by) of a row-per-row SELECT of one known table, else None."""
+    if (
+        not isinstance(statement, exp.Select)
+        or any(statement.args.get(name) for name in ("joins", "group", "having", "distinct"))
+        or statement.find(exp.AggFunc, exp.Window)
+    ):
+        return None
+    sources = _source_tables(statement)
+    if len(sources) != 1 or not isinstance(sources[0], exp.Table) or sources[0].name not in schema:
+        return None
+    return sources[0].name, sources[0].alias_or_name
+
+
+def _keyset_columns(statement: exp.Select, key: list, qualifier: str, table_columns: list):
+    """[output column, key column] pairs when the statement returns every key column once, else None."""
+    names = statement.named_selects
+    outputs = {}
+    for projection in statement.expressions:
+        if isinstance(projection, exp.Star) or (isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star)):
+            # * does not include SQLite's rowid
+            outputs.update((column, column) for column in key if column in table_columns and column not in outputs)
+            continue
+        column = projection.unalias()
+        if isinstance(column, exp.Column) and column.name in key and column.table in ("", qualifier):
+            outputs.setdefault(column.name, projection.alias_or_name)
+    if len(outputs) < len(key) or any(names.count(outputs[column]) > 1 for column in key):
+        return None
+    return [[outputs[column], column] for column in key]
+
+
+def stable_order(statement: exp.Expression, schema: dict, dialect: str):
+    """
+    Later pages of a result run the query again, and without an ORDER BY that
+    decides between every two rows a database may return them in another order
+    each time (parallel plans, synchronized scans), so pages would skip or repeat
+    rows. Returns the statement ordered to the end, by the primary key of a
+    single-table query (the rowid on SQLite) or else by every output column, and
+    a description of that order; the order is None for a one-row aggregate and
+    when the output columns can't be counted. keyset lists the [output column,
+    key column] pairs a page can continue after, when the rows are in key order
+    and include the key.
+    """
+    if _is_aggregate(statement):
+        return statement, None
+    read = _SQLGLOT_DIALECTS.get(dialect)
+    order = statement.args.get("order")
+    existing = list(order.expressions) if order else []
+    plain = _plain_table(statement, schema)
+    key = schema[plain[0]].get("primary_key") if plain else None
+    if plain and not key and dialect == "sqlite":
+        key = ["rowid"]
+    if key:
+        name, qualifier = plain
+        ordered = {o.this.name for o in existing
+                   if isinstance(o.this, exp.Column) and o.this.table in ("", qualifier)}
+        missing = [column for column in key if column not in ordered]
+        if missing:
+            # Parsed in the dialect, so NULLs sort the way that dialect sorts them by default
+            statement = statement.order_by(*[
+                exp.column(column, table=qualifier if qualifier != name else None).sql(dialect=read)
+                for column in missing
+            ], append=True, dialect=read)
+        keys_only = [o.this.name if isinstance(o.this, exp.Column) and not o.args.get("desc") else None
+                     for o in statement.args["order"].expressions]
+        keyset = None
+        if keys_only == key and _offset_value(statement) == 0 and _limit_value(statement) != -1:
+            table_columns = [column["name"] for column in schema[name]["columns"]]
+            keyset = _keyset_columns(statement, key, qualifier, table_columns)
+        return statement, {"by": statement.args["order"].sql(dialect=read), "keyset": keyset, "table": qualifier}
+
+    width = _output_width(statement, schema)
+    if width is None:
+        return statement, None
+    names = statement.named_selects
+    covered = set()
+    for o in existing:
+        if isinstance(o.this, exp.Literal) and o.this.is_int:
+            covered.add(int(o.this.this))
+        elif isinstance(o.this, exp.Column) and not o.this.table and names.count(o.this.name) == 1:
+            covered.add(names.index(o.this.name) + 1)
+    missing = [position for position in range(1, width + 1) if position not in covered]
+    if missing:
+        statement = statement.order_by(*[str(position) for position in missing], append=True, dialect=read)
+    return statement, {"by": statement.args["order"].sql(dialect=read), "keyset": None, "table": None}
+
+
+def _predicate_columns(statement: exp.Expression) -> dict:
+    """Maps each table to the columns used in WHERE and JOIN ... ON conditions on it."""
+    aliases = {table.alias_or_name: table.name for table in statement.find_all(exp.Table)}
+    tables = set(aliases.values())
+    conditions = [where.this for where in statement.find_all(exp.Where)]
+    conditions += [join.args["on"] for join in statement.find_all(exp.Join) if join.args.get("on")]
+    columns = collections.defaultdict(set)
+    for condition in conditions:
+        for column in condition.find_all(exp.Column):
+            if column.table:
+                table = aliases.get(column.table)
+            else:
+                table = next(iter(tables)) if len(tables) == 1 else None
+            if table:
+                columns[table].add(column.name)
+    return columns
+
+
+def _loop_cost(groups: dict, limit, sorted_or_grouped: bool) -> float:
+    """
+    Nested-loop estimate: the relations scanned under one plan node multiply, the
+    independent nodes add up. A LIMIT without sorting stops the outer loop early.
+    """
+    cost = 0.0
+    for sizes in groups.values():
+        product = 1.0
+        for size in sizes:
+            product *= max(size, 1)
+        if limit is not None and limit >= 0 and not sorted_or_grouped and sizes:
+            product = min(product, limit * product / max(sizes[0], 1))
+        cost += product
+    return cost
+
+
+def _sqlite_cost(conn, sql: str, statement: exp.Expression):
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    aliases = {table.alias_or_name: table.name for table in statement.find_all(exp.Table)}
+    groups = collections.defaultdict(list)
+    scanned = set()
+    sorted_or_grouped = False
+    for _, parent, _, detail in rows:
+        if detail.startswith("USE TEMP B-TREE"):
+            sorted_or_grouped = True
+        # "SCAN t" since SQLite 3.36, "SCAN TABLE t" before
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if not match or match.group(1) == "CONSTANT":
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        scanned.add(table)
+        try:
+            size = conn.execute(text(f'SELECT max(rowid) FROM "{table}"')).scalar() or 0
+        except Exception:
+            size = _UNKNOWN_ROWS
+        groups[parent].append(size)
+    return _loop_cost(groups, _limit_value(statement), sorted_or_grouped), scanned
+
+
+def _postgres_cost(conn, sql: str):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    scanned = set()
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name"):
+            scanned.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return float(root["Total Cost"]), scanned
+
+
+def _mysql_cost(conn, sql: str, statement: exp.Expression):
+    rows = conn.execute(text(f"EXPLAIN {sql}")).mappings().fetchall()
+    aliases = {table.alias_or_name: table.name for table in statement.find_all(exp.Table)}
+    groups = collections.defaultdict(list)
+    scanned = set()
+    sorted_or_grouped = False
+    for row in rows:
+        extra = row.get("Extra") or ""
+        if "filesort" in extra or "temporary" in extra:
+            sorted_or_grouped = True
+        groups[row.get("id")].append(float(row.get("rows") or 1))
+        if row.get("type") == "ALL" and row.get("table"):
+            scanned.add(aliases.get(row["table"], row["table"]))
+    return _loop_cost(groups, _limit_value(statement), sorted_or_grouped), scanned
+
+
+def estimate_cost(conn, sql: str, statement: exp.Expression):
+    """
+    Returns (estimated cost, tables read by full scan). The cost is the planner's
+    total cost on PostgreSQL and the estimated rows examined on MySQL and SQLite;
+    None when the dialect has no usable EXPLAIN.
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        return _sqlite_cost(conn, sql, statement)
+    if dialect == "postgresql":
+        return _postgres_cost(conn, sql)
+    if dialect in ("mysql", "mariadb"):
+        return _mysql_cost(conn, sql, statement)
+    return None, set()
+
+
+def guard_sql(conn, sql: str, schema: dict = None):
+    """
+    Checks generated SQL before it runs on conn and rewrites it where that makes it
+    safe. Returns (sql to run, report). Raises SQLGuardError if the statement is not
+    a single read-only query or its plan is too expensive even when downgraded.
+    schema (with primary keys) lets results be ordered by key, see stable_order.
+    """
+    dialect = conn.dialect.name
+    write = _SQLGLOT_DIALECTS.get(dialect)
+    statement = _parse(sql, dialect)
+    rewrites = []
+    run_sql = sql.strip().rstrip(";")
+
+    # Pages are read by running the query again: the rows need the same order every time
+    ordered, order = stable_order(statement, schema or {}, dialect)
+    if ordered is not statement:
+        statement = ordered
+        run_sql = statement.sql(dialect=write)
+        rewrites.append(f"Added {order['by']} so that result pages are stable")
+
+    # Bound every result: unlimited (or over-large) selects get the hard row limit
+    limit = _limit_value(statement)
+    if not _is_aggregate(statement) and (limit is None or limit > settings.SQL_HARD_ROW_LIMIT):
+        statement = _with_limit(statement, settings.SQL_HARD_ROW_LIMIT)
+        run_sql = statement.sql(dialect=write)
+        rewrites.append(f"Added LIMIT {settings.SQL_HARD_ROW_LIMIT}")
+
+    cost, scanned = estimate_cost(conn, run_sql, statement)
+    if cost is not None and cost > settings.SQL_MAX_ESTIMATED_COST:
+        limit = _limit_value(statement)
+        can_downgrade = (
+            not _is_aggregate(statement)
+            and (limit is None or limit < 0 or limit > settings.SQL_DOWNGRADE_ROW_LIMIT)
+        )
+        if can_downgrade:
+            downgraded = _with_limit(statement, settings.SQL_DOWNGRADE_ROW_LIMIT)
+            downgraded_sql = downgraded.sql(dialect=write)
+            downgraded_cost, scanned = estimate_cost(conn, downgraded_sql, downgraded)
+            if downgraded_cost is not None and downgraded_cost <= settings.SQL_MAX_ESTIMATED_COST:
+                rewrites.append(
+                    f"Limited to {settings.SQL_DOWNGRADE_ROW_LIMIT} rows: the full query was estimated "
+                    f"at cost {cost:,.0f}"
+                )
+                statement, run_sql, cost = downgraded, downgraded_sql, downgraded_cost
+        if cost > settings.SQL_MAX_ESTIMATED_COST:
+            raise SQLGuardError(
+                f"This query would read too much data (estimated cost {cost:,.0f}, limit "
+                f"{settings.SQL_MAX_ESTIMATED_COST:,.0f}). Try narrowing it with a filter or asking for "
+                "a total, count or average instead of individual rows."
+            )
+
+    index_hints = []
+    predicates = _predicate_columns(statement)
+    for table in sorted(scanned):
+        if predicates.get(table):
+            hint = f"{table}({', '.join(sorted(predicates[table]))})"
+            index_hints.append(hint)
+            logger.info("Full scan of %s filtered on %s; an index on %s would help", table,
+                        ", ".join(sorted(predicates[table])), hint)
+
+    return run_sql, {"estimated_cost": cost, "rewrites": rewrites, "index_hints": index_hints, "order": order}
+
+
+def _after(keyset: list, table: str, values: list) -> exp.Expression:
+    """Rows past the given key values: a > x OR (a = x AND b > y) ..., which every dialect runs."""
+    columns = [exp.column(column, table=table) for _, column in keyset]
+    literals = [exp.convert(value) for value in values]
+    condition = None
+    for i in range(len(columns)):
+        term = exp.GT(this=columns[i].copy(), expression=literals[i].copy())
+        for j in range(i):
+            term = exp.and_(exp.EQ(this=columns[j].copy(), expression=literals[j].copy()), term)
+        condition = term if condition is None else exp.or_(condition, term)
+    return condition
+
+
+def page_sql(sql: str, dialect: str, order: dict, offset: int, rows: int = None, after: list = None) -> str:
+    """
+    The statement reading the rows of sql's result from offset on, at most rows of
+    them (all of them when rows is None). sql is the guarded statement, already in
+    its stable order. With after, the key values of the row before offset, the
+    statement seeks past them by key (an index range scan) instead of reading and
+    skipping offset rows.
+    """
+    statement = _parse(sql, dialect)
+    limit = _limit_value(statement)
+    remaining = limit - offset if limit is not None and limit >= 0 else None
+    if rows is not None:
+        remaining = rows if remaining is None else min(rows, remaining)
+    if after is not None and order and order.get("keyset"):
+        statement = statement.where(_after(order["keyset"], order["table"], after))
+    else:
+        statement = statement.offset(_offset_value(statement) + offset)
+    if remaining is not None:
+        statement = statement.limit(max(remaining, 0))
+    return statement.sql(dialect=_SQLGLOT_DIALECTS.get(dialect))
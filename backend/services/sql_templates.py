@@ -0,0 +1,263 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from backend.config import settings
+from backend.services.semantic_cache import normalize_query
+
+# Literals a question can carry: quoted text, numbers and capitalized names
+# ("Engineering", "New York", "O'Brien"). The first word of a question is never a
+# name. An apostrophe between two letters is part of a word, not a quote.
+_QUOTED = re.compile(r"\"([^\"]+)\"|(?<!\w)'((?:[^']|(?<=\w)'(?=\w))+)'(?!\w)")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_NAME_WORD = r"[A-Z](?:[\w&-]|'(?=\w))*"
+_NAME = re.compile(rf"\b{_NAME_WORD}(?:\s+{_NAME_WORD})*")
+_SQL_STRING = re.compile(r"'((?:[^']|'')*)'")
+_PLACEHOLDER = "__p{}__"
+
+
+def extract_literals(question: str):
+    """
+    Returns the question's literals in order of appearance and the question
+    skeleton: the normalized question with every literal replaced by a placeholder.
+    """
+    spans = []
+    for match in _QUOTED.finditer(question):
+        spans.append((match.start(), match.end(), match.group(1) or match.group(2), "string"))
+
+    def free(start, end):
+        return all(end <= s or start >= e for s, e, _, _ in spans)
+
+    for match in _NUMBER.finditer(question):
+        if free(match.start(), match.end()):
+            spans.append((match.start(), match.end(), match.group(0), "number"))
+    first_word = re.match(r"\s*\S+", question)
+    for match in _NAME.finditer(question):
+        start = match.start()
+        if first_word and start < first_word.end():
+            # "What Engineering ..." -> skip "What", keep the rest of the run
+            rest = re.match(r"\S+\s*", match.group(0))
+            start += rest.end()
+        if start < match.end() and free(start, match.end()):
+            spans.append((start, match.end(), question[start:match.end()].strip(), "string"))
+
+    spans.sort()
+    literals = []
+    skeleton = question
+    for index, (start, end, value, kind) in reversed(list(enumerate(spans))):
+        skeleton = skeleton[:start] + f" {_PLACEHOLDER.format(index)} " + skeleton[end:]
+    for _, _, value, kind in spans:
+        literals.append({"value": value, "kind": kind})
+    return literals, normalize_query(skeleton)
+
+
+def _case_of(value: str, literal: str):
+    for case, transform in (("as_is", str), ("lower", str.lower), ("upper", str.upper)):
+        if transform(literal) == value:
+            return case
+    return None
+
+
+def parameterize(sql: str, literals: list):
+    """
+    Replaces the question's literals in the generated SQL with placeholders.
+    Returns (template, parameters), or None if some literal of the question can't
+    be found verbatim in the SQL; such a template could not be re-bound safely.
+    """
+    parameters = []
+    used = set()
+
+    def replace_string(match):
+        content = match.group(1).replace("''", "'")
+        for index, literal in enumerate(literals):
+            if literal["kind"] != "string":
+                continue
+            core = content.strip("%")
+            case = _case_of(core, literal["value"])
+            if case:
+                used.add(index)
+                parameters.append({
+                    "index": index, "case": case,
+                    "prefix": content[:len(content) - len(content.lstrip("%"))],
+                    "suffix": content[len(content.rstrip("%")):],
+                })
+                return f"{{{len(parameters) - 1}}}"
+        return match.group(0).replace("{", "{{").replace("}", "}}")
+
+    # Strings first, so numbers inside string literals are left alone
+    pieces = []
+    last = 0
+    for match in _SQL_STRING.finditer(sql):
+        pieces.append(("code", sql[last:match.start()]))
+        pieces.append(("string", replace_string(match)))
+        last = match.end()
+    pieces.append(("code", sql[last:]))
+
+    def replace_number(match):
+        for index, literal in enumerate(literals):
+            if literal["kind"] == "number" and float(literal["value"]) == float(match.group(0)):
+                used.add(index)
+                parameters.append({"index": index, "case": "number", "prefix": "", "suffix": ""})
+                return f"{{{len(parameters) - 1}}}"
+        return match.group(0)
+
+    template = "".join(
+        _NUMBER.sub(replace_number, piece.replace("{", "{{").replace("}", "}}")) if kind == "code" else piece
+        for kind, piece in pieces
+    )
+    if len(used) != len(literals):
+        return None
+    return template, parameters
+
+
+def render(template: str, parameters: list, literals: list, quote) -> str:
+    """Binds the literals of a new question into a template, quoting strings with the dialect's rules."""
+    values = []
+    for parameter in parameters:
+        literal = literals[parameter["index"]]
+        if parameter["case"] == "number":
+            if literal["kind"] != "number":
+                raise ValueError("Literal type changed")
+            values.append(literal["value"])
+            continue
+        value = {"as_is": str, "lower": str.lower, "upper": str.upper}[parameter["case"]](literal["value"])
+        values.append(quote(parameter["prefix"] + value + parameter["suffix"]))
+    return template.format(*values)
+
+
+class SQLTemplateStore:
+    """
+    Parameterized SQL learned from answered questions, keyed by the question
+    skeleton (the normalized question with its literals taken out). A question of
+    a known shape is answered by binding its literals into the template instead
+    of calling the LLM. Templates live in a local SQLite file and are only valid
+    for the schema fingerprint they were learned on.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS templates (
+                scope TEXT NOT NULL,
+                schema_fingerprint TEXT NOT NULL,
+                skeleton TEXT NOT NULL,
+                sql_template TEXT NOT NULL,
+                parameters TEXT NOT NULL,
+                literal_kinds TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, schema_fingerprint, skeleton)
+            );
+        """)
+        self._conn.commit()
+        self._counters = {"lookups": 0, "hits": 0, "learned": 0, "rejected": 0}
+
+    def find(self, scope: str, fingerprint: str, question: str, quote):
+        """
+        Returns (sql, skeleton) if a template of the question's shape exists, else None.
+        quote renders a string as a literal of the target dialect.
+        """
+        literals, skeleton = extract_literals(question)
+        with self._lock:
+            # Counters are updated from worker threads; they share the store's lock
+            self._counters["lookups"] += 1
+        if not literals:
+            return None
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT sql_template, parameters, literal_kinds FROM templates
+                WHERE scope = ? AND schema_fingerprint = ? AND skeleton = ?
+            """, (scope, fingerprint, skeleton)).fetchone()
+        if row is None:
+            return None
+        template, parameters, literal_kinds = row[0], json.loads(row[1]), json.loads(row[2])
+        if literal_kinds != [literal["kind"] for literal in literals]:
+            return None
+        try:
+            return render(template, parameters, literals, quote), skeleton
+        except (ValueError, IndexError, KeyError):
+            return None
+
+    def record_hit(self, scope: str, fingerprint: str, skeleton: str):
+        with self._lock:
+            self._counters["hits"] += 1
+            self._conn.execute("""
+                UPDATE templates SET hits = hits + 1, last_used_at = ?
+                WHERE scope = ? AND schema_fingerprint = ? AND skeleton = ?
+            """, (time.time(), scope, fingerprint, skeleton))
+            self._conn.commit()
+
+    def reject(self, scope: str, fingerprint: str, skeleton: str):
+        """Drops a template whose SQL no longer passes EXPLAIN."""
+        with self._lock:
+            self._counters["rejected"] += 1
+            self._conn.execute(
+                "DELETE FROM templates WHERE scope = ? AND schema_fingerprint = ? AND skeleton = ?",
+                (scope, fingerprint, skeleton)
+            )
+            self._conn.commit()
+
+    def learn(self, scope: str, fingerprint: str, question: str, sql: str) -> bool:
+        """
+        Stores the template of an answered question; returns False if it has no
+        re-bindable literals or a template of its shape is already known.
+        """
+        literals, skeleton = extract_literals(question)
+        if not literals:
+            return False
+        parameterized = parameterize(sql, literals)
+        if parameterized is None:
+            return False
+        template, parameters = parameterized
+        now = time.time()
+        with self._lock:
+            learned = self._conn.execute("""
+                INSERT INTO templates (scope, schema_fingerprint, skeleton, sql_template, parameters,
+                                       literal_kinds, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(scope, schema_fingerprint, skeleton) DO NOTHING
+            """, (scope, fingerprint, skeleton, template, json.dumps(parameters),
+                  json.dumps([literal["kind"] for literal in literals]), now, now)).rowcount == 1
+            self._counters["learned"] += learned
+            self._conn.commit()
+        return learned
+
+    def purge(self, scope: str, fingerprint: str) -> int:
+        """Deletes the templates of a database that were learned on another schema version."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM templates WHERE scope = ? AND schema_fingerprint != ?", (scope, fingerprint)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            templates, hits = self._conn.execute("SELECT count(*), coalesce(sum(hits), 0) FROM templates").fetchone()
+            counters = dict(self._counters)
+        lookups = counters["lookups"]
+        return dict(
+            counters,
+            hit_rate=round(counters["hits"] / lookups, 4) if lookups else None,
+            templates=templates,
+            # Persistent across workers and restarts: every template hit is an LLM call not made
+            llm_calls_avoided=hits,
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sql_template_store() -> SQLTemplateStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SQLTemplateStore(settings.SQL_TEMPLATE_PATH)
+    return _store
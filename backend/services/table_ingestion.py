@@ -0,0 +1,498 @@
+import datetime
+import decimal
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, Float, MetaData, String, Table, Text, inspect, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import settings
+from backend.services import metrics
+from backend.services.db_engines import get_engine
+
+# pandas is imported where it is used: it costs a noticeable part of the API's startup
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Uploads with these extensions are tables: they go to the SQL store, not the vector store
+TABLE_EXTENSIONS = ('csv', 'tsv')
+MODES = ('create', 'replace', 'append', 'upsert')
+
+_TRUE = frozenset({"true", "yes", "y", "t"})
+_FALSE = frozenset({"false", "no", "n", "f"})
+_INTEGER = re.compile(r"[+-]?\d+")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?")
+_INT64_MAX = 2 ** 63 - 1
+_WIDER = {frozenset(("integer", "float")): "float", frozenset(("date", "datetime")): "datetime"}
+
+_SQL_TYPES = {
+    "integer": BigInteger,
+    "float": Float,
+    "boolean": Boolean,
+    "date": Date,
+    "datetime": DateTime,
+    "text": Text,
+}
+
+# SQLite has a single writer; concurrent file transactions on one database take turns
+_sqlite_write_locks = {}
+_sqlite_write_locks_lock = threading.Lock()
+
+
+class TableIngestionError(ValueError):
+    """A file can't be loaded into its table; the message is meant for the user."""
+
+
+class _TypesTooNarrow(Exception):
+    """A later chunk holds values the types inferred from the first chunk can't."""
+
+
+def is_table_file(filename: str) -> bool:
+    return filename.rsplit('.', 1)[-1].lower() in TABLE_EXTENSIONS
+
+
+def table_name_for(filename: str) -> str:
+    """'Sales Report 2024.csv' -> 'sales_report_2024'"""
+    base = os.path.splitext(os.path.basename(filename))[0]
+    name = re.sub(r"\W+", "_", base).strip("_").lower()
+    if not name or name[0].isdigit():
+        name = f"t_{name}"
+    return name
+
+
+def infer_column_type(values: "pd.Series"):
+    """
+    The narrowest of integer, float, boolean, date, datetime and text that holds
+    every non-empty value, None if there is none. Dates are only recognized in ISO
+    format.
+    """
+    import pandas as pd
+
+    values = values.dropna().str.strip()
+    values = values[values != ""]
+    if values.empty:
+        return None
+    if values.str.fullmatch(_INTEGER).all():
+        if pd.to_numeric(values).abs().max() <= _INT64_MAX:
+            return "integer"
+        return "text"
+    if pd.to_numeric(values, errors="coerce").notna().all():
+        return "float"
+    if values.str.lower().isin(_TRUE | _FALSE).all():
+        return "boolean"
+    if values.str.fullmatch(_DATE).all():
+        return "date"
+    if values.str.fullmatch(_DATETIME).all():
+        return "datetime"
+    return "text"
+
+
+def widen(kind, other):
+    """The narrowest type holding the values of both: integer and float make float, date and datetime datetime."""
+    if kind is None or kind == other:
+        return other
+    if other is None:
+        return kind
+    return _WIDER.get(frozenset((kind, other)), "text")
+
+
+def _convert(frame: "pd.DataFrame", types: dict, first_row: int) -> "pd.DataFrame":
+    import pandas as pd
+
+    converted = {}
+    for name, kind in types.items():
+        values = frame[name]
+        try:
+            if kind == "text":
+                converted[name] = values
+                continue
+            stripped = values.str.strip().replace("", None)
+            if kind == "integer":
+                converted[name] = pd.to_numeric(stripped).astype("Int64")
+            elif kind == "float":
+                converted[name] = pd.to_numeric(stripped)
+            elif kind == "boolean":
+                lowered = stripped.str.lower()
+                unknown = lowered.notna() & ~lowered.isin(_TRUE | _FALSE)
+                if unknown.any():
+                    raise ValueError(f"'{values[unknown].iloc[0]}' is not a boolean")
+                converted[name] = lowered.map(lambda v: None if v is None or v != v else v in _TRUE)
+            elif kind == "date":
+                converted[name] = pd.to_datetime(stripped, format="ISO8601").dt.date
+            else:
+                converted[name] = pd.to_datetime(stripped, format="ISO8601")
+        except (ValueError, TypeError) as e:
+            raise TableIngestionError(
+                f"Column '{name}' is {kind}, but the rows from {first_row + 1} on don't all match: {e}"
+            )
+    return pd.DataFrame(converted)
+
+
+def _records(frame: "pd.DataFrame") -> list:
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def _read_chunks(path: str, filename: str, chunk_rows: int):
+    import pandas as pd
+
+    separator = "\t" if filename.lower().endswith(".tsv") else ","
+    # Everything is read as text; types are inferred from the first chunk and applied to all,
+    # or from every chunk when a later one doesn't fit them (see ingest_table_file)
+    return pd.read_csv(path, sep=separator, dtype=str, chunksize=chunk_rows, encoding_errors="replace")
+
+
+def _kind_of(sql_type) -> str:
+    """The inference kind matching an existing column, so appended rows are converted to its type."""
+    try:
+        python_type = sql_type.python_type
+    except NotImplementedError:
+        return "text"
+    # bool before int and datetime before date: each is a subclass of the other
+    for kind, candidate in (("boolean", bool), ("integer", int), ("float", float), ("datetime", datetime.datetime),
+                            ("date", datetime.date)):
+        if issubclass(python_type, candidate):
+            return kind
+    if issubclass(python_type, decimal.Decimal):
+        return "float"
+    return "text"
+
+
+def _infer_types(path: str, filename: str, chunk_rows: int) -> OrderedDict:
+    """Column types that hold every value of the file: the types of all its chunks, widened."""
+    types = None
+    for chunk in _read_chunks(path, filename, chunk_rows):
+        chunk.columns = [str(name).strip() for name in chunk.columns]
+        kinds = [(name, infer_column_type(chunk[name])) for name in chunk.columns]
+        if types is None:
+            types = OrderedDict(kinds)
+        else:
+            for name, kind in kinds:
+                types[name] = widen(types[name], kind)
+    return OrderedDict((name, kind or "text") for name, kind in (types or {}).items())
+
+
+def _staging_name(table_name: str) -> str:
+    return f"_staging_{table_name}"
+
+
+def _create_table(conn, table_name: str, types: dict, key_columns: list) -> Table:
+    columns = []
+    for name, kind in types.items():
+        sql_type = _SQL_TYPES[kind]()
+        if name in key_columns and kind == "text":
+            # MySQL can't index unbounded text
+            sql_type = String(255)
+        columns.append(Column(name, sql_type, primary_key=name in key_columns, nullable=name not in key_columns))
+    table = Table(table_name, MetaData(), *columns)
+    table.create(conn)
+    return table
+
+
+def _prepare_table(conn, table_name: str, types: dict, mode: str, key_columns: list):
+    """
+    Creates the table the file is written to and checks that the file fits it.
+    Returns the table, the column types to convert the file to (the inferred ones
+    for a new table, the existing columns' types otherwise) and whether the table
+    is new. create and replace write to a staging table, which _swap_in puts in
+    place once every row is loaded, so a failed load leaves the existing table as
+    it was; create refuses a table that already exists.
+    """
+    preparer = conn.dialect.identifier_preparer
+    exists = inspect(conn).has_table(table_name)
+    if exists and mode == "create":
+        raise TableIngestionError(
+            f"Table '{table_name}' already exists; load into it with mode append, upsert or replace"
+        )
+    if mode in ("create", "replace"):
+        staging = _staging_name(table_name)
+        if inspect(conn).has_table(staging):
+            # Left behind by a load that was killed
+            conn.execute(text(f"DROP TABLE {preparer.quote(staging)}"))
+        return _create_table(conn, staging, types, key_columns), types, True
+
+    if not exists:
+        return _create_table(conn, table_name, types, key_columns), types, True
+    table = Table(table_name, MetaData(), autoload_with=conn)
+    unknown = [name for name in types if name not in table.columns]
+    if unknown:
+        raise TableIngestionError(f"Table '{table_name}' has no column(s) {', '.join(unknown)}")
+    if mode == "upsert":
+        primary_key = {column.name for column in table.primary_key.columns}
+        unique = [set(u["column_names"]) for u in inspect(conn).get_unique_constraints(table_name)]
+        if set(key_columns) != primary_key and set(key_columns) not in unique:
+            raise TableIngestionError(
+                f"Upsert needs a primary key or unique constraint on ({', '.join(key_columns)}) "
+                f"in table '{table_name}'"
+            )
+    return table, OrderedDict((name, _kind_of(table.columns[name].type)) for name in types), False
+
+
+def _swap_in(conn, staging: Table, table_name: str):
+    """Replaces the table (if it exists) by the loaded staging table, in the load's transaction."""
+    preparer = conn.dialect.identifier_preparer
+    quoted, staged = preparer.quote(table_name), preparer.quote(staging.name)
+    exists = inspect(conn).has_table(table_name)
+    if conn.dialect.name in ("mysql", "mariadb"):
+        # MySQL commits DDL right away; RENAME TABLE swaps both names in one step
+        if exists:
+            replaced = preparer.quote(f"_replaced_{table_name}")
+            conn.execute(text(f"RENAME TABLE {quoted} TO {replaced}, {staged} TO {quoted}"))
+            conn.execute(text(f"DROP TABLE {replaced}"))
+        else:
+            conn.execute(text(f"RENAME TABLE {staged} TO {quoted}"))
+        return
+    if exists:
+        conn.execute(text(f"DROP TABLE {quoted}"))
+    conn.execute(text(f"ALTER TABLE {staged} RENAME TO {quoted}"))
+    if conn.dialect.name == "postgresql" and staging.primary_key.columns:
+        # Index names are unique per schema: the next staging table needs the staging name again
+        conn.execute(text(
+            f"ALTER INDEX {preparer.quote(staging.name + '_pkey')} RENAME TO {preparer.quote(table_name + '_pkey')}"
+        ))
+
+
+def _upsert_statement(conn, table: Table, key_columns: list, columns: list):
+    dialect = conn.dialect.name
+    updated = [name for name in columns if name not in key_columns]
+    if dialect in ("sqlite", "postgresql"):
+        statement = (sqlite_insert if dialect == "sqlite" else postgresql_insert)(table)
+        if not updated:
+            return statement.on_conflict_do_nothing(index_elements=key_columns)
+        return statement.on_conflict_do_update(
+            index_elements=key_columns, set_={name: statement.excluded[name] for name in updated}
+        )
+    if dialect in ("mysql", "mariadb"):
+        statement = mysql_insert(table)
+        updated = updated or key_columns[:1]
+        return statement.on_duplicate_key_update({name: statement.inserted[name] for name in updated})
+    raise TableIngestionError(f"Upsert is not supported on {dialect}")
+
+
+def _copy_cursor(conn):
+    """The psycopg2 cursor for COPY, or None when the connection is not PostgreSQL through psycopg2."""
+    if conn.dialect.name != "postgresql":
+        return None
+    cursor = conn.connection.driver_connection.cursor()
+    return cursor if hasattr(cursor, "copy_expert") else None
+
+
+class _CopyWriter:
+    """
+    Loads chunks with PostgreSQL COPY, the fastest bulk path. Upserts are copied
+    into a temporary table first and merged with INSERT ... ON CONFLICT.
+    """
+
+    def __init__(self, conn, cursor, table: Table, columns: list, mode: str, key_columns: list):
+        self.conn = conn
+        self.cursor = cursor
+        preparer = conn.dialect.identifier_preparer
+        self.target = preparer.format_table(table)
+        self.column_list = ", ".join(preparer.quote(name) for name in columns)
+        self.merge = None
+        self.copy_into = self.target
+        if mode == "upsert":
+            self.copy_into = preparer.quote(f"_ingest_{table.name}")
+            conn.execute(text(
+                f"CREATE TEMP TABLE {self.copy_into} (LIKE {self.target} INCLUDING DEFAULTS) ON COMMIT DROP"
+            ))
+            keys = ", ".join(preparer.quote(name) for name in key_columns)
+            updates = ", ".join(
+                f"{preparer.quote(name)} = EXCLUDED.{preparer.quote(name)}" for name in columns if name not in key_columns
+            )
+            action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            self.merge = (
+                f"INSERT INTO {self.target} ({self.column_list}) SELECT {self.column_list} FROM {self.copy_into} "
+                f"ON CONFLICT ({keys}) {action}"
+            )
+
+    def write(self, frame: "pd.DataFrame"):
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        self.cursor.copy_expert(f"COPY {self.copy_into} ({self.column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        if self.merge:
+            self.conn.execute(text(self.merge))
+            self.conn.execute(text(f"TRUNCATE {self.copy_into}"))
+
+
+def _write_lock(connection_string: str, dialect: str):
+    if dialect != "sqlite":
+        return None
+    with _sqlite_write_locks_lock:
+        return _sqlite_write_locks.setdefault(connection_string, threading.Lock())
+
+
+def _load(engine, path: str, filename: str, table_name: str, mode: str, key_columns: list, chunk_rows: int,
+          types: OrderedDict = None) -> tuple:
+    """
+    Streams the file into its table in one transaction; returns (rows, method,
+    column types). A new table's types are inferred from the first chunk unless
+    given, and _TypesTooNarrow is raised when a later chunk doesn't fit them.
+    """
+    inferred = types is None
+    rows = 0
+    method = "executemany"
+    table = None
+    try:
+        with engine.begin() as conn:
+            writer = None
+            for chunk in _read_chunks(path, filename, chunk_rows):
+                if table is None:
+                    chunk.columns = [str(name).strip() for name in chunk.columns]
+                    missing = [name for name in key_columns if name not in chunk.columns]
+                    if missing:
+                        raise TableIngestionError(f"Key column(s) {', '.join(missing)} not in {filename}")
+                    if inferred:
+                        types = OrderedDict((name, infer_column_type(chunk[name]) or "text") for name in chunk.columns)
+                    table, types, created = _prepare_table(conn, table_name, types, mode, key_columns)
+                    cursor = _copy_cursor(conn)
+                    if cursor is not None:
+                        writer = _CopyWriter(conn, cursor, table, list(types), mode, key_columns)
+                        method = "copy"
+                    elif mode == "upsert":
+                        statement = _upsert_statement(conn, table, key_columns, list(types))
+                    else:
+                        statement = table.insert()
+                else:
+                    chunk.columns = list(types)
+                try:
+                    frame = _convert(chunk, types, rows)
+                except TableIngestionError as e:
+                    if created and inferred:
+                        raise _TypesTooNarrow(str(e))
+                    raise
+                if writer is not None:
+                    writer.write(frame)
+                else:
+                    conn.execute(statement, _records(frame))
+                rows += len(frame)
+            if table is not None and mode in ("create", "replace"):
+                _swap_in(conn, table, table_name)
+    except Exception:
+        if table is not None and mode in ("create", "replace"):
+            # The rows are rolled back, but SQLite and MySQL may already have committed the staging table
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {conn.dialect.identifier_preparer.quote(table.name)}"))
+        raise
+    return rows, method, types
+
+
+def ingest_table_file(connection_string: str, path: str, filename: str, table_name: str = None,
+                      mode: str = "append", key_columns: list = None, chunk_rows: int = None) -> dict:
+    """
+    Streams one CSV/TSV file into a table in chunks of chunk_rows rows, in a single
+    transaction. Column types of a new table are inferred from the first chunk;
+    when a later chunk holds a value they can't (a float in an integer column), the
+    load is rolled back and repeated with the types of every chunk, widened. Rows
+    for an existing table are converted to its column types. Rows are written with
+    COPY on PostgreSQL (psycopg2) and with batched executemany elsewhere.
+    mode is "create" (a new table only), "replace" (drop and re-create), "append",
+    or "upsert" on key_columns. create and replace load a staging table and only
+    put it in place of the table once every row is in.
+    Returns a report with the row count and rows/sec.
+    """
+    if mode not in MODES:
+        raise TableIngestionError(f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    key_columns = list(key_columns or [])
+    if mode == "upsert" and not key_columns:
+        raise TableIngestionError("Upsert needs at least one key column")
+    table_name = table_name or table_name_for(filename)
+    chunk_rows = chunk_rows or settings.TABLE_INGESTION_CHUNK_ROWS
+
+    import pandas as pd
+
+    engine = get_engine(connection_string)
+    lock = _write_lock(connection_string, engine.dialect.name)
+    if lock:
+        lock.acquire()
+    started = time.perf_counter()
+    try:
+        try:
+            rows, method, types = _load(engine, path, filename, table_name, mode, key_columns, chunk_rows)
+        except _TypesTooNarrow as e:
+            logger.info("%s: %s; inferring the column types from the whole file", filename, e)
+            types = _infer_types(path, filename, chunk_rows)
+            rows, method, types = _load(engine, path, filename, table_name, mode, key_columns, chunk_rows, types)
+    except pd.errors.EmptyDataError:
+        raise TableIngestionError(f"{filename} is empty")
+    finally:
+        if lock:
+            lock.release()
+
+    seconds = time.perf_counter() - started
+    metrics.STAGE_SECONDS.observe(seconds, stage="table_load")
+    metrics.TABLE_ROWS.inc(rows)
+    report = {
+        "file": filename,
+        "table": table_name,
+        "mode": mode,
+        "method": method,
+        "rows": rows,
+        "columns": dict(types or {}),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+    }
+    logger.info("Loaded %d rows from %s into %s in %.2fs (%s)", rows, filename, table_name, seconds, method)
+    return report
+
+
+def ingest_table_files(connection_string: str, files: list, mode: str = "append", key_columns: list = None,
+                       workers: int = None, chunk_rows: int = None) -> dict:
+    """
+    Loads several files in parallel. files is a list of (path, filename) or
+    (path, filename, table_name). Files going to the same table run one after the
+    other, and with mode "create" or "replace" only the first one creates the
+    table; the others are appended to it. A failing file
+    doesn't stop the others; its report carries the error.
+    """
+    by_table = OrderedDict()
+    for entry in files:
+        path, filename = entry[0], entry[1]
+        table_name = entry[2] if len(entry) > 2 and entry[2] else table_name_for(filename)
+        by_table.setdefault(table_name, []).append((path, filename))
+
+    def load(table_name, table_files):
+        reports = []
+        table_mode = mode
+        for path, filename in table_files:
+            try:
+                reports.append(ingest_table_file(
+                    connection_string, path, filename, table_name, table_mode, key_columns, chunk_rows
+                ))
+            except Exception as e:
+                # Database errors carry the whole statement; the driver's message is enough
+                error = str(getattr(e, "orig", None) or e)
+                logger.warning("Loading %s into %s failed: %s", filename, table_name, error)
+                reports.append({"file": filename, "table": table_name, "error": error})
+                continue
+            if table_mode in ("create", "replace"):
+                table_mode = "append"
+        return reports
+
+    started = time.perf_counter()
+    workers = max(1, min(workers or settings.TABLE_INGESTION_WORKERS, len(by_table) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda item: load(*item), by_table.items()))
+    seconds = time.perf_counter() - started
+
+    reports = [report for table_reports in results for report in table_reports]
+    rows = sum(report.get("rows", 0) for report in reports)
+    return {
+        "files": reports,
+        "rows": rows,
+        "failed_files": sum(1 for report in reports if "error" in report),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+    }
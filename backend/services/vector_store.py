@@ -0,0 +1,470 @@
+"""
+Local vector store for corpora too large for Chroma's in-memory float32 index.
+
+Embeddings are kept quantized (int8 with a per-vector scale, or float16) in
+memory-mapped array files: a query scores them with vectorized NumPy, only in
+the closest IVF partitions once the store is large enough, and then re-scores the
+best candidates exactly against the float32 vectors. Those stay in their own
+memory-mapped file and are only paged in for the candidates, so the memory that
+has to stay resident for fast queries is the quantized codes: a quarter (int8)
+or half (float16) of the float32 vectors.
+
+Chunk ids, texts and metadata live in a SQLite file next to the arrays. The store
+implements the part of the Chroma collection API the application uses (upsert,
+get, delete, query, count, and where filters with $in/$gte/$lte/$and), so
+shared_resources hands out either one. Distances are cosine distances (1 - cosine
+similarity). One process writes at a time; readers in other processes pick up
+growth and new partitions on their next query.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 4096
+# Rows scored per NumPy block; bounds the float32 copy of the codes
+_BLOCK_ROWS = 65536
+# List id of a deleted (free) row
+_FREE = -1
+_KMEANS_ITERATIONS = 10
+# Training sample per partition
+_KMEANS_SAMPLE_PER_LIST = 64
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_KEY = re.compile(r"\w+")
+
+
+def _where_sql(where: dict) -> tuple:
+    """SQL condition on the JSON metadata for a Chroma-style where filter, and its parameters."""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key == "$and":
+            for part in condition:
+                sql, part_params = _where_sql(part)
+                clauses.append(sql)
+                params.extend(part_params)
+            continue
+        if not _KEY.fullmatch(key):
+            raise ValueError(f"Unsupported metadata key: {key!r}")
+        field = f"json_extract(metadata, '$.{key}')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                negation = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{field} {negation}IN ({', '.join('?' * len(values))})" if values
+                               else ("1" if negation else "0"))
+                params.extend(values)
+            elif operator in _OPERATORS:
+                clauses.append(f"{field} {_OPERATORS[operator]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return " AND ".join(f"({clause})" for clause in clauses) or "1", params
+
+
+class QuantizedVectorStore:
+    def __init__(self, path: str, dtype: str = "int8", rerank_candidates: int = 100,
+                 ivf_lists: int = 256, ivf_probes: int = 16, ivf_min_vectors: int = 100000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rerank_candidates = rerank_candidates
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.ivf_min_vectors = ivf_min_vectors
+        # Writers and the SQLite connection; searches only hold it to take a snapshot
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.db"), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS vectors_source ON vectors (json_extract(metadata, '$.source'));
+            CREATE TABLE IF NOT EXISTS store_settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._conn.commit()
+
+        stored_dtype = self._setting("dtype")
+        if stored_dtype and stored_dtype != dtype:
+            logger.warning("Vector store %s holds %s codes; ignoring the configured %s", path, stored_dtype, dtype)
+        self.dtype = stored_dtype or dtype
+        self.dim = int(self._setting("dim")) if self._setting("dim") else None
+        self._capacity = 0
+        self._size = 0
+        self._codes = self._scales = self._exact = self._lists = None
+        self._centroids = None
+        self._centroids_mtime = None
+        self._trained_on = int(self._setting("trained_on") or 0)
+        if self.dim is not None:
+            with self._lock:
+                self._open_arrays()
+                self._size = self._high_water()
+                self._release_unreferenced_rows()
+                self._load_centroids()
+
+    # -- files -------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _array_specs(self) -> list:
+        """(file name, dtype, row shape) of every per-row array."""
+        specs = [
+            (f"codes.{self.dtype}", np.int8 if self.dtype == "int8" else np.float16, (self.dim,)),
+            ("vectors.float32", np.float32, (self.dim,)),
+            ("lists.int32", np.int32, ()),
+        ]
+        if self.dtype == "int8":
+            specs.append(("scales.float32", np.float32, ()))
+        return specs
+
+    def _open_arrays(self, capacity: int = 0):
+        """Maps the arrays, growing the files to capacity rows first if they are smaller."""
+        current = os.path.getsize(self._file("vectors.float32")) // (self.dim * 4) \
+            if os.path.exists(self._file("vectors.float32")) else 0
+        capacity = max(capacity, current)
+        arrays = {}
+        for name, dtype, shape in self._array_specs():
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape or (1,)))
+            with open(self._file(name), "ab") as f:
+                if f.tell() < capacity * row_bytes:
+                    # Extended files read as zeros (and stay sparse until written)
+                    f.truncate(capacity * row_bytes)
+            arrays[name.split(".")[0]] = np.memmap(self._file(name), dtype=dtype, mode="r+", shape=(capacity,) + shape)
+        if capacity > current:
+            arrays["lists"][current:] = _FREE
+        self._codes, self._exact, self._lists = arrays["codes"], arrays["vectors"], arrays["lists"]
+        self._scales = arrays.get("scales")
+        self._capacity = capacity
+
+    def _flush(self):
+        for array in (self._codes, self._exact, self._lists, self._scales):
+            if array is not None:
+                array.flush()
+
+    def _setting(self, key: str):
+        row = self._conn.execute("SELECT value FROM store_settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO store_settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _high_water(self) -> int:
+        return self._conn.execute("SELECT coalesce(max(row) + 1, 0) FROM vectors").fetchone()[0]
+
+    def _release_unreferenced_rows(self):
+        """Rows written by an upsert that never committed are not live."""
+        free = [row for (row,) in self._conn.execute("SELECT row FROM vectors WHERE chunk_id IS NULL")]
+        if free:
+            self._lists[np.array(free)] = _FREE
+        if self._size < self._capacity:
+            self._lists[self._size:] = _FREE
+
+    def _load_centroids(self):
+        path = self._file("centroids.npy")
+        if not os.path.exists(path):
+            self._centroids = None
+            return
+        mtime = os.path.getmtime(path)
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(path)
+            self._centroids_mtime = mtime
+
+    def _refresh(self):
+        """Picks up rows and partitions added by another process."""
+        if self.dim is None:
+            dim = self._setting("dim")
+            if dim is None:
+                return
+            self.dim = int(dim)
+            self.dtype = self._setting("dtype")
+        size = self._high_water()
+        if size > self._capacity or self._codes is None:
+            self._open_arrays(size)
+        self._size = size
+        self._load_centroids()
+
+    # -- writing -----------------------------------------------------------
+
+    def _quantize(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._codes[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._codes[rows] = vectors.astype(np.float16)
+
+    def _dequantized(self, start: int, end: int) -> np.ndarray:
+        block = self._codes[start:end].astype(np.float32)
+        if self.dtype == "int8":
+            block *= self._scales[start:end, None]
+        return block
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def upsert(self, ids: list, embeddings, documents: list = None, metadatas: list = None):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_setting("dim", self.dim)
+                self._set_setting("dtype", self.dtype)
+                self._conn.commit()
+                self._open_arrays(_INITIAL_CAPACITY)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's {self.dim}")
+            self._refresh()
+
+            # The last occurrence of an id in the batch wins
+            latest = {chunk: i for i, chunk in enumerate(ids)}
+            positions = list(latest.values())
+            rows_of = dict(self._select_rows("chunk_id", list(latest)))
+            missing = [chunk for chunk in latest if chunk not in rows_of]
+            free = [row for (row,) in self._conn.execute(
+                "SELECT row FROM vectors WHERE chunk_id IS NULL ORDER BY row LIMIT ?", (len(missing),)
+            )]
+            appended = range(self._size, self._size + len(missing) - len(free))
+            rows_of.update(zip(missing, free + list(appended)))
+            if len(appended) and appended[-1] >= self._capacity:
+                self._open_arrays(max(appended[-1] + 1, 2 * self._capacity))
+
+            rows = np.array([rows_of[ids[i]] for i in positions], dtype=np.int64)
+            batch = vectors[positions]
+            self._exact[rows] = batch
+            self._quantize(rows, batch)
+            self._lists[rows] = self._assign(batch)
+            self._flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (row, chunk_id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(int(rows_of[ids[i]]), ids[i], documents[i],
+                  json.dumps(metadatas[i]) if metadatas[i] is not None else None) for i in positions]
+            )
+            self._conn.commit()
+            self._size = max(self._size, int(rows.max()) + 1)
+            self._maybe_train()
+
+    def delete(self, ids: list = None, where: dict = None):
+        with self._lock:
+            if ids is not None:
+                rows = [row for _, row in self._select_rows("chunk_id", list(ids))]
+            else:
+                condition, params = _where_sql(where or {})
+                rows = [row for (row,) in self._conn.execute(
+                    f"SELECT row FROM vectors WHERE chunk_id IS NOT NULL AND {condition}", params
+                )]
+            if not rows:
+                return
+            self._refresh()
+            self._lists[np.array(rows)] = _FREE
+            self._flush()
+            self._conn.executemany(
+                "UPDATE vectors SET chunk_id = NULL, document = NULL, metadata = NULL WHERE row = ?",
+                [(row,) for row in rows]
+            )
+            self._conn.commit()
+
+    def _select_rows(self, column: str, values: list) -> list:
+        """(value, row) pairs of the live rows whose column is one of values."""
+        pairs = []
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            pairs.extend(self._conn.execute(
+                f"SELECT {column}, row FROM vectors WHERE {column} IN ({', '.join('?' * len(batch))})", batch
+            ))
+        return pairs
+
+    # -- IVF partitions ----------------------------------------------------
+
+    def _maybe_train(self):
+        """(Re)builds the partitions once the store reaches ivf_min_vectors and whenever it has grown 4x since."""
+        if self.ivf_lists <= 0:
+            return
+        live = self._conn.execute("SELECT count(*) FROM vectors WHERE chunk_id IS NOT NULL").fetchone()[0]
+        if live < max(self.ivf_min_vectors, self.ivf_lists) or (self._trained_on and live < 4 * self._trained_on):
+            return
+        logger.info("Partitioning %d vectors into %d lists", live, self.ivf_lists)
+        rng = np.random.default_rng(0)
+        live_rows = np.flatnonzero(self._lists[:self._size] != _FREE)
+        sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), self.ivf_lists * _KMEANS_SAMPLE_PER_LIST),
+                                         replace=False))
+        sample = np.asarray(self._exact[sample_rows])
+        centroids = sample[rng.choice(len(sample), self.ivf_lists, replace=False)].copy()
+        # Spherical k-means: the vectors are unit length and scored by dot product
+        for _ in range(_KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=self.ivf_lists)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self._centroids = centroids.astype(np.float32)
+        for start in range(0, self._size, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, self._size)
+            lists = self._lists[start:end]
+            assigned = self._assign(self._dequantized(start, end))
+            self._lists[start:end] = np.where(lists == _FREE, _FREE, assigned)
+        self._flush()
+        np.save(self._file("centroids.tmp.npy"), self._centroids)
+        os.replace(self._file("centroids.tmp.npy"), self._file("centroids.npy"))
+        self._centroids_mtime = os.path.getmtime(self._file("centroids.npy"))
+        self._trained_on = live
+        self._set_setting("trained_on", live)
+        self._conn.commit()
+
+    # -- reading -----------------------------------------------------------
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM vectors WHERE chunk_id IS NOT NULL").fetchone()[0]
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list = ("documents", "metadatas")) -> dict:
+        with self._lock:
+            if ids is not None:
+                rows = [row for _, row in self._select_rows("chunk_id", list(ids))]
+                records = self._records(rows)
+                found = {record[0]: record for record in records}
+                records = [found[chunk] for chunk in dict.fromkeys(ids) if chunk in found]
+            else:
+                condition, params = _where_sql(where or {})
+                sql = f"SELECT chunk_id, document, metadata FROM vectors WHERE chunk_id IS NOT NULL AND {condition} ORDER BY row"
+                if limit is not None or offset:
+                    sql += " LIMIT ? OFFSET ?"
+                    params = params + [limit if limit is not None else -1, offset or 0]
+                records = self._conn.execute(sql, params).fetchall()
+        return self._result([records], include, single=True)
+
+    def _records(self, rows: list) -> list:
+        """(chunk_id, document, metadata, row) of the live rows among rows."""
+        records = []
+        for start in range(0, len(rows), 500):
+            batch = [int(row) for row in rows[start:start + 500]]
+            records.extend(self._conn.execute(
+                f"SELECT chunk_id, document, metadata, row FROM vectors "
+                f"WHERE chunk_id IS NOT NULL AND row IN ({', '.join('?' * len(batch))})", batch
+            ))
+        return records
+
+    @staticmethod
+    def _result(groups: list, include, single: bool = False, distances: list = None) -> dict:
+        def pick(index):
+            values = [[record[index] for record in group] for group in groups]
+            return values[0] if single else values
+
+        result = {
+            "ids": pick(0),
+            "documents": pick(1) if "documents" in include else None,
+            "metadatas": None,
+            "distances": distances,
+        }
+        if "metadatas" in include:
+            metadatas = [[json.loads(record[2]) if record[2] else None for record in group] for group in groups]
+            result["metadatas"] = metadatas[0] if single else metadatas
+        return result
+
+    def query(self, query_embeddings: list, n_results: int = 10, where: dict = None,
+              include: list = ("documents", "metadatas", "distances")) -> dict:
+        groups, distances = [], []
+        for embedding in query_embeddings:
+            rows, scores = self._search(np.asarray(embedding, dtype=np.float32), n_results, where)
+            with self._lock:
+                found = {record[3]: record for record in self._records(list(rows))}
+            # A row without a record was freed meanwhile
+            hits = [(found[row], score) for row, score in zip(rows, scores) if row in found]
+            groups.append([record for record, _ in hits])
+            distances.append([float(1 - score) for _, score in hits])
+        return self._result(groups, include, distances=distances if "distances" in include else None)
+
+    def _search(self, query: np.ndarray, n_results: int, where: dict) -> tuple:
+        """Rows and exact similarities of the n_results best matches."""
+        with self._lock:
+            self._refresh()
+            if self.dim is None or self._size == 0:
+                return [], []
+            # Arrays are only ever replaced by larger mappings, so this snapshot stays valid
+            size, codes, scales, exact, lists, centroids = (
+                self._size, self._codes, self._scales, self._exact, self._lists, self._centroids
+            )
+            rows = None
+            if where:
+                condition, params = _where_sql(where)
+                rows = np.array([row for (row,) in self._conn.execute(
+                    f"SELECT row FROM vectors WHERE chunk_id IS NOT NULL AND {condition} ORDER BY row", params
+                )], dtype=np.int64)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if rows is None and centroids is not None:
+            probed = np.argsort(-(centroids @ query))[:self.ivf_probes]
+            rows = np.flatnonzero(np.isin(lists[:size], probed))
+        if rows is None:
+            # Full scan in contiguous blocks; free rows never make it into the candidates
+            rows = np.arange(size)
+            approximate = np.empty(size, dtype=np.float32)
+            for start in range(0, size, _BLOCK_ROWS):
+                end = min(start + _BLOCK_ROWS, size)
+                block = codes[start:end].astype(np.float32) @ query
+                if scales is not None:
+                    block *= scales[start:end]
+                block[lists[start:end] == _FREE] = -np.inf
+                approximate[start:end] = block
+        else:
+            approximate = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), _BLOCK_ROWS):
+                block_rows = rows[start:start + _BLOCK_ROWS]
+                block = codes[block_rows].astype(np.float32) @ query
+                if scales is not None:
+                    block *= scales[block_rows]
+                approximate[start:start + len(block_rows)] = block
+        if not len(rows):
+            return [], []
+
+        # The best candidates by the quantized scores are re-scored exactly
+        candidates = max(n_results, self.rerank_candidates)
+        if len(rows) > candidates:
+            top = np.argpartition(-approximate, candidates - 1)[:candidates]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.isfinite(approximate[top])]
+        candidate_rows = np.sort(rows[top])
+        scores = np.asarray(exact[candidate_rows]) @ query
+        order = np.argsort(-scores)[:n_results]
+        return [int(row) for row in candidate_rows[order]], scores[order]
+
+    def stats(self) -> dict:
+        """Size of the store, and the bytes that must stay in memory for fast first passes."""
+        with self._lock:
+            self._refresh()
+            live = self._conn.execute("SELECT count(*) FROM vectors WHERE chunk_id IS NOT NULL").fetchone()[0]
+            rows = self._size
+            dim = self.dim or 0
+        code_bytes = 1 if self.dtype == "int8" else 2
+        per_row = dim * code_bytes + 4 + (4 if self.dtype == "int8" else 0)
+        return {
+            "vectors": live,
+            "rows": rows,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "partitions": len(self._centroids) if self._centroids is not None else 0,
+            "first_pass_bytes": rows * per_row,
+            "float32_bytes": rows * dim * 4,
+        }
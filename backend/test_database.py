@@ -1,7 +1,39 @@
+"""
+Creates the sample SQLite database (departments and employees) in the project root.
+
+    python backend/test_database.py
+    python backend/test_database.py --employees 100000 --path /tmp/large.db
+
+With --employees the tables are filled with that many synthetic, seeded rows
+instead of the three sample employees. An existing database file is replaced.
+"""
+import argparse
+import os
 import sqlite3
+import sys
+
+# Adjust the path to go up one level from the script's location to the project root
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--path", default=os.path.join(project_root, "test.db"))
+parser.add_argument("--employees", type=int, help="number of synthetic employees")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+if args.employees:
+    from backend.benchmarks.synthetic import write_company_db
+
+    write_company_db(args.path, args.employees, seed=args.seed)
+    print(f"Database with {args.employees} employees created at {args.path}.")
+    raise SystemExit(0)
 
 # Create a new SQLite database
-conn = sqlite3.connect("D:\\SIDHARTH\\Projects\\Ekam\\backend\\test.db")
+if os.path.exists(args.path):
+    os.remove(args.path)
+conn = sqlite3.connect(args.path)
 cursor = conn.cursor()
 
 # Create employees table
@@ -39,4 +71,4 @@ cursor.execute("INSERT INTO employees (emp_id, full_name, dept_id, position, ann
 conn.commit()
 conn.close()
 
-print("Database created successfully.")
+print(f"Database created successfully at {args.path}.")
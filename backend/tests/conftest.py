@@ -0,0 +1,61 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+# Settings are read when backend.config is first imported: the tests run offline,
+# with the fake model, without the embedding stack and without background pre-warming
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDINGS_ENABLED", "false")
+os.environ.setdefault("RESULT_TOKEN_SECRET", "tests")
+os.environ.setdefault("PREWARM_ENABLED", "false")
+
+
+def pytest_configure(config):
+    # Relative paths (the caches, the history, the spool and the app's own test.db) are
+    # resolved when the backend is imported; they must land in a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
+
+
+class HashingModel:
+    """Stands in for the sentence-transformers model: a fixed random unit vector per text."""
+
+    dim = 32
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True):
+        self.encoded.extend(texts)
+        vectors = np.array([
+            np.random.default_rng(int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], 16)).standard_normal(self.dim)
+            for text in texts
+        ], dtype=np.float32).reshape(len(texts), self.dim)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def embedding_model(monkeypatch):
+    from backend.services import embedding_service
+
+    model = HashingModel()
+    monkeypatch.setattr(embedding_service.get_embedding_service(), "_model", model)
+    return model
+
+
+@pytest.fixture
+def document_store(tmp_path, monkeypatch, embedding_model):
+    """A fresh quantized vector store, index manifest, lexical index and answer cache."""
+    from backend.services import index_manifest, lexical_index, semantic_cache, shared_resources
+    from backend.services.vector_store import QuantizedVectorStore
+
+    store = QuantizedVectorStore(str(tmp_path / "vectors"))
+    monkeypatch.setattr(shared_resources, "_collection", store)
+    monkeypatch.setattr(index_manifest, "_manifest", index_manifest.IndexManifest(str(tmp_path / "manifest.db")))
+    monkeypatch.setattr(lexical_index, "_index", lexical_index.LexicalIndex(str(tmp_path / "lexical.db")))
+    monkeypatch.setattr(semantic_cache, "_cache", semantic_cache.SemanticCache(
+        str(tmp_path / "answers.db"), threshold=0.9, max_entries=100, max_age_seconds=3600
+    ))
+    return store
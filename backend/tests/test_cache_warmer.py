@@ -0,0 +1,65 @@
+import asyncio
+
+from backend.services import cache_warmer
+from backend.services.cache_warmer import CacheWarmer
+from backend.services.query_history import QueryHistory
+
+
+class SlowEngine:
+    cache_scope = "tests"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.finished = 0
+
+    async def warm(self, question):
+        await asyncio.sleep(self.seconds)
+        self.finished += 1
+        return {"result": {}}
+
+
+class History:
+    def top(self, scope, since, limit):
+        return [{"query": f"question {i}"} for i in range(limit)]
+
+
+def make_warmer(time_budget, concurrency=2):
+    return CacheWarmer(None, "sqlite://", window_seconds=3600, max_questions=4, time_budget=time_budget,
+                       llm_budget=10, concurrency=concurrency, check_interval=1.0)
+
+
+def test_round_finishes_within_budget(monkeypatch):
+    monkeypatch.setattr(cache_warmer, "get_query_history", History)
+    engine = SlowEngine(0.01)
+    report = asyncio.run(make_warmer(5.0).warm(engine))
+    assert report["replayed"] == engine.finished == 4
+    assert report["stopped_by"] is None
+    assert report["cancelled"] == 0
+
+
+def test_time_budget_cancels_running_replays(monkeypatch):
+    monkeypatch.setattr(cache_warmer, "get_query_history", History)
+    engine = SlowEngine(5.0)
+    report = asyncio.run(make_warmer(0.1).warm(engine))
+    assert report["stopped_by"] == "time_budget"
+    assert report["cancelled"] == 2
+    assert report["replayed"] == engine.finished == 0
+    assert report["seconds"] < 1.0
+
+
+def test_one_owner_holds_the_lease(tmp_path):
+    path = str(tmp_path / "history.db")
+    first, second = QueryHistory(path, 3600), QueryHistory(path, 3600)
+    assert first.claim_lease("warmer", "a", 60)
+    assert not second.claim_lease("warmer", "b", 60)
+    assert first.claim_lease("warmer", "a", 60)
+    first.release_lease("warmer", "a")
+    assert second.claim_lease("warmer", "b", 60)
+    assert not first.claim_lease("warmer", "a", 60)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    history = QueryHistory(str(tmp_path / "history.db"), 3600)
+    assert history.claim_lease("warmer", "a", -1)
+    assert history.claim_lease("warmer", "b", 60)
+    assert not history.claim_lease("warmer", "a", 60)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from backend.config import settings
+from backend.services.document_processor import DocumentProcessor
+from backend.services.lexical_index import is_keyword_query, reciprocal_rank_fusion
+from backend.services.query_engine import QueryEngine
+
+# Eight words each: with eight-token chunks and no overlap every paragraph is one chunk
+LEAVE = "Employees accrue twenty five days of paid leave"
+CARRY_OVER = "Unused leave days carry over until next March"
+INVOICE = "Invoice INV-2041 was paid by the finance team"
+TRAVEL = "Travel expenses are refunded within thirty calendar days"
+
+
+def test_fusion_ranks_items_found_by_both_lists_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=3, rrf_k=60)
+    assert [item for item, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    # A first place in one list loses to a second place in both
+    fused = reciprocal_rank_fusion([["x", "y"], ["z", "y"]], k=3, rrf_k=60)
+    assert fused[0][0] == "y"
+
+
+def test_keyword_queries():
+    assert is_keyword_query("INV-2041", 3)
+    assert is_keyword_query("leave carry over", 3)
+    assert is_keyword_query("who approved invoice INV-2041 last quarter and why", 3)
+    assert not is_keyword_query("how many days of paid leave do employees accrue", 3)
+    # Only question wording, nothing to look up
+    assert not is_keyword_query("what is the policy", 3)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch, document_store):
+    monkeypatch.setattr(settings, "EMBEDDINGS_ENABLED", True)
+    monkeypatch.setattr(settings, "CHUNK_MAX_TOKENS", 8)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP_TOKENS", 0)
+    DocumentProcessor().process_documents(
+        ["\n\n".join([LEAVE, CARRY_OVER]).encode("utf-8"), "\n\n".join([INVOICE, TRAVEL]).encode("utf-8")],
+        ["handbook.txt", "finance.txt"],
+    )
+    engine = QueryEngine(f"sqlite:///{tmp_path / 'company.db'}")
+    engine.dense_searches = []
+    dense_search = engine._dense_search
+
+    def recording(user_query, *args):
+        engine.dense_searches.append(user_query)
+        return dense_search(user_query, *args)
+
+    engine._dense_search = recording
+    return engine
+
+
+def search(engine, query, k):
+    return asyncio.run(engine.search_documents(query, document_options={"k": k}))["results"]
+
+
+def test_keyword_query_with_enough_lexical_matches_skips_the_dense_search(engine):
+    results = search(engine, "leave days", 2)
+    assert {result["chunk_text"] for result in results} == {LEAVE, CARRY_OVER}
+    assert all(result["found_by"] == ["lexical"] for result in results)
+    assert engine.dense_searches == []
+
+
+def test_keyword_query_with_too_few_lexical_matches_is_fused(engine):
+    results = search(engine, "INV-2041", 2)
+    assert results[0]["chunk_text"] == INVOICE
+    assert results[0]["found_by"] == ["dense", "lexical"]
+    assert engine.dense_searches == ["INV-2041"]
+
+
+def test_long_question_is_fused(engine):
+    question = "how many days of paid leave do employees accrue"
+    results = search(engine, question, 4)
+    assert engine.dense_searches == [question]
+    assert {result["chunk_text"] for result in results} == {LEAVE, CARRY_OVER, INVOICE, TRAVEL}
+    scores = [result["score"] for result in results]
+    assert scores == sorted(scores, reverse=True)
+    # The chunk matching most words is ranked by both indexes
+    assert "lexical" in results[0]["found_by"] and results[0]["similarity"] is not None
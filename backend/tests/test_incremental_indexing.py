@@ -0,0 +1,66 @@
+import pytest
+
+from backend.config import settings
+from backend.services.document_processor import DocumentProcessor
+from backend.services.index_manifest import chunk_id, get_index_manifest
+from backend.services.lexical_index import get_lexical_index
+
+# Eight words each: with eight-token chunks and no overlap every paragraph is one chunk
+INTRO = "Employees accrue twenty five days of paid leave"
+PAYROLL = "Payroll runs on the last day of month"
+NEW_PAYROLL = "Payroll runs on the fifteenth of each month"
+TRAVEL = "Travel expenses are refunded within thirty calendar days"
+
+
+def document(*paragraphs):
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+
+def ids(source, *paragraphs):
+    return {chunk_id(source, paragraph) for paragraph in paragraphs}
+
+
+@pytest.fixture
+def processor(monkeypatch, document_store):
+    monkeypatch.setattr(settings, "CHUNK_MAX_TOKENS", 8)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP_TOKENS", 0)
+    return DocumentProcessor()
+
+
+def stored(store, source):
+    return set(store.get(where={"source": source}, include=[])["ids"])
+
+
+def test_unchanged_file_is_skipped(processor, document_store, embedding_model):
+    processor.process_documents([document(INTRO, PAYROLL)], ["handbook.txt"])
+    assert embedding_model.encoded == [INTRO, PAYROLL]
+    embedding_model.encoded.clear()
+    processor.process_documents([document(INTRO, PAYROLL)], ["handbook.txt"])
+    assert embedding_model.encoded == []
+    assert stored(document_store, "handbook.txt") == ids("handbook.txt", INTRO, PAYROLL)
+
+
+def test_only_changed_chunks_are_embedded(processor, embedding_model):
+    processor.process_documents([document(INTRO, PAYROLL, TRAVEL)], ["handbook.txt"])
+    embedding_model.encoded.clear()
+    processor.process_documents([document(INTRO, NEW_PAYROLL, TRAVEL)], ["handbook.txt"])
+    assert embedding_model.encoded == [NEW_PAYROLL]
+
+
+def test_stale_chunks_of_the_previous_version_are_dropped(processor, document_store):
+    processor.process_documents([document(INTRO, PAYROLL, TRAVEL)], ["handbook.txt"])
+    processor.process_documents([document(INTRO, NEW_PAYROLL)], ["handbook.txt"])
+    current = ids("handbook.txt", INTRO, NEW_PAYROLL)
+    assert stored(document_store, "handbook.txt") == current
+    assert set(get_index_manifest().chunk_ids("handbook.txt")) == current
+    assert get_lexical_index().missing(sorted(current)) == []
+    assert set(get_lexical_index().missing(sorted(ids("handbook.txt", PAYROLL, TRAVEL)))) == \
+        ids("handbook.txt", PAYROLL, TRAVEL)
+    assert get_index_manifest().chunk_count("handbook.txt") == 2
+
+
+def test_sources_are_indexed_independently(processor, document_store):
+    processor.process_documents([document(INTRO), document(INTRO)], ["a.txt", "b.txt"])
+    processor.process_documents([document(TRAVEL)], ["a.txt"])
+    assert stored(document_store, "a.txt") == ids("a.txt", TRAVEL)
+    assert stored(document_store, "b.txt") == ids("b.txt", INTRO)
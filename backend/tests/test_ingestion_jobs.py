@@ -0,0 +1,54 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.services.index_manifest import chunk_id, get_index_manifest
+from backend.services.ingestion_jobs import IngestionJobManager
+
+FIRST = b"The first draft of the notes mentions the alpha rollout."
+SECOND = b"The second draft of the notes is about the beta rollout."
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch, document_store):
+    manager = IngestionJobManager(str(tmp_path / "jobs.db"), str(tmp_path / "spool"), parse_workers=1, batch_size=64)
+    # Parsing in a thread keeps the test in one process; files are still parsed one by one, in order
+    monkeypatch.setattr(manager, "_new_pool", lambda: ThreadPoolExecutor(max_workers=1))
+    manager.start()
+    yield manager
+    manager.shutdown()
+
+
+def wait_for(manager, job_ids, timeout_seconds=10):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        statuses = [manager.status(job_id) for job_id in job_ids]
+        if all(status["status"] != "processing" for status in statuses):
+            return statuses
+        time.sleep(0.05)
+    raise AssertionError("ingestion jobs did not finish")
+
+
+def assert_indexed(store, source, text):
+    expected = [chunk_id(source, text.decode())]
+    assert get_index_manifest().chunk_ids(source) == expected
+    assert store.get(where={"source": source}, include=[])["ids"] == expected
+
+
+def test_same_filename_in_two_jobs(manager, document_store):
+    first = manager.submit([("notes.txt", io.BytesIO(FIRST))])
+    second = manager.submit([("notes.txt", io.BytesIO(SECOND))])
+    for status in wait_for(manager, [first, second]):
+        assert status["status"] == "completed"
+        assert [f["error"] for f in status["files"]] == [None]
+    assert_indexed(document_store, "notes.txt", SECOND)
+
+
+def test_same_filename_twice_in_one_job(manager, document_store):
+    job = manager.submit([("notes.txt", io.BytesIO(FIRST)), ("notes.txt", io.BytesIO(SECOND))])
+    [status] = wait_for(manager, [job])
+    assert status["status"] == "completed"
+    assert [f["status"] for f in status["files"]] == ["completed", "completed"]
+    assert_indexed(document_store, "notes.txt", SECOND)
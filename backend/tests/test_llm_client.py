@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.services import llm_client
+from backend.services.llm_client import FakeProvider, LLMClient, LLMTimeoutError, LLMTransientError
+
+
+def make_client(provider, max_concurrency=4, timeout_seconds=1.0, max_retries=2, backoff_seconds=0.01):
+    return LLMClient(provider, max_concurrency=max_concurrency, timeout_seconds=timeout_seconds,
+                     max_retries=max_retries, backoff_seconds=backoff_seconds)
+
+
+def generate_all(client, prompts):
+    async def run():
+        return await asyncio.gather(*(client.generate(prompt) for prompt in prompts))
+    return asyncio.run(run())
+
+
+def test_semaphore_caps_calls_in_flight():
+    provider = FakeProvider(0.05)
+    client = make_client(provider, max_concurrency=3)
+    responses = generate_all(client, [f"prompt {i}" for i in range(10)])
+    assert len(responses) == 10
+    assert provider.calls == 10
+    assert provider.max_in_flight == 3
+
+
+def test_deadline_raises():
+    provider = FakeProvider(0.5)
+    client = make_client(provider, timeout_seconds=0.05, max_retries=0)
+    with pytest.raises(LLMTimeoutError):
+        generate_all(client, ["slow"])
+    assert client.stats()["timeouts"] == 1
+    assert client.stats()["errors"] == 1
+
+
+def test_per_call_deadline_overrides_default():
+    provider = FakeProvider(0.2)
+    client = make_client(provider, timeout_seconds=5.0, max_retries=0)
+
+    async def run():
+        return await client.generate("slow", timeout_seconds=0.05)
+
+    started = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(run())
+    assert time.perf_counter() - started < 0.2
+
+
+def test_deadline_covers_every_attempt():
+    provider = FakeProvider(0.5)
+    client = make_client(provider, timeout_seconds=0.05, max_retries=2)
+    started = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        generate_all(client, ["slow"])
+    assert time.perf_counter() - started < 0.2
+    assert provider.calls == 1
+    assert client.stats()["retries"] == 0
+    assert client.stats()["timeouts"] == 1
+
+
+def test_no_retry_is_started_past_the_deadline():
+    provider = FakeProvider(0.0, failures=5)
+    client = make_client(provider, timeout_seconds=0.1, max_retries=2, backoff_seconds=0.5)
+    started = time.perf_counter()
+    with pytest.raises(LLMTransientError):
+        generate_all(client, ["down"])
+    assert time.perf_counter() - started < 0.1
+    assert provider.calls == 1
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline():
+    provider = FakeProvider(0.3)
+    client = make_client(provider, max_concurrency=1, timeout_seconds=1.0, max_retries=0)
+
+    async def run():
+        holder = asyncio.ensure_future(client.generate("first"))
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        with pytest.raises(LLMTimeoutError):
+            await client.generate("second", timeout_seconds=0.05)
+        waited = time.perf_counter() - started
+        await holder
+        return waited
+
+    assert asyncio.run(run()) < 0.2
+    assert provider.calls == 1
+
+
+def test_transient_failures_are_retried():
+    provider = FakeProvider(0.0, failures=2)
+    client = make_client(provider, max_retries=2)
+    [response] = generate_all(client, ["flaky"])
+    assert response.text
+    assert provider.calls == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["errors"] == 0
+
+
+def test_retry_count_is_respected():
+    provider = FakeProvider(0.0, failures=5)
+    client = make_client(provider, max_retries=2)
+    with pytest.raises(LLMTransientError):
+        generate_all(client, ["down"])
+    assert provider.calls == 3
+    assert client.stats()["retries"] == 2
+
+
+def test_retries_back_off_exponentially(monkeypatch):
+    # No jitter: the two retries wait 0.05s and 0.1s
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: 1.0)
+    provider = FakeProvider(0.0, failures=2)
+    client = make_client(provider, max_retries=2, backoff_seconds=0.05)
+    started = time.perf_counter()
+    generate_all(client, ["flaky"])
+    assert 0.15 <= time.perf_counter() - started < 0.5
+
+
+def test_other_errors_are_not_retried():
+    class BrokenProvider(FakeProvider):
+        async def generate(self, prompt):
+            self.calls += 1
+            raise ValueError("bad request")
+
+    provider = BrokenProvider(0.0)
+    client = make_client(provider, max_retries=2)
+    with pytest.raises(ValueError):
+        generate_all(client, ["bad"])
+    assert provider.calls == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    provider = FakeProvider(0.05)
+    client = make_client(provider)
+    responses = generate_all(client, ["same prompt"] * 5)
+    assert provider.calls == 1
+    assert len({response.text for response in responses}) == 1
+    assert client.stats()["coalesced"] == 4
+
+
+def test_identical_sequential_prompts_are_not_coalesced():
+    provider = FakeProvider(0.0)
+    client = make_client(provider)
+    generate_all(client, ["same prompt"])
+    generate_all(client, ["same prompt"])
+    assert provider.calls == 2
+    assert client.stats()["coalesced"] == 0
@@ -0,0 +1,12 @@
+from fastapi.testclient import TestClient
+
+from backend.config import settings
+from backend.main import app
+
+
+def test_batch_over_the_limit_is_refused(monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_QUESTIONS", 2)
+    with TestClient(app) as client:
+        response = client.post("/api/query/batch", json={"queries": ["a", "b", "c"]})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "A batch holds at most 2 questions"}
@@ -0,0 +1,48 @@
+import pytest
+
+from backend.services.query_router import route_query, schema_terms
+from backend.services.semantic_cache import normalize_query
+
+SCHEMA = {
+    "employees": {
+        "columns": [{"name": "id"}, {"name": "full_name"}, {"name": "salary"},
+                    {"name": "hire_date"}, {"name": "department_id"}],
+    },
+    "departments": {
+        "columns": [{"name": "id"}, {"name": "name"}, {"name": "budget"}],
+    },
+}
+
+
+def test_schema_terms_are_weighted_by_what_they_name():
+    terms = schema_terms(SCHEMA)
+    assert terms["employees"] == terms["employee"] == 2.0
+    assert terms["budget"] == terms["budgets"] == 1.0
+    assert terms["hire"] == 0.5
+    assert "id" not in terms and "name" not in terms
+
+
+@pytest.mark.parametrize("question, route", [
+    # Schema wording without document wording
+    ("What is the average salary per department?", "sql"),
+    ("How many employees were hired in 2023?", "sql"),
+    ("List all departments by budget", "sql"),
+    ("top 5 employees by salary", "sql"),
+    # Neither schema nor aggregate wording
+    ("What is the vacation policy?", "document"),
+    ("Explain the remote work guidelines", "document"),
+    ("What does the contract say about notice periods?", "document"),
+    ("Show me everything about onboarding", "document"),
+    # Both, or an aggregate over something the schema does not name
+    ("What does the handbook say about salary reviews?", "hybrid"),
+    ("Who is the highest paid person?", "hybrid"),
+    ("Which departments are mentioned in the travel policy?", "hybrid"),
+])
+def test_routes(question, route):
+    assert route_query(normalize_query(question), schema_terms(SCHEMA))[0] == route
+
+
+def test_part_of_a_column_name_alone_is_not_enough_for_sql():
+    route, scores = route_query(normalize_query("hire"), schema_terms(SCHEMA))
+    assert scores["schema"] == 0.5
+    assert route == "hybrid"
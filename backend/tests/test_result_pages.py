@@ -0,0 +1,152 @@
+import base64
+import datetime
+import json
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from backend.config import settings
+from backend.main import app
+from backend.services.result_pages import (
+    fetch_first_page, fetch_page, keyset_after, read_token, sign_token,
+)
+from backend.services.sql_guard import guard_sql
+
+SCHEMA = {
+    "employees": {
+        "columns": [{"name": "id"}, {"name": "name"}, {"name": "department"}],
+        "primary_key": ["id"],
+    }
+}
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / "company.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, department TEXT)")
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?)",
+                     [(i, f"employee {i}", f"department {i % 7}") for i in range(1, 251)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{path}")
+    return path
+
+
+@pytest.fixture
+def conn(database):
+    engine = create_engine(f"sqlite:///{database}")
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def tampered(token, **changes):
+    body, signature = token.split(".")
+    payload = json.loads(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+    body = base64.urlsafe_b64encode(json.dumps(dict(payload, **changes)).encode()).rstrip(b"=").decode()
+    return f"{body}.{signature}"
+
+
+def test_token_round_trip():
+    payload = read_token(sign_token({"sql": "SELECT 1", "offset": 10}))
+    assert payload["sql"] == "SELECT 1" and payload["offset"] == 10
+
+
+def test_tampered_token_is_refused():
+    token = sign_token({"sql": "SELECT name FROM employees", "offset": 10})
+    with pytest.raises(ValueError, match="Invalid result token"):
+        read_token(tampered(token, sql="SELECT * FROM secrets"))
+    with pytest.raises(ValueError, match="Invalid result token"):
+        body, signature = token.split(".")
+        read_token(f"{body}.{signature[::-1]}")
+    with pytest.raises(ValueError, match="Malformed result token"):
+        read_token("not a token")
+
+
+def test_expired_token_is_refused(monkeypatch):
+    token = sign_token({"sql": "SELECT 1", "offset": 10})
+    monkeypatch.setattr(settings, "RESULT_TOKEN_TTL_SECONDS", -1)
+    with pytest.raises(ValueError, match="expired"):
+        read_token(token)
+
+
+def read_all(conn, sql, max_rows, between_pages=None):
+    """Pages through a guarded query the way continuation tokens do; returns the pages."""
+    sql, report = guard_sql(conn, sql, SCHEMA)
+    page = fetch_first_page(conn, sql, max_rows)
+    pages = [page["rows"]]
+    payload = {"sql": sql, "columns": page["columns"], "offset": 0, "order": report["order"]}
+    while page["truncated"]:
+        payload = dict(payload, offset=payload["offset"] + len(page["rows"]),
+                       after=keyset_after(report["order"], page["columns"], page["rows"][-1]))
+        if between_pages:
+            between_pages()
+        page = fetch_page(conn, payload, max_rows)
+        pages.append(page["rows"])
+    return pages
+
+
+def test_keyset_pages_read_every_row_once(conn):
+    pages = read_all(conn, "SELECT name, id FROM employees WHERE department != 'department 3'", 16)
+    rows = [tuple(row) for page in pages for row in page]
+    expected = conn.exec_driver_sql(
+        "SELECT name, id FROM employees WHERE department != 'department 3' ORDER BY id"
+    ).fetchall()
+    assert rows == [tuple(row) for row in expected]
+    assert len(pages) == -(-len(expected) // 16)
+
+
+def test_keyset_pages_survive_rows_deleted_between_pages(conn, database):
+    def delete_first_rows():
+        # Another writer deletes rows that were already sent; an offset would now skip rows
+        writer = sqlite3.connect(database)
+        writer.execute("DELETE FROM employees WHERE id IN (SELECT id FROM employees ORDER BY id LIMIT 3)")
+        writer.commit()
+        writer.close()
+
+    pages = read_all(conn, "SELECT id FROM employees", 20, between_pages=delete_first_rows)
+    ids = [row[0] for page in pages for row in page]
+    assert ids == list(range(1, 251))
+
+
+def test_pages_without_a_key_are_read_by_offset(conn):
+    sql = "SELECT department, COUNT(*) FROM employees GROUP BY department"
+    pages = read_all(conn, sql, 3)
+    rows = [tuple(row) for page in pages for row in page]
+    assert rows == [tuple(row) for row in conn.exec_driver_sql(sql + " ORDER BY 1, 2").fetchall()]
+
+
+def test_dates_fall_back_to_offset_paging():
+    order = {"keyset": [["hired", "hired"]], "table": "employees"}
+    assert keyset_after(order, ["hired"], [datetime.date(2024, 1, 1)]) is None
+    assert keyset_after(order, ["hired"], ["2024-01-01"]) == ["2024-01-01"]
+    assert keyset_after({"keyset": None}, ["hired"], [1]) is None
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    monkeypatch.setattr(settings, "SQL_MAX_ROWS", 4)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_pages_through_the_api(client):
+    # The fake model answers with SELECT * FROM employees LIMIT 10
+    result = client.post("/api/query", json={"query": "list all employees"}).json()["result"]
+    ids = [row["id"] for row in result["results"]]
+    while result["next_token"]:
+        result = client.post("/api/query/page", json={"token": result["next_token"]}).json()
+        ids += [row["id"] for row in result["results"]]
+    assert ids == list(range(1, 11))
+
+
+def test_api_refuses_tampered_and_expired_tokens(client, monkeypatch):
+    token = client.post("/api/query", json={"query": "list all employees"}).json()["result"]["next_token"]
+    forged = tampered(token, sql="SELECT * FROM employees")
+    assert client.post("/api/query/page", json={"token": forged}).json() == {"error": "Invalid result token"}
+    assert client.post("/api/query/rows", json={"token": forged}).json() == {"error": "Invalid result token"}
+    monkeypatch.setattr(settings, "RESULT_TOKEN_TTL_SECONDS", -1)
+    assert "expired" in client.post("/api/query/page", json={"token": token}).json()["error"]
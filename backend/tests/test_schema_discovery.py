@@ -0,0 +1,91 @@
+import sqlite3
+
+import pytest
+
+from backend.config import settings
+from backend.services.schema_discovery import SchemaDiscovery
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "company.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, "
+                 "department_id INTEGER REFERENCES departments(id))")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def discovery(database, monkeypatch):
+    monkeypatch.setattr(settings, "SCHEMA_CHECK_INTERVAL_SECONDS", 0)
+    discovery = SchemaDiscovery()
+    discovery.reflected = []
+    reflect_tables = discovery._reflect_tables
+
+    def recording(inspector, table_names):
+        discovery.reflected.append(sorted(table_names))
+        return reflect_tables(inspector, table_names)
+
+    discovery._reflect_tables = recording
+    yield discovery
+    discovery.invalidate(f"sqlite:///{database}")
+
+
+def run_ddl(database, statement):
+    conn = sqlite3.connect(database)
+    conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def test_schema_is_discovered_once_while_the_catalog_is_unchanged(discovery, database):
+    url = f"sqlite:///{database}"
+    schema = discovery.analyze_database(url)
+    assert sorted(schema) == ["departments", "employees"]
+    assert schema["employees"]["primary_key"] == ["id"]
+    assert schema["employees"]["foreign_keys"][0]["referred_table"] == "departments"
+
+    # Data changes do not touch the catalog
+    conn = sqlite3.connect(database)
+    conn.execute("INSERT INTO departments VALUES (1, 'Sales')")
+    conn.commit()
+    conn.close()
+    assert discovery.analyze_database(url) is schema
+    assert discovery.reflected == [["departments", "employees"]]
+
+
+def test_new_table_is_discovered_after_ddl(discovery, database):
+    url = f"sqlite:///{database}"
+    discovery.analyze_database(url)
+    fingerprint = discovery.get_fingerprint(url)
+    run_ddl(database, "CREATE TABLE projects (id INTEGER PRIMARY KEY, title TEXT)")
+    schema = discovery.analyze_database(url)
+    assert sorted(schema) == ["departments", "employees", "projects"]
+    assert discovery.get_fingerprint(url) != fingerprint
+    # Only the new table is reflected again
+    assert discovery.reflected[1:] == [["projects"]]
+
+
+def test_altered_table_is_reflected_again(discovery, database):
+    url = f"sqlite:///{database}"
+    discovery.analyze_database(url)
+    run_ddl(database, "ALTER TABLE employees ADD COLUMN salary REAL")
+    schema = discovery.analyze_database(url)
+    assert [column["name"] for column in schema["employees"]["columns"]][-1] == "salary"
+    assert discovery.reflected[1:] == [["employees"]]
+
+    run_ddl(database, "DROP TABLE employees")
+    assert sorted(discovery.analyze_database(url)) == ["departments"]
+
+
+def test_catalog_is_not_checked_again_within_the_interval(discovery, database, monkeypatch):
+    url = f"sqlite:///{database}"
+    schema = discovery.analyze_database(url)
+    monkeypatch.setattr(settings, "SCHEMA_CHECK_INTERVAL_SECONDS", 3600)
+    run_ddl(database, "CREATE TABLE projects (id INTEGER PRIMARY KEY)")
+    assert discovery.analyze_database(url) is schema
+    assert discovery.invalidate(url) == 1
+    assert "projects" in discovery.analyze_database(url)
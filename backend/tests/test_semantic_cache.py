@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from backend.services.semantic_cache import SemanticCache, normalize_query
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+# Cosine similarities to SALARY: NEAR 0.995, FAR 0.6
+SALARY = unit(1, 0, 0)
+NEAR = unit(1, 0.1, 0)
+FAR = unit(0.6, 0.8, 0)
+RESULT = {"results": [{"avg": 1200.0}]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(str(tmp_path / "answers.db"), threshold=0.9, max_entries=3, max_age_seconds=3600)
+
+
+def store(cache, query, embedding=SALARY, scope="db", fingerprint="fp", documents=False, result=RESULT):
+    cache.store(scope, normalize_query(query), embedding, result, "sql", fingerprint, depends_on_documents=documents)
+
+
+def test_normalize_query_folds_case_punctuation_and_abbreviations():
+    assert normalize_query("What's the AVG salary per Dept?") == "what s the average salary per department"
+    assert normalize_query("  avg   salary ") == normalize_query("Average salary!")
+
+
+def test_exact_text_hit(cache):
+    store(cache, "Average salary per department?")
+    hit = cache.lookup("db", normalize_query("average salary per dept"), None, "fp")
+    assert hit == {"result": RESULT, "query_type": "sql", "similarity": 1.0}
+
+
+def test_near_embedding_hit_above_the_threshold(cache):
+    store(cache, "average salary per department")
+    hit = cache.lookup("db", "mean pay by department", NEAR, "fp")
+    assert hit["result"] == RESULT
+    assert 0.9 <= hit["similarity"] < 1.0
+
+
+def test_embedding_below_the_threshold_misses(cache):
+    store(cache, "average salary per department")
+    assert cache.lookup("db", "number of employees hired", FAR, "fp") is None
+
+
+def test_near_match_needs_the_question_literals(cache):
+    store(cache, "average salary in engineering")
+    assert cache.lookup("db", "average salary in sales", NEAR, "fp", required_terms=("sales",)) is None
+    assert cache.lookup("db", "mean salary in engineering", NEAR, "fp", required_terms=("engineering",))
+
+
+def test_scopes_do_not_share_answers(cache):
+    store(cache, "average salary", scope="hr")
+    assert cache.lookup("sales", "average salary", SALARY, "fp") is None
+    assert cache.lookup("hr", "average salary", SALARY, "fp") is not None
+
+
+def test_answers_are_only_valid_for_their_schema(cache):
+    store(cache, "average salary", fingerprint="old")
+    assert cache.lookup("db", "average salary", SALARY, "new") is None
+
+
+def test_corpus_version_retires_document_answers_only(cache):
+    store(cache, "what does the handbook say about leave", embedding=FAR, documents=True)
+    store(cache, "average salary")
+    cache.bump_corpus_version()
+    assert cache.lookup("db", "what does the handbook say about leave", FAR, "fp") is None
+    assert cache.lookup("db", "average salary", SALARY, "fp") is not None
+
+
+def test_least_recently_used_answers_are_evicted(cache):
+    for i, query in enumerate(["first", "second", "third"]):
+        store(cache, query, embedding=unit(1, i, 1), result={"rows": i})
+    # A hit makes "first" the most recently used; "second" is now the oldest
+    assert cache.lookup("db", "first", None, "fp") is not None
+    store(cache, "fourth", embedding=unit(0, 0, 1), result={"rows": 3})
+    assert cache.lookup("db", "second", None, "fp") is None
+    assert all(cache.lookup("db", query, None, "fp") for query in ["first", "third", "fourth"])
+
+
+def test_storing_on_a_new_schema_evicts_answers_of_the_old_one(cache):
+    store(cache, "average salary", fingerprint="old")
+    store(cache, "headcount", fingerprint="new")
+    assert cache.lookup("db", "average salary", None, "old") is None
+    assert cache.lookup("db", "headcount", None, "new") is not None
+
+
+def test_clear_drops_one_scope(cache):
+    store(cache, "average salary", scope="hr")
+    store(cache, "average salary", scope="sales")
+    cache.clear("hr")
+    assert cache.lookup("hr", "average salary", None, "fp") is None
+    assert cache.lookup("sales", "average salary", None, "fp") is not None
@@ -0,0 +1,129 @@
+import pytest
+import sqlglot
+from sqlalchemy import create_engine, text
+
+from backend.config import settings
+from backend.services.sql_guard import SQLGuardError, estimate_cost, guard_sql, page_sql
+
+SCHEMA = {
+    "employees": {
+        "columns": [{"name": "id"}, {"name": "name"}, {"name": "salary"}],
+        "primary_key": ["id"],
+    }
+}
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, salary REAL)"))
+        conn.execute(text("INSERT INTO employees VALUES (:id, :name, :salary)"),
+                     [{"id": i, "name": f"employee {i}", "salary": 1000.0 + i} for i in range(1, 1001)])
+        yield conn
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "SQL_HARD_ROW_LIMIT", 5000)
+    monkeypatch.setattr(settings, "SQL_DOWNGRADE_ROW_LIMIT", 100)
+    monkeypatch.setattr(settings, "SQL_MAX_ESTIMATED_COST", 1e7)
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM employees",
+    "UPDATE employees SET salary = 0",
+    "DROP TABLE employees",
+    "INSERT INTO employees (name) SELECT name FROM employees",
+])
+def test_writes_are_refused(conn, sql):
+    with pytest.raises(SQLGuardError, match="read-only"):
+        guard_sql(conn, sql, SCHEMA)
+
+
+def test_several_statements_are_refused(conn):
+    with pytest.raises(SQLGuardError, match="single SQL statement"):
+        guard_sql(conn, "SELECT name FROM employees; DELETE FROM employees", SCHEMA)
+
+
+def test_unlimited_select_gets_the_hard_limit(conn, limits):
+    sql, report = guard_sql(conn, "SELECT name FROM employees", SCHEMA)
+    assert sql == "SELECT name FROM employees ORDER BY id LIMIT 5000"
+    assert "Added LIMIT 5000" in report["rewrites"]
+    assert report["order"]["keyset"] is None
+
+
+def test_over_large_limit_is_clamped(conn, limits):
+    sql, _ = guard_sql(conn, "SELECT id, name FROM employees LIMIT 1000000", SCHEMA)
+    assert sql.endswith("LIMIT 5000")
+
+
+def test_small_limit_is_kept(conn, limits):
+    sql, report = guard_sql(conn, "SELECT id, name FROM employees ORDER BY id LIMIT 10", SCHEMA)
+    assert sql == "SELECT id, name FROM employees ORDER BY id LIMIT 10"
+    assert report["rewrites"] == []
+    assert report["order"]["keyset"] == [["id", "id"]]
+
+
+def test_aggregate_is_neither_limited_nor_ordered(conn, limits):
+    sql, report = guard_sql(conn, "SELECT AVG(salary) FROM employees", SCHEMA)
+    assert sql == "SELECT AVG(salary) FROM employees"
+    assert report["order"] is None
+
+
+def test_expensive_select_is_downgraded(conn, limits, monkeypatch):
+    monkeypatch.setattr(settings, "SQL_MAX_ESTIMATED_COST", 500)
+    sql, report = guard_sql(conn, "SELECT name FROM employees", SCHEMA)
+    assert sql.endswith("LIMIT 100")
+    assert report["estimated_cost"] <= 500
+    assert any(rewrite.startswith("Limited to 100 rows") for rewrite in report["rewrites"])
+
+
+def test_expensive_aggregate_is_refused(conn, limits, monkeypatch):
+    monkeypatch.setattr(settings, "SQL_MAX_ESTIMATED_COST", 500)
+    with pytest.raises(SQLGuardError, match="too much data"):
+        guard_sql(conn, "SELECT COUNT(*) FROM employees", SCHEMA)
+
+
+def test_expensive_join_is_refused_even_downgraded(conn, limits, monkeypatch):
+    monkeypatch.setattr(settings, "SQL_MAX_ESTIMATED_COST", 5000)
+    with pytest.raises(SQLGuardError, match="too much data"):
+        guard_sql(conn, "SELECT a.name, b.name FROM employees a, employees b WHERE a.salary < b.salary", SCHEMA)
+
+
+def test_filtered_full_scan_suggests_an_index(conn, limits):
+    _, report = guard_sql(conn, "SELECT name FROM employees WHERE salary > 1500", SCHEMA)
+    assert report["index_hints"] == ["employees(salary)"]
+
+
+class OldSQLitePlans:
+    """A connection whose EXPLAIN QUERY PLAN answers in the wording of SQLite before 3.36."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = conn.dialect
+
+    def execute(self, statement):
+        result = self.conn.execute(statement)
+        if not str(statement).startswith("EXPLAIN QUERY PLAN"):
+            return result
+        rows = [(a, b, c, detail.replace("SCAN ", "SCAN TABLE ", 1)) for a, b, c, detail in result.fetchall()]
+        return type("Plan", (), {"fetchall": lambda self: rows})()
+
+
+def test_cost_reads_both_scan_wordings(conn):
+    sql = "SELECT name FROM employees"
+    statement = sqlglot.parse_one(sql, read="sqlite")
+    assert estimate_cost(conn, sql, statement) == (1000, {"employees"})
+    assert estimate_cost(OldSQLitePlans(conn), sql, statement) == (1000, {"employees"})
+
+
+def test_pages_by_offset_and_by_key(conn, limits):
+    sql, report = guard_sql(conn, "SELECT id, name FROM employees", SCHEMA)
+    second = page_sql(sql, "sqlite", report["order"], offset=10, rows=10)
+    by_key = page_sql(sql, "sqlite", report["order"], offset=10, rows=10, after=[10])
+    assert "OFFSET 10" in second and "WHERE" not in second
+    assert "id > 10" in by_key and "OFFSET" not in by_key
+    expected = [(i, f"employee {i}") for i in range(11, 21)]
+    assert conn.execute(text(second)).fetchall() == expected
+    assert conn.execute(text(by_key)).fetchall() == expected
@@ -0,0 +1,45 @@
+import pytest
+
+from backend.services.sql_templates import SQLTemplateStore, extract_literals
+
+
+def quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLTemplateStore(str(tmp_path / "templates.db"))
+
+
+def test_name_with_apostrophe_is_one_literal():
+    literals, skeleton = extract_literals("average salary in O'Brien")
+    assert literals == [{"value": "O'Brien", "kind": "string"}]
+    assert skeleton == "average salary in __p0__"
+
+
+def test_apostrophe_inside_a_word_does_not_open_a_quote():
+    literals, _ = extract_literals("salary of O'Brien and D'Arcy in 'Sales'")
+    assert [literal["value"] for literal in literals] == ["O'Brien", "D'Arcy", "Sales"]
+
+
+def test_template_rebinds_names_with_apostrophes(store):
+    sql = "SELECT AVG(salary) FROM employees WHERE department = 'O''Brien'"
+    assert store.learn("db", "fp", "average salary in O'Brien", sql)
+    found, skeleton = store.find("db", "fp", "average salary in D'Arcy", quote)
+    assert found == "SELECT AVG(salary) FROM employees WHERE department = 'D''Arcy'"
+    assert skeleton == "average salary in __p0__"
+
+
+def test_known_shape_is_not_learned_twice(store):
+    sql = "SELECT AVG(salary) FROM employees WHERE department = 'Sales'"
+    assert store.learn("db", "fp", "average salary in Sales", sql)
+    assert not store.learn("db", "fp", "average salary in Sales", sql)
+    stats = store.stats()
+    assert stats["learned"] == 1
+    assert stats["templates"] == 1
+
+
+def test_template_needs_every_literal_in_the_sql(store):
+    assert not store.learn("db", "fp", "average salary in Sales", "SELECT AVG(salary) FROM employees")
+    assert store.find("db", "fp", "average salary in Research", quote) is None
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.config import settings
+from backend.main import app
+
+EMPLOYEES = [(1, "Ada", "Engineering", 120000.0), (2, "Grace", "Research", 115000.0), (3, "Linus", "Platform", 99000.0)]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / "company.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, department TEXT, salary REAL)")
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?)", EMPLOYEES)
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{path}")
+    return path
+
+
+@pytest.fixture
+def client(database):
+    with TestClient(app) as client:
+        yield client
+
+
+def table(database, name):
+    conn = sqlite3.connect(database)
+    try:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({name})")]
+        rows = conn.execute(f"SELECT * FROM {name} ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    return columns, rows
+
+
+def upload(client, route, filename, content, **form):
+    return client.post(route, files=[("files", (filename, content, "text/csv"))], data=form).json()
+
+
+def test_document_upload_keeps_existing_table(client, database):
+    response = upload(client, "/api/ingest/documents", "employees.csv", b"id,name\n7,Mallory\n8,Trent\n")
+    [report] = response["tables"]["files"]
+    assert "already exists" in report["error"]
+    assert table(database, "employees") == (["id", "name", "department", "salary"], EMPLOYEES)
+
+
+def test_document_upload_creates_new_table(client, database):
+    response = upload(client, "/api/ingest/documents", "departments.csv", b"id,name\n1,Engineering\n2,Research\n")
+    [report] = response["tables"]["files"]
+    assert report["rows"] == 2
+    assert table(database, "departments") == (["id", "name"], [(1, "Engineering"), (2, "Research")])
+    assert table(database, "employees")[1] == EMPLOYEES
+
+
+def test_table_upload_refuses_existing_table_by_default(client, database):
+    [report] = upload(client, "/api/ingest/tables", "employees.csv", b"id,name\n7,Mallory\n")["files"]
+    assert "already exists" in report["error"]
+    assert table(database, "employees")[1] == EMPLOYEES
+
+
+def test_table_upload_replaces_only_when_asked(client, database):
+    [report] = upload(client, "/api/ingest/tables", "employees.csv", b"id,name\n7,Mallory\n", mode="replace")["files"]
+    assert report["rows"] == 1
+    assert table(database, "employees") == (["id", "name"], [(7, "Mallory")])
+
+
+def test_later_chunk_widens_column_types(database):
+    from backend.services.table_ingestion import ingest_table_file
+
+    path = database.parent / "readings.csv"
+    path.write_text("id,value,note\n1,2,3\n2,4,5\n3,4.5,pending\n")
+    report = ingest_table_file(settings.DATABASE_URL, str(path), "readings.csv", mode="create", chunk_rows=2)
+    assert report["rows"] == 3
+    assert report["columns"] == {"id": "integer", "value": "float", "note": "text"}
+    assert table(database, "readings")[1] == [(1, 2.0, "3"), (2, 4.0, "5"), (3, 4.5, "pending")]
+
+
+def test_failed_replace_keeps_existing_table(database):
+    from sqlalchemy.exc import IntegrityError
+
+    from backend.services.table_ingestion import ingest_table_file
+
+    path = database.parent / "employees.csv"
+    path.write_text("id,name\n7,Mallory\n7,Trent\n")
+    with pytest.raises(IntegrityError):
+        ingest_table_file(settings.DATABASE_URL, str(path), "employees.csv", mode="replace", key_columns=["id"],
+                          chunk_rows=1)
+    assert table(database, "employees") == (["id", "name", "department", "salary"], EMPLOYEES)
+    conn = sqlite3.connect(database)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    conn.close()
+    assert tables == ["employees"]
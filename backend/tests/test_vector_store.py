@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from backend.services.vector_store import QuantizedVectorStore
+
+DIM = 32
+
+
+def clustered(count, seed=0, clusters=16):
+    """Unit vectors around a few centers, like embeddings of a corpus with topics."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.3 * rng.standard_normal((count, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top(vectors, query, k):
+    return list(np.argsort(-(vectors @ query))[:k])
+
+
+def fill(store, vectors, start=0):
+    ids = [f"c{i}" for i in range(start, start + len(vectors))]
+    store.upsert(ids=ids, embeddings=vectors, documents=[f"chunk {i}" for i in range(start, start + len(vectors))],
+                 metadatas=[{"source": "a.txt" if i % 2 else "b.txt", "ingested_at": i}
+                            for i in range(start, start + len(vectors))])
+    return ids
+
+
+def recall(store, vectors, queries, k=10, where=None, allowed=None):
+    found = 0
+    for query in queries:
+        hits = store.query(query_embeddings=[query], n_results=k, where=where)["ids"][0]
+        candidates = vectors if allowed is None else vectors[allowed]
+        truth = exact_top(candidates, query, k)
+        if allowed is not None:
+            truth = [allowed[i] for i in truth]
+        found += len({f"c{i}" for i in truth} & set(hits))
+    return found / (k * len(queries))
+
+
+@pytest.fixture
+def vectors():
+    return clustered(2000)
+
+
+@pytest.fixture
+def queries():
+    return clustered(20, seed=1)
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_reranked_results_match_exact_search(tmp_path, vectors, queries, dtype):
+    store = QuantizedVectorStore(str(tmp_path), dtype=dtype, rerank_candidates=50, ivf_lists=0)
+    fill(store, vectors)
+    assert recall(store, vectors, queries) >= 0.99
+    result = store.query(query_embeddings=[queries[0]], n_results=5)
+    assert result["distances"][0] == sorted(result["distances"][0])
+    best = exact_top(vectors, queries[0], 1)[0]
+    assert result["ids"][0][0] == f"c{best}"
+    assert result["distances"][0][0] == pytest.approx(1 - float(vectors[best] @ queries[0]), abs=1e-5)
+
+
+def test_partitions_are_built_at_the_threshold(tmp_path, vectors, queries):
+    store = QuantizedVectorStore(str(tmp_path), ivf_lists=16, ivf_probes=4, ivf_min_vectors=1500)
+    fill(store, vectors[:1000])
+    assert store.stats()["partitions"] == 0
+    fill(store, vectors[1000:], start=1000)
+    assert store.stats()["partitions"] == 16
+    assert recall(store, vectors, queries) >= 0.9
+    # Probing every partition is a full scan
+    store.ivf_probes = 16
+    assert recall(store, vectors, queries) >= 0.99
+
+
+def test_where_filters(tmp_path, vectors, queries):
+    store = QuantizedVectorStore(str(tmp_path), ivf_lists=0)
+    fill(store, vectors)
+    odd = list(range(1, len(vectors), 2))
+    result = store.query(query_embeddings=[queries[0]], n_results=10, where={"source": "a.txt"})
+    assert all(metadata["source"] == "a.txt" for metadata in result["metadatas"][0])
+    assert recall(store, vectors, queries, where={"source": "a.txt"}, allowed=odd) >= 0.99
+
+    recent = store.get(where={"$and": [{"source": {"$in": ["b.txt"]}}, {"ingested_at": {"$gte": 1990}}]})
+    assert recent["ids"] == ["c1990", "c1992", "c1994", "c1996", "c1998"]
+    assert recent["documents"][0] == "chunk 1990"
+
+
+def test_deleted_chunks_are_gone_and_their_rows_reused(tmp_path, vectors, queries):
+    store = QuantizedVectorStore(str(tmp_path), ivf_lists=0)
+    fill(store, vectors[:100])
+    best = f"c{exact_top(vectors[:100], queries[0], 1)[0]}"
+    store.delete(ids=[best, "c0"])
+    assert store.count() == 98
+    assert store.get(ids=[best, "c0", "c1"], include=[])["ids"] == ["c1"]
+    assert best not in store.query(query_embeddings=[queries[0]], n_results=10)["ids"][0]
+
+    store.delete(where={"source": "b.txt"})
+    left = store.get(include=["metadatas"])
+    assert store.count() == len(left["ids"]) == len({f"c{i}" for i in range(1, 100, 2)} - {best})
+    assert {metadata["source"] for metadata in left["metadatas"]} == {"a.txt"}
+    rows = store.stats()["rows"]
+    fill(store, vectors[100:110], start=100)
+    assert store.stats()["rows"] == rows
+
+
+def test_reopened_store_reads_the_same_vectors(tmp_path, vectors, queries):
+    store = QuantizedVectorStore(str(tmp_path), ivf_lists=16, ivf_probes=4, ivf_min_vectors=1000)
+    fill(store, vectors)
+    store.delete(ids=["c5"])
+    before = store.query(query_embeddings=list(queries[:5]), n_results=10)
+
+    # The stored dtype wins over the configured one
+    reopened = QuantizedVectorStore(str(tmp_path), dtype="float16", ivf_lists=16, ivf_probes=4, ivf_min_vectors=1000)
+    assert reopened.dtype == "int8"
+    assert reopened.count() == len(vectors) - 1
+    assert reopened.stats()["partitions"] == 16
+    after = reopened.query(query_embeddings=list(queries[:5]), n_results=10)
+    assert after["ids"] == before["ids"]
+    assert np.allclose(after["distances"], before["distances"])
+
+
+def test_writes_of_one_handle_are_seen_by_another(tmp_path):
+    vectors = clustered(5000)
+    writer = QuantizedVectorStore(str(tmp_path), ivf_lists=0)
+    fill(writer, vectors[:10])
+    reader = QuantizedVectorStore(str(tmp_path), ivf_lists=0)
+    # Past the initial capacity, so the reader has to map the grown files
+    fill(writer, vectors[10:], start=10)
+    hits = reader.query(query_embeddings=[vectors[4500]], n_results=1)
+    assert hits["ids"] == [["c4500"]]
+    assert reader.count() == 5000
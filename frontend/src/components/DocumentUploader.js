@@ -1,8 +1,31 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 
 function DocumentUploader({ setIngestionJob }) {
   const [files, setFiles] = useState([]);
   const [status, setStatus] = useState('');
+  const [jobId, setJobId] = useState(null);
+  const [progress, setProgress] = useState(null);
+  const [tables, setTables] = useState(null);
+
+  // Poll the background ingestion job until it reaches a final state
+  useEffect(() => {
+    if (!jobId) {
+      return undefined;
+    }
+    const timer = setInterval(async () => {
+      try {
+        const response = await fetch(`/api/ingest/status/${jobId}`);
+        const data = await response.json();
+        setProgress(data);
+        if (data.error || data.status !== 'processing') {
+          clearInterval(timer);
+        }
+      } catch (err) {
+        clearInterval(timer);
+      }
+    }, 1000);
+    return () => clearInterval(timer);
+  }, [jobId]);
 
   const handleFileChange = (e) => {
     setFiles(e.target.files);
@@ -30,10 +53,17 @@ function DocumentUploader({ setIngestionJob }) {
 
       const data = await response.json();
 
-      if (response.ok) {
-        setStatus(`Upload successful. Job ID: ${data.job_id}`);
-        setIngestionJob(data.job_id);
-        // In a real app, you would now poll the /api/ingest/status/{data.job_id} endpoint.
+      if (response.ok && !data.error) {
+        // CSV/TSV files are loaded into the database right away; other files go to a background job
+        setTables(data.tables || null);
+        setProgress(null);
+        if (data.job_id) {
+          setStatus(`Upload successful. Job ID: ${data.job_id}`);
+          setIngestionJob(data.job_id);
+          setJobId(data.job_id);
+        } else {
+          setStatus('Upload successful.');
+        }
       } else {
         setStatus(`Upload failed: ${data.error || 'Unknown error'}`);
       }
@@ -50,6 +80,39 @@ function DocumentUploader({ setIngestionJob }) {
         <button type="submit">Upload</button>
       </form>
       {status && <div className="status">{status}</div>}
+      {tables && (
+        <div className="status">
+          <p>Tables: {tables.rows} rows loaded ({tables.rows_per_second} rows/s)</p>
+          <ul>
+            {tables.files.map((file, index) => (
+              <li key={index}>
+                {file.file} → {file.table}:{' '}
+                {file.error
+                  ? <span className="error">{file.error}</span>
+                  : `${file.rows} rows, ${file.rows_per_second} rows/s`}
+              </li>
+            ))}
+          </ul>
+        </div>
+      )}
+      {progress && !progress.error && (
+        <div className="status">
+          <p>
+            Job {progress.status}: {progress.processed_files}/{progress.total_files} files,
+            {' '}{progress.chunks_indexed}/{progress.chunks_total} chunks
+            {progress.chunks_per_second !== null && ` (${progress.chunks_per_second} chunks/s)`}
+          </p>
+          <ul>
+            {progress.files.map((file, index) => (
+              <li key={index}>
+                {file.filename}: {file.status}
+                {file.chunks_total !== null && ` (${file.chunks_indexed}/${file.chunks_total} chunks)`}
+                {file.error && <span className="error"> {file.error}</span>}
+              </li>
+            ))}
+          </ul>
+        </div>
+      )}
     </div>
   );
 }
@@ -1,6 +1,78 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+import { Bar } from 'react-chartjs-2';
+import {
+  Chart as ChartJS,
+  CategoryScale,
+  LinearScale,
+  BarElement,
+  Title,
+  Tooltip,
+  Legend,
+} from 'chart.js';
+
+ChartJS.register(
+  CategoryScale,
+  LinearScale,
+  BarElement,
+  Title,
+  Tooltip,
+  Legend
+);
+
+const POLL_INTERVAL_MS = 5000;
+
+function formatMs(value) {
+  return value == null ? '-' : `${Math.round(value)} ms`;
+}
 
 function MetricsDashboard({ schema, ingestionJob, queryResult }) {
+  const [metrics, setMetrics] = useState(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    const load = async () => {
+      try {
+        const response = await fetch('/api/metrics');
+        const data = await response.json();
+        if (!cancelled) {
+          setMetrics(data);
+        }
+      } catch (err) {
+        console.error("Failed to load metrics:", err);
+      }
+    };
+    load();
+    const timer = setInterval(load, POLL_INTERVAL_MS);
+    return () => {
+      cancelled = true;
+      clearInterval(timer);
+    };
+  }, []);
+
+  const stages = metrics ? Object.entries(metrics.stages_ms) : [];
+  const stageChart = {
+    labels: stages.map(([stage]) => stage),
+    datasets: [
+      {
+        label: 'p50 (ms)',
+        data: stages.map(([, stats]) => stats.p50),
+        backgroundColor: 'rgba(0, 123, 255, 0.5)',
+      },
+      {
+        label: 'p95 (ms)',
+        data: stages.map(([, stats]) => stats.p95),
+        backgroundColor: 'rgba(255, 99, 132, 0.5)',
+      },
+    ],
+  };
+  const stageOptions = {
+    responsive: true,
+    plugins: {
+      legend: { position: 'top' },
+      title: { display: true, text: 'Stage latency' },
+    },
+  };
+
   return (
     <div className="component">
       <h2>Metrics Dashboard</h2>
@@ -11,8 +83,31 @@ function MetricsDashboard({ schema, ingestionJob, queryResult }) {
       {queryResult && queryResult.cache_hit !== undefined && (
         <p>Last Query Cache: {queryResult.cache_hit ? 'Hit' : 'Miss'}</p>
       )}
+      {metrics && (
+        <div>
+          <p>
+            Queries: {metrics.queries.total} · Cache hit rate: {metrics.queries.cache_hit_rate == null
+              ? '-' : `${Math.round(metrics.queries.cache_hit_rate * 100)}%`}
+          </p>
+          {Object.entries(metrics.queries.latency_ms).map(([label, stats]) => (
+            <p key={label}>
+              {label}: p50 {formatMs(stats.p50)} · p95 {formatMs(stats.p95)} ({stats.count})
+            </p>
+          ))}
+          <p>
+            LLM tokens: {metrics.llm_tokens.prompt || 0} in / {metrics.llm_tokens.output || 0} out ·
+            LLM latency: p50 {formatMs(metrics.llm.latency_ms_p50)} · p95 {formatMs(metrics.llm.latency_ms_p95)}
+          </p>
+          <p>
+            Chunks indexed: {metrics.ingestion.chunks_indexed}
+            {metrics.ingestion.chunks_per_second != null && ` (${metrics.ingestion.chunks_per_second}/s)`} ·
+            Table rows loaded: {metrics.ingestion.table_rows_loaded}
+          </p>
+          {stages.length > 0 && <Bar options={stageOptions} data={stageChart} />}
+        </div>
+      )}
     </div>
   );
 }
 
-export default MetricsDashboard;
\ No newline at end of file
+export default MetricsDashboard;
@@ -3,6 +3,24 @@ import React, { useState } from 'react';
 function QueryPanel({ query, setQuery, setQueryResult }) {
   const [error, setError] = useState(null);
 
+  // Suggestions are generated after the answer and fetched separately, so they
+  // never hold up the results
+  const fetchSuggestions = async (data) => {
+    if (!data.result || data.result.error) {
+      return;
+    }
+    try {
+      const response = await fetch(`/api/query/suggestions?query=${encodeURIComponent(query)}`);
+      const { suggestions } = await response.json();
+      if (suggestions && suggestions.length > 0) {
+        // Only attach them if the user hasn't run another query in the meantime
+        setQueryResult(current => (current === data ? { ...data, suggestions } : current));
+      }
+    } catch (err) {
+      console.error("Failed to fetch suggestions:", err);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setError(null);
@@ -14,13 +32,14 @@ function QueryPanel({ query, setQuery, setQueryResult }) {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ query }),
+        body: JSON.stringify({ query, format: 'columnar', timings: true }),
       });
 
       const data = await response.json();
 
       if (response.ok) {
         setQueryResult(data);
+        fetchSuggestions(data);
       } else {
         setError(data.error || 'An error occurred.');
       }
@@ -1,4 +1,4 @@
-import React, { useMemo, useEffect } from 'react';
+import React, { useMemo, useEffect, useState } from 'react';
 import { useTable } from 'react-table';
 import './ResultsView.css';
 import ResultChart from './ResultChart'; // Import the new chart component
@@ -11,23 +11,73 @@ function ResultsView({ queryResult, setQuery }) {
   }, [queryResult]);
 
   const { result, query_type, suggestions } = queryResult || {};
+  // Hybrid answers carry a SQL part (possibly failed) and document matches
+  const hasTable = query_type === 'sql' || query_type === 'hybrid';
 
-  const columns = useMemo(() => {
-    if (query_type !== 'sql' || !result || !result.results || !Array.isArray(result.results) || result.results.length === 0) {
+  // Further pages of a truncated SQL result, fetched with the continuation token
+  const [moreRows, setMoreRows] = useState([]);
+  const [nextToken, setNextToken] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  useEffect(() => {
+    setMoreRows([]);
+    setNextToken(result && result.next_token ? result.next_token : null);
+  }, [result]);
+
+  // SQL results arrive columnar (column names once, rows as arrays)
+  const columnNames = useMemo(() => {
+    if (!hasTable || !result) {
       return [];
     }
-    return Object.keys(result.results[0]).map(key => ({
-      Header: key.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase()),
-      accessor: key,
-    }));
-  }, [query_type, result]);
+    if (Array.isArray(result.columns)) {
+      return result.columns;
+    }
+    if (Array.isArray(result.results) && result.results.length > 0) {
+      return Object.keys(result.results[0]);
+    }
+    return [];
+  }, [hasTable, result]);
+
+  const columns = useMemo(() => columnNames.map(key => ({
+    Header: key.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase()),
+    accessor: key,
+  })), [columnNames]);
 
   const data = useMemo(() => {
-    if (query_type !== 'sql' || !result || !result.results || !Array.isArray(result.results)) {
+    if (!hasTable || !result) {
       return [];
     }
-    return result.results;
-  }, [query_type, result]);
+    const toObjects = rows => rows.map(row => Object.fromEntries(columnNames.map((name, i) => [name, row[i]])));
+    if (Array.isArray(result.rows)) {
+      return toObjects(result.rows.concat(moreRows));
+    }
+    return Array.isArray(result.results) ? result.results : [];
+  }, [hasTable, result, columnNames, moreRows]);
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await fetch('/api/query/page', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ token: nextToken, format: 'columnar' }),
+      });
+      const page = await response.json();
+      if (page.error) {
+        console.error("Failed to load more rows:", page.error);
+        setNextToken(null);
+      } else {
+        setMoreRows(previous => previous.concat(page.rows));
+        setNextToken(page.next_token);
+      }
+    } catch (err) {
+      console.error("Failed to load more rows:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const tableInstance = useTable({ columns, data });
   const {
@@ -40,7 +90,7 @@ function ResultsView({ queryResult, setQuery }) {
 
   // Logic to determine if data is chartable and prepare chart data
   const chartData = useMemo(() => {
-    if (query_type === 'sql' && data.length > 0 && columns.length === 2) {
+    if (hasTable && data.length > 0 && columns.length === 2) {
       const [labelCol, valueCol] = columns;
       // Check if the value column contains numeric data
       const isNumeric = data.every(row => typeof row[valueCol.accessor] === 'number');
@@ -55,7 +105,7 @@ function ResultsView({ queryResult, setQuery }) {
       }
     }
     return null;
-  }, [query_type, data, columns]);
+  }, [hasTable, data, columns]);
 
   if (!queryResult) {
     return (
@@ -76,75 +126,110 @@ function ResultsView({ queryResult, setQuery }) {
   }
 
   const renderSqlResults = () => {
-    if (!Array.isArray(result.results)) {
+    if (!Array.isArray(result.rows) && !Array.isArray(result.results)) {
       return <p><i>{result.results || "No results found."}</i></p>;
     }
-    if (result.results.length === 0) {
+    if (data.length === 0) {
       return <p>Query returned no results.</p>;
     }
     return (
-      <table {...getTableProps()}>
-        <thead>
-          {headerGroups.map(headerGroup => (
-            <tr {...headerGroup.getHeaderGroupProps()}>
-              {headerGroup.headers.map(column => (
-                <th {...column.getHeaderProps()}>{column.render('Header')}</th>
-              ))}
-            </tr>
-          ))}
-        </thead>
-        <tbody {...getTableBodyProps()}>
-          {rows.map(row => {
-            prepareRow(row);
-            return (
-              <tr {...row.getRowProps()}>
-                {row.cells.map(cell => (
-                  <td {...cell.getCellProps()}>{cell.render('Cell')}</td>
+      <div>
+        <table {...getTableProps()}>
+          <thead>
+            {headerGroups.map(headerGroup => (
+              <tr {...headerGroup.getHeaderGroupProps()}>
+                {headerGroup.headers.map(column => (
+                  <th {...column.getHeaderProps()}>{column.render('Header')}</th>
                 ))}
               </tr>
-            );
-          })}
-        </tbody>
-      </table>
+            ))}
+          </thead>
+          <tbody {...getTableBodyProps()}>
+            {rows.map(row => {
+              prepareRow(row);
+              return (
+                <tr {...row.getRowProps()}>
+                  {row.cells.map(cell => (
+                    <td {...cell.getCellProps()}>{cell.render('Cell')}</td>
+                  ))}
+                </tr>
+              );
+            })}
+          </tbody>
+        </table>
+        {nextToken && (
+          <div className="load-more">
+            <span>Showing the first {data.length} rows.</span>
+            <button onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
+      </div>
     );
   };
 
+  const renderDocumentResults = (matches) => (
+    <div className="document-results">
+      <h4>Document Matches:</h4>
+      {matches.length > 0 ? (
+        <ul>
+          {matches.map((item, index) => (
+            <li key={index} className="document-card">
+              <strong>{item.document_name}</strong>{' '}
+              {item.similarity != null ? `(Similarity: ${item.similarity.toFixed(4)})` : '(Keyword match)'}
+              <p>{item.chunk_text}</p>
+            </li>
+          ))}
+        </ul>
+      ) : (
+        <p>No matching documents found.</p>
+      )}
+    </div>
+  );
+
   return (
     <div className="component">
       <h2>Results View</h2>
       {queryResult.cache_hit !== undefined && (
         <p className="cache-status">Cache Status: {queryResult.cache_hit ? 'Hit' : 'Miss'}</p>
       )}
+      {queryResult.timings && (
+        <p className="generation-stats">
+          Timings: {Object.entries(queryResult.timings)
+            .map(([stage, ms]) => `${stage} ${Math.round(ms * 10) / 10} ms`)
+            .join(' · ')}
+        </p>
+      )}
       {result && (
         <div>
           <h3>Query Type: {query_type}</h3>
-          {query_type === 'sql' && result.generated_sql && (
+          {hasTable && result.generated_sql && (
             <div className="sql-query-box">
               <h4>Generated SQL:</h4>
               <pre>{result.generated_sql}</pre>
+              {result.generation && result.generation.template && (
+                <p className="generation-stats">Answered from a saved query template, no LLM call</p>
+              )}
+              {result.generation && !result.generation.template && (
+                <p className="generation-stats">
+                  Prompt: {result.generation.prompt_tokens} tokens · Generation: {Math.round(result.generation.latency_ms)} ms · Schema: {result.generation.schema_tables} of {result.generation.schema_tables_total} tables
+                </p>
+              )}
+              {result.guard && result.guard.rewrites.length > 0 && (
+                <p className="generation-stats">Adjusted: {result.guard.rewrites.join('; ')}</p>
+              )}
             </div>
           )}
           {/* Render Chart if data is suitable */}
           {chartData && <ResultChart chartData={chartData} />}
           
-          {query_type === 'sql' && result.results && renderSqlResults()}
-          {query_type === 'document' && result.results && (
-            <div className="document-results">
-              <h4>Document Matches:</h4>
-              {result.results.length > 0 ? (
-                <ul>
-                  {result.results.map((item, index) => (
-                    <li key={index} className="document-card">
-                      <strong>{item.document_name}</strong> (Similarity: {item.similarity.toFixed(4)})
-                      <p>{item.chunk_text}</p>
-                    </li>
-                  ))}
-                </ul>
-              ) : (
-                <p>No matching documents found.</p>
-              )}
-            </div>
+          {hasTable && (result.rows || result.results) && renderSqlResults()}
+          {query_type === 'hybrid' && result.sql_error && (
+            <div className="error">Database part failed: {result.sql_error}</div>
           )}
+          {query_type === 'document' && result.results && renderDocumentResults(result.results)}
+          {query_type === 'hybrid' && result.documents && renderDocumentResults(result.documents)}
         </div>
       )}
       {/* Render Follow-up Suggestions */}